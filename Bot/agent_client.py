@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", 20))
+AGENT_RETRIES = int(os.getenv("AGENT_RETRIES", 2))
+AGENT_BACKOFF = float(os.getenv("AGENT_BACKOFF", 0.2))
+AGENT_CONNECT_TIMEOUT = float(os.getenv("AGENT_CONNECT_TIMEOUT", 3))
+
+# Read timeout of each endpoint, matched by path prefix. Starting and stopping a session talk to
+# Alpaca and may wait for a session worker; checking a ticker may fall back to Yahoo Finance.
+READ_TIMEOUTS = {
+    "/checkcredentials/": 5,
+    "/check_ticker/": 15,
+    "/verifyandstorecredentials/": 15,
+    "/store_and_start_new_session/": 30,
+    "/stop_session/": 30,
+}
+DEFAULT_READ_TIMEOUT = 10
+
+# Endpoints that may be called again when the agent failed to answer. The others are only
+# retried when the connection could not be opened, i.e. when the request was never sent.
+IDEMPOTENT = ("/checkcredentials/", "/check_ticker/", "/verifyandstorecredentials/")
+RETRY_STATUSES = (502, 503, 504)
+
+
+def read_timeout(path):
+    prefix = max((prefix for prefix in READ_TIMEOUTS if path.startswith(prefix)), key=len, default=None)
+    return READ_TIMEOUTS[prefix] if prefix else DEFAULT_READ_TIMEOUT
+
+
+def is_idempotent(path):
+    return path.startswith(IDEMPOTENT)
+
+
+class AgentClient:
+    """
+    Shared HTTP client for the trader agent API.
+
+    Requests go through one pooled session, so connections to the agent are kept alive and
+    reused across handlers and threads. Every call has a timeout, so a hung agent request fails
+    instead of freezing the handler waiting for it. Failed connections are retried for every
+    endpoint; timeouts and gateway errors only for the endpoints listed in IDEMPOTENT.
+
+    Each call has a single retry layer, so the worst case is `retries` + 1 attempts: urllib3
+    retries the connections of the other endpoints, and `request` retries the idempotent ones.
+
+    Attributes:
+        base_url (str): Base URL of the agent API.
+        retries (int): Number of retries after a failed attempt.
+        backoff (float): Delay before the first retry, doubled on every further one.
+    """
+    def __init__(self, base_url, pool_size=AGENT_POOL_SIZE, retries=AGENT_RETRIES, backoff=AGENT_BACKOFF):
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                                                backoff_factor=backoff))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Retried by `request` only, whatever failed.
+        idempotent = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        for prefix in IDEMPOTENT:
+            self.session.mount(f"{base_url}{prefix}", idempotent)
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, payload):
+        return self.request("POST", path, json=payload)
+
+    def request(self, method, path, **kwargs):
+        """
+        Calls an endpoint of the agent.
+
+        Returns:
+            requests.Response: The agent's response.
+
+        Raises:
+            requests.RequestException: If the agent could not be reached or did not answer in time.
+        """
+        attempts = self.retries + 1 if is_idempotent(path) else 1
+        for attempt in range(attempts):
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}",
+                                                timeout=(AGENT_CONNECT_TIMEOUT, read_timeout(path)), **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt + 1 == attempts:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncAgentClient:
+    """
+    Asyncio counterpart of AgentClient, with the same timeouts and retry rules.
+
+    Calls made from different tasks run concurrently over a shared connection pool. Retries
+    are made by `request` only, so each call has a single retry layer here too. The Bot's
+    handlers run on threads and use AgentClient; this client is for callers on an event loop.
+
+    Attributes:
+        base_url (str): Base URL of the agent API.
+        retries (int): Number of retries after a failed attempt.
+        backoff (float): Delay before the first retry, doubled on every further one.
+    """
+    def __init__(self, base_url, pool_size=AGENT_POOL_SIZE, retries=AGENT_RETRIES, backoff=AGENT_BACKOFF):
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(base_url=base_url,
+                                        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+    async def get(self, path):
+        return await self.request("GET", path)
+
+    async def post(self, path, payload):
+        return await self.request("POST", path, json=payload)
+
+    async def request(self, method, path, **kwargs):
+        """
+        Calls an endpoint of the agent.
+
+        Returns:
+            httpx.Response: The agent's response.
+
+        Raises:
+            httpx.HTTPError: If the agent could not be reached or did not answer in time.
+        """
+        idempotent = is_idempotent(path)
+        # Failed connections are retried for every endpoint, the request was never sent.
+        retried = (httpx.TransportError,) if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        timeout = httpx.Timeout(read_timeout(path), connect=AGENT_CONNECT_TIMEOUT)
+        attempts = self.retries + 1
+        for attempt in range(attempts):
+            try:
+                response = await self.client.request(method, path, timeout=timeout, **kwargs)
+                if not idempotent or response.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                    return response
+            except retried:
+                if attempt + 1 == attempts:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def aclose(self):
+        await self.client.aclose()
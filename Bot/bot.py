@@ -1,16 +1,31 @@
+import functools
 import telebot
 import time
 import os
 import threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import redis
 import requests
+from agent_client import AgentClient
+from session_cache import SessionCache
+from webhook import ChatOrderedPool, WebhookServer
 
 load_dotenv("./../.env")
 
-bot = telebot.TeleBot(os.getenv("TELEGRAM_BOT_TOKEN"))
+# Handlers run on a pool of threads, so one slow agent call does not hold back the other users.
+BOT_THREADS = int(os.getenv("BOT_THREADS", 8))
+bot = telebot.TeleBot(os.getenv("TELEGRAM_BOT_TOKEN"), num_threads=BOT_THREADS)
 BASE_URL_API = os.getenv("BASE_URL_API")
-LIST_TRADERS = []   
+# "polling" or "webhook". In webhook mode, WEBHOOK_URL is the public URL Telegram posts updates to;
+# leave it empty to only serve the local endpoint, e.g. for a test harness.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+agent = AgentClient(BASE_URL_API)
+# The agent announces session changes on Redis, which keeps SESSIONS up to date.
+redis_client = redis.StrictRedis(host="redis", port=6379, decode_responses=True)
+TRADERS = {}
+AGENT_ERROR_MESSAGE = "There was an error processing your request. Please try again."
 
 class BotParameters:
     """
@@ -49,6 +64,19 @@ class BotParameters:
 
 
 
+def answers_agent_errors(handler):
+    """
+    Answers the user with the usual error message when the handler could not reach the agent,
+    instead of leaving them without a reply.
+    """
+    @functools.wraps(handler)
+    def wrapper(message, *args):
+        try:
+            return handler(message, *args)
+        except requests.RequestException:
+            bot.send_message(message.chat.id, AGENT_ERROR_MESSAGE)
+    return wrapper
+
 def ask_for_api_key(message):
     """
     Prompts the user to enter their API key by sending a message.
@@ -91,9 +119,18 @@ def process_api_secret_step(message, api_key):
     api_secret = message.text
     bot.send_message(chat_id, "Thank you! Your API credentials have been received.")
 
-    if verify_credentials(api_key, api_secret, chat_id):
+    try:
+        verified = verify_credentials(api_key, api_secret, chat_id)
+    except requests.RequestException:
+        # The agent may still have stored the credentials, e.g. when it answered too late.
+        SESSIONS.invalidate(chat_id)
+        msg = bot.send_message(chat_id, AGENT_ERROR_MESSAGE)
+        bot.register_next_step_handler(msg, process_api_secret_step, api_key)
+        return
+    if verified:
+        SESSIONS.invalidate(chat_id)
         trader = BotParameters(chat_id, api_key, api_secret)
-        LIST_TRADERS.append(trader)
+        TRADERS[chat_id] = trader
         bot.send_message(chat_id, "Credentials verified! To start your trading agent, please type /start 🚀")
     else:
         bot.send_message(chat_id, "Wrong credentials ❌\nPlease initiate the setup again with /init.")
@@ -111,13 +148,34 @@ def verify_credentials(api_key, api_secret, chat_id):
 
     Returns:
         bool: True if the credentials are successfully verified, False otherwise.
+
+    Raises:
+        requests.RequestException: If the agent could not be reached or did not answer in time.
     """
-    response = requests.post(f"{BASE_URL_API}/verifyandstorecredentials/", json={"chat_id": str(chat_id), 'api_key': api_key, 'api_secret': api_secret})
+    response = agent.post("/verifyandstorecredentials/", {"chat_id": str(chat_id), 'api_key': api_key, 'api_secret': api_secret})
     if response.status_code == 200:
         response_body = response.json()
         return response_body.get('status') == 200
     return False
 
+def fetch_session(chat_id):
+    """
+    Fetches the agent's view of a user, for the session cache.
+
+    Parameters:
+        chat_id (int): The Telegram chat ID of the user.
+
+    Returns:
+        dict: The stored credentials and session details of the user, or None if the agent has no credentials for them.
+
+    Raises:
+        requests.RequestException: If the agent could not be reached or did not answer in time.
+    """
+    already_exists, response_body = check_user_credentials(chat_id)
+    return response_body if already_exists else None
+
+SESSIONS = SessionCache(fetch_session)
+
 def check_user_credentials(chat_id):
     """
     Checks the stored credentials for a given user by making a GET request to a specific endpoint.
@@ -129,10 +187,11 @@ def check_user_credentials(chat_id):
 
     Returns:
         tuple: A tuple containing a boolean value and the response body. The boolean value is True if the credentials are found and valid, and False otherwise. The response body is a dictionary containing the server's response.
+
+    Raises:
+        requests.RequestException: If the agent could not be reached or did not answer in time.
     """
-    url = f"{BASE_URL_API}/checkcredentials/{chat_id}"
-    
-    response = requests.get(url)
+    response = agent.get(f"/checkcredentials/{chat_id}")
     response_body = response.json()
     
     if response_body['status'] == 200:
@@ -153,14 +212,14 @@ def ask_for_ticker(message,trader):
     Returns:
         None
     """
-    msg = bot.reply_to(message, "Please enter a ticker symbol (e.g., AAPL, GOOG):")
+    msg = bot.reply_to(message, "Please enter a ticker symbol (e.g., AAPL), or several separated by commas to trade them together (e.g., AAPL, GOOG):")
     bot.register_next_step_handler(msg, process_ticker_step, trader)
 
 def process_ticker_step(message, trader):
     """
     Processes the ticker symbol provided by the user, validating its format and existence.
 
-    This function is triggered after a user responds with a ticker symbol. It validates the ticker by ensuring it is alphabetical and does not exceed five characters. If the ticker is invalid, the user is prompted to enter a valid ticker symbol again. If the ticker is valid, a request is made to an external API to further validate the ticker. If the ticker exists and is valid, the user is asked to enter the end time for the trading session. Otherwise, the user is informed of the error and asked to try again.
+    This function is triggered after a user responds with a ticker symbol, or with several separated by commas to trade a basket in one session. It validates each ticker by ensuring it is alphabetical and does not exceed five characters. If the ticker is invalid, the user is prompted to enter a valid ticker symbol again. If the ticker is valid, a request is made to an external API to further validate the ticker. If the ticker exists and is valid, the user is asked to enter the end time for the trading session. Otherwise, the user is informed of the error and asked to try again.
 
     Parameters:
         message (telebot.types.Message): The Telegram message object containing the user's ticker input.
@@ -170,22 +229,26 @@ def process_ticker_step(message, trader):
         None
     """
     chat_id = message.chat.id
-    ticker = message.text.upper()
+    symbols = [symbol.strip() for symbol in message.text.upper().split(",")]
+    ticker = ",".join(symbols)
 
-    if not ticker.isalpha() or len(ticker) > 5:
+    if not all(symbol.isalpha() and len(symbol) <= 5 for symbol in symbols):
         msg = bot.reply_to(message, "Invalid ticker symbol. Please enter a valid ticker (e.g., AAPL, GOOG):")
         bot.register_next_step_handler(msg, process_ticker_step,trader)
         return
     
-    response = requests.post(f"{BASE_URL_API}/check_ticker/", json={"ticker": ticker})
-    if response.status_code == 200:
+    try:
+        response = agent.post("/check_ticker/", {"ticker": ticker})
+    except requests.RequestException:
+        response = None
+    if response is not None and response.status_code == 200:
         response_body = response.json()
         if response_body.get('status') != 200:
             msg = bot.reply_to(message, "Ticker not found or is invalid. Please enter a valid ticker:")
             bot.register_next_step_handler(msg, process_ticker_step, trader)
             return
     else:
-        msg = bot.reply_to(message, "There was an error processing your request. Please try again.")
+        msg = bot.reply_to(message, AGENT_ERROR_MESSAGE)
         bot.register_next_step_handler(msg, process_ticker_step, trader)
         return
     trader.ticker = ticker
@@ -240,8 +303,13 @@ def process_max_amount_step(message, trader):
     max_amount = message.text 
     trader.amount_to_spend = max_amount
     trader.session_alive = True
-    response = requests.post(f"{BASE_URL_API}/store_and_start_new_session/", json={"chat_id": str(trader.chat_id), 'session_alive': trader.session_alive, 'ticker': trader.ticker, 'end_time': str(trader.end_time), 'amount_to_spend': trader.amount_to_spend})
-    response_body = response.json()
+    try:
+        response = agent.post("/store_and_start_new_session/", {"chat_id": str(trader.chat_id), 'session_alive': trader.session_alive, 'ticker': trader.ticker, 'end_time': str(trader.end_time), 'amount_to_spend': trader.amount_to_spend})
+        response_body = response.json()
+    except requests.RequestException:
+        # The agent may still have started the session, e.g. when it answered too late.
+        response_body = {"status": 500}
+    SESSIONS.invalidate(chat_id)
     if response_body["status"] == 500:
         bot.send_message(chat_id, f"An error occurred while starting your session. Please try again later.")
     elif response_body["status"] == 403:
@@ -253,11 +321,11 @@ def process_max_amount_step(message, trader):
 
 def retreive_trader(chat_id):
     """
-    Retrieves the trader object associated with a given chat ID from the list of traders.
+    Retrieves the trader object associated with a given chat ID.
 
-    This function first checks the user's credentials to see if they exist.
-    If a trader object with the given chat ID exists in the list of traders and the user's credentials are valid, the function updates the trader object with the latest session details from the response body.
-    If a trader object does not exist but the user's credentials are valid, a new trader object is created and added to the list of traders. The trader object is then retrieved from the list of traders and returned.
+    This function first looks up the agent's view of the user in the session cache, which only asks the agent when the view is not cached or was invalidated by a session change.
+    If a trader object with the given chat ID exists and the user's credentials are stored, the function updates the trader object with the latest session details from that view.
+    If a trader object does not exist but the user's credentials are stored, a new trader object is created from the view and kept in `TRADERS`.
 
     Parameters:
         chat_id (int): The Telegram chat ID of the user whose trader object is being retrieved.
@@ -265,18 +333,16 @@ def retreive_trader(chat_id):
     Returns:
         BotParameters: The trader object associated with the given chat ID.
     """
-    already_exists, response_body = check_user_credentials(chat_id)
-    trader = next((t for t in LIST_TRADERS if t.chat_id == chat_id), None)
-    if trader and already_exists:
-        trader.session_alive = True if response_body["session_alive"] == "true" else False
+    response_body = SESSIONS.get(chat_id)
+    trader = TRADERS.get(chat_id)
+    if trader and response_body:
+        trader.session_alive = response_body["session_alive"]
         trader.end_time = response_body["end_time"]
         trader.ticker = response_body["ticker"]
         trader.amount_to_spend = response_body["amount_to_spend"]
-    if not trader and already_exists:
-        trader = BotParameters(chat_id, response_body['api_key'], response_body['api_secret'], True if response_body["session_alive"] == "true" else False, response_body['end_time'], response_body['ticker'], response_body['amount_to_spend'])
-        LIST_TRADERS.append(trader)
-    
-    trader = next((t for t in LIST_TRADERS if t.chat_id == chat_id), None)
+    if not trader and response_body:
+        trader = BotParameters(chat_id, response_body['api_key'], response_body['api_secret'], response_body["session_alive"], response_body['end_time'], response_body['ticker'], response_body['amount_to_spend'])
+        TRADERS[chat_id] = trader
     return trader
   
   
@@ -291,11 +357,12 @@ def retreive_trader(chat_id):
 
       
 @bot.message_handler(commands=['init'])
+@answers_agent_errors
 def init(message):
     """
     Handles the `/init` command from a user, initiating the process of setting up API credentials.
 
-    This function is triggered when a user sends the `/init` command to the Telegram bot. It checks if the user's credentials are already stored by calling the `check_user_credentials` function with the user's chat ID. If the credentials exist, the user is informed that their credentials are stored and they can start their trading agent using the `/start` command. If the credentials are not found, the user is prompted to enter their API key by calling the `ask_for_api_key` function.
+    This function is triggered when a user sends the `/init` command to the Telegram bot. It checks if the user's credentials are already stored by looking the user's chat ID up in the session cache. If the credentials exist, the user is informed that their credentials are stored and they can start their trading agent using the `/start` command. If the credentials are not found, the user is prompted to enter their API key by calling the `ask_for_api_key` function.
 
     Parameters:
         message (telebot.types.Message): The Telegram message object that triggered the `/init` command.
@@ -304,8 +371,7 @@ def init(message):
         None
     """
     chat_id = message.chat.id
-    already_exists, response_body = check_user_credentials(chat_id)
-    if already_exists:
+    if SESSIONS.get(chat_id):
         bot.send_message(chat_id, "Your credentials are already stored 🗃️. To start your trading agent, please type /start 🚀")
     else:
         ask_for_api_key(message)
@@ -313,6 +379,7 @@ def init(message):
 
   
 @bot.message_handler(commands=['start'])
+@answers_agent_errors
 def start(message):
     """
     Handles the '/start' command from a user, initiating or resuming a trading session.
@@ -338,6 +405,7 @@ def start(message):
         
       
 @bot.message_handler(commands=['stop'])
+@answers_agent_errors
 def stop(message):
     """
     Handles the '/stop' command from a user, terminating their active trading session.
@@ -360,8 +428,12 @@ def stop(message):
         bot.reply_to(message, "You don't have an active session to stop. Use /start to begin a new session. 🚀")
         
     elif trader and trader.session_alive:
+        try:
+            response = agent.post("/stop_session/", {"chat_id": str(trader.chat_id), 'session_alive': False, 'ticker': None, 'end_time': None, 'amount_to_spend': None})
+        finally:
+            # The agent may have stopped the session even if it answered too late.
+            SESSIONS.invalidate(chat_id)
         trader.session_alive = False
-        response = requests.post(f"{BASE_URL_API}/stop_session/", json={"chat_id": str(trader.chat_id), 'session_alive': trader.session_alive, 'ticker': "null", 'end_time': "null", 'amount_to_spend': "null"})
         response_body = response.json()
         trade_counter = response_body.get('counter')
         cash_value = response_body.get('cash_value')
@@ -374,6 +446,7 @@ def stop(message):
         bot.reply_to(message, "Please initialize your credentials first with /init. 🔑")
 
 @bot.message_handler(func=lambda message: True)
+@answers_agent_errors
 def redirect_to_init_or_start(message):
     """
     Redirects any non-command messages based on the user's current session state.
@@ -407,12 +480,34 @@ def redirect_to_init_or_start(message):
 ######################################################################################################################
 
 def start_bot():
-    bot.polling()
+    threading.Thread(target=SESSIONS.listen, args=(redis_client,), daemon=True).start()
+    if BOT_MODE == "webhook":
+        start_webhook()
+    else:
+        bot.polling()
+
+def process_update(update):
+    bot.process_new_updates([telebot.types.Update.de_json(update)])
+
+def start_webhook():
+    """
+    Receives updates on a local HTTP endpoint instead of polling Telegram for them.
+
+    Updates are handled on a ChatOrderedPool: the updates of a chat run one after the other, in order, and different chats run in parallel.
+    The handlers are run directly by the pool's workers rather than handed to the bot's own thread pool, which would lose that order.
+    """
+    bot.threaded = False
+    server = WebhookServer(process_update, ChatOrderedPool())
+    if WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=server.secret)
+    print(f"Listening for updates on {server.server_address[0]}:{server.server_address[1]}{server.path}")
+    server.serve_forever()
 
 def run_other_task():
     while(True):
-        if len(LIST_TRADERS) > 0:
-            for trader in LIST_TRADERS:
+        if len(TRADERS) > 0:
+            for trader in list(TRADERS.values()):
                 trader.send_message('Hello, I am a bot')
                 time.sleep(10)
 
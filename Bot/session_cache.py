@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import redis
+
+
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 300))
+SESSION_EVENTS_CHANNEL = os.getenv("SESSION_EVENTS_CHANNEL", "session_events")
+
+
+class SessionCache:
+    """
+    Local copy of the agent's view of each user, so most messages need no request to the agent.
+
+    A view is fetched on first use and kept until the agent announces a change for that chat
+    ID on the session events channel, or for `ttl` seconds at most in case an announcement is
+    missed. Users without credentials are cached too, as None.
+
+    Attributes:
+        fetch (callable): Called as fetch(chat_id) and returning the agent's view of the user
+            (the /checkcredentials/ response), or None if it has no credentials for them.
+        ttl (float): Seconds after which a view is fetched again regardless of announcements.
+    """
+    def __init__(self, fetch, ttl=SESSION_CACHE_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._views = {}
+        # Bumped on every invalidation, so a fetch racing with one does not store a stale view.
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        key = str(chat_id)
+        cached = self._views.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        version = (self._epoch, self._versions.get(key, 0))
+        fetched_at = time.monotonic()
+        view = self.fetch(chat_id)
+        with self._lock:
+            if version == (self._epoch, self._versions.get(key, 0)):
+                self._views[key] = (view, fetched_at)
+        return view
+
+    def invalidate(self, chat_id):
+        key = str(chat_id)
+        with self._lock:
+            self.invalidations += 1
+            self._views.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._epoch += 1
+
+    def stats(self):
+        return {"views": len(self._views), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+    def listen(self, redis_client, channel=SESSION_EVENTS_CHANNEL):
+        """
+        Invalidates views as the agent announces changes. Runs forever; start it in a thread.
+
+        Parameters:
+            redis_client (redis.StrictRedis): Client on the Redis the agent publishes to.
+            channel (str): Channel the changed chat IDs are published on.
+        """
+        while True:
+            try:
+                pubsub = redis_client.pubsub()
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        # Changes made while we were not subscribed were missed.
+                        self.clear()
+                    elif message["type"] == "message":
+                        self.invalidate(message["data"])
+            except redis.exceptions.ConnectionError as e:
+                print(f"Lost the session events subscription, retrying: {e}")
+                time.sleep(1)
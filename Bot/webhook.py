@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 80))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", 10000))
+
+
+def chat_key(update):
+    """
+    Returns the chat an update belongs to, or None for updates outside of any chat.
+
+    Parameters:
+        update (dict): A Telegram update, as decoded from JSON.
+    """
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if kind in update:
+            return update[kind]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback and "message" in callback:
+        return callback["message"]["chat"]["id"]
+    for kind in ("inline_query", "chosen_inline_result", "callback_query"):
+        if kind in update:
+            return update[kind]["from"]["id"]
+    return None
+
+
+class ChatOrderedPool:
+    """
+    Bounded pool of worker threads running the tasks of a chat one after the other.
+
+    Tasks are queued per chat and a chat is run by at most one worker at a time, so the updates
+    of a chat are handled in the order they arrived while different chats run in parallel.
+
+    Attributes:
+        workers (int): Number of worker threads.
+        max_pending (int): Maximum number of tasks queued; `submit` refuses tasks beyond it.
+    """
+    def __init__(self, workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.errors = 0
+        self._queues = {}
+        self._ready = deque()
+        self._condition = threading.Condition()
+        self._idle = threading.Condition(self._condition)
+        self._threads = [threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, task, *args):
+        """
+        Queues a task after the other tasks of the same key.
+
+        Returns:
+            bool: False if the pool is full and the task was not queued.
+        """
+        with self._condition:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                self._ready.append(key)
+                self._condition.notify()
+            queue.append((task, args))
+            return True
+
+    def join(self, timeout=None):
+        """
+        Waits until every queued task has run.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def stats(self):
+        return {"pending": self.pending, "chats": len(self._queues), "completed": self.completed, "errors": self.errors}
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._ready)
+                key = self._ready.popleft()
+                task, args = self._queues[key].popleft()
+            try:
+                task(*args)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error handling an update of chat {key}: {e}")
+            with self._condition:
+                self.pending -= 1
+                self.completed += 1
+                if self._queues[key]:
+                    self._ready.append(key)
+                    self._condition.notify()
+                else:
+                    del self._queues[key]
+                if self.pending == 0:
+                    self._idle.notify_all()
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    HTTP endpoint receiving Telegram updates and handing them to a ChatOrderedPool.
+
+    Updates are acknowledged as soon as they are queued. When the pool is full the update is
+    refused with a 503, and Telegram delivers it again later.
+
+    Attributes:
+        on_update (callable): Called with every update, as a dict, from the pool's workers.
+        pool (ChatOrderedPool): Pool the updates are run on.
+        path (str): Path updates are posted to.
+        secret (str): Expected X-Telegram-Bot-Api-Secret-Token header, or None to accept any.
+    """
+    daemon_threads = True
+
+    def __init__(self, on_update, pool, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+        super().__init__((host, port), WebhookHandler)
+        self.on_update = on_update
+        self.pool = pool
+        self.path = path
+        self.secret = secret
+        self.received = 0
+        self.rejected = 0
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    # Keeps the connection open between updates.
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        if self.path != server.path:
+            return self._reply(404)
+        if server.secret and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != server.secret:
+            return self._reply(403)
+        try:
+            update = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self._reply(400)
+        server.received += 1
+        if not server.pool.submit(chat_key(update), server.on_update, update):
+            server.rejected += 1
+            return self._reply(503)
+        self._reply(200)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
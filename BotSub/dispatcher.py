@@ -0,0 +1,222 @@
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import deque
+
+from notifier_metrics import DELIVERY_SECONDS, ERRORS, SEND_SECONDS
+
+
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", 8))
+# Telegram allows about 30 messages per second overall and one per second in a given chat.
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", 25))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", 1))
+NOTIFY_CHAT_BURST = int(os.getenv("NOTIFY_CHAT_BURST", 3))
+NOTIFY_MAX_COALESCE = int(os.getenv("NOTIFY_MAX_COALESCE", 20))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 5))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", 1))
+NOTIFY_MAX_BACKOFF = float(os.getenv("NOTIFY_MAX_BACKOFF", 60))
+
+TELEGRAM_MAX_LENGTH = 4096
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, and bursts of up to `capacity`.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """
+        Takes a token, going into debt if there is none left.
+
+        Returns:
+            float: Seconds to wait before the token may be used.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self, now):
+        """
+        Whether the bucket has refilled to capacity, i.e. is the same as a new bucket.
+        """
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def retry_after(error):
+    # Telegram answers 429 errors with the number of seconds to wait before retrying.
+    result = getattr(error, "result_json", None) or {}
+    return result.get("parameters", {}).get("retry_after")
+
+
+class NotificationDispatcher:
+    """
+    Sends chat messages from a pool of workers, within Telegram's rate limits.
+
+    Messages are queued per chat and every chat is handled by at most one worker at a time, so
+    messages of a chat keep their order. Each send waits for a token of the chat's bucket and of
+    the global one; messages queued for a chat meanwhile are merged into a single message when
+    its turn comes, so a burst of trades costs one send instead of one per trade. Failed sends
+    are retried with exponential backoff, or after the delay Telegram asks for. The buckets of
+    chats that have been quiet long enough to refill are dropped, as a new one would be full.
+
+    Attributes:
+        send (callable): Blocking function called as send(chat_id, text); it runs in a thread.
+        workers (int): Number of messages sent concurrently.
+        global_rate (float): Messages per second over all chats.
+        chat_rate (float): Messages per second in one chat.
+        chat_burst (int): Messages a chat may receive back to back before being rate-limited.
+        max_coalesce (int): Maximum number of queued messages merged into one.
+        max_attempts (int): Sends attempted before the messages are given up on.
+        backoff (float): Delay before the first retry, doubled on every further one.
+        max_backoff (float): Upper bound of the retry delay.
+    """
+    def __init__(self, send, workers=NOTIFY_WORKERS, global_rate=NOTIFY_GLOBAL_RATE, chat_rate=NOTIFY_CHAT_RATE,
+                 chat_burst=NOTIFY_CHAT_BURST, max_coalesce=NOTIFY_MAX_COALESCE, max_attempts=NOTIFY_MAX_ATTEMPTS,
+                 backoff=NOTIFY_BACKOFF, max_backoff=NOTIFY_MAX_BACKOFF):
+        self.send = send
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_coalesce = max_coalesce
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.global_bucket = TokenBucket(global_rate, capacity=workers)
+        self.chat_buckets = {}
+        self.buckets_swept_at = time.monotonic()
+        self.messages_sent = 0
+        self.sends = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=1000)
+        self._pending = {}
+        self._ready = asyncio.Queue()
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, chat_id, text):
+        """
+        Queues a message.
+
+        Returns:
+            asyncio.Future: Resolved once the message is sent, possibly merged with others, or
+                failed with the last error once every attempt failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queued = self._pending.get(chat_id)
+        if queued is None:
+            queued = self._pending[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        queued.append((text, future, time.monotonic()))
+        return future
+
+    async def deliver(self, chat_id, text):
+        """
+        Queues a message and waits until it is sent.
+        """
+        await self.submit(chat_id, text)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": sum(len(queued) for queued in self._pending.values()),
+            "chats_waiting": len(self._pending),
+            "chat_buckets": len(self.chat_buckets),
+            "messages_sent": self.messages_sent,
+            "sends": self.sends,
+            "retries": self.retries,
+            "failures": self.failures,
+            "latency_p50_seconds": statistics.median(latencies) if latencies else None,
+            "latency_p99_seconds": latencies[int(len(latencies) * 0.99)] if latencies else None,
+        }
+
+    def _bucket(self, chat_id):
+        self._sweep_buckets()
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+        return bucket
+
+    def _sweep_buckets(self):
+        now = time.monotonic()
+        # At most once per refill time, and never more than once a second.
+        if now - self.buckets_swept_at < max(1.0, self.chat_burst / self.chat_rate):
+            return
+        self.buckets_swept_at = now
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.is_full(now)]:
+            del self.chat_buckets[chat_id]
+
+    def _take(self, queued):
+        batch = [queued.popleft()]
+        length = len(batch[0][0])
+        while queued and len(batch) < self.max_coalesce and length + 2 + len(queued[0][0]) <= TELEGRAM_MAX_LENGTH:
+            length += 2 + len(queued[0][0])
+            batch.append(queued.popleft())
+        return batch
+
+    async def _work(self):
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._bucket(chat_id).acquire()
+                await self.global_bucket.acquire()
+                queued = self._pending[chat_id]
+                batch = self._take(queued)
+                await self._send(chat_id, batch)
+            finally:
+                # Hand the chat back to the pool if more messages arrived in the meantime.
+                if self._pending.get(chat_id):
+                    self._ready.put_nowait(chat_id)
+                else:
+                    self._pending.pop(chat_id, None)
+
+    async def _send(self, chat_id, batch):
+        text = "\n\n".join(message for message, _, _ in batch)
+        for attempt in range(self.max_attempts):
+            try:
+                self.sends += 1
+                with SEND_SECONDS.time():
+                    await asyncio.to_thread(self.send, chat_id, text)
+                break
+            except Exception as e:
+                if attempt + 1 == self.max_attempts:
+                    self.failures += len(batch)
+                    ERRORS.labels("dispatcher").inc()
+                    print(f"Giving up sending {len(batch)} message(s) to {chat_id}: {e}")
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    return
+                self.retries += 1
+                delay = retry_after(e) or min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+                await asyncio.sleep(delay)
+        now = time.monotonic()
+        self.messages_sent += len(batch)
+        for _, future, submitted_at in batch:
+            self.latencies.append(now - submitted_at)
+            DELIVERY_SECONDS.observe(now - submitted_at)
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,47 @@
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# From 10 ms for a Telegram call to minutes for a message held back by the rate limits.
+LATENCY_BUCKETS = (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+registry = CollectorRegistry()
+
+SEND_SECONDS = Histogram("notifier_send_seconds", "Round trip of each Telegram send",
+                         buckets=LATENCY_BUCKETS, registry=registry)
+DELIVERY_SECONDS = Histogram("notifier_delivery_seconds", "Time from a notification being queued to it being sent",
+                             buckets=LATENCY_BUCKETS, registry=registry)
+ERRORS = Counter("notifier_errors", "Errors caught, by component", ["component"], registry=registry)
+
+
+class StatsCollector:
+    """
+    Exports the numbers returned by the components' `stats()` as gauges, read when scraped.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._sources = {}
+
+    def add(self, name, stats):
+        self._sources[name] = stats
+
+    def collect(self):
+        for name, stats in list(self._sources.items()):
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"{self.prefix}_{name}_{key}", f"{key} of {name}", value=value)
+
+
+stats = StatsCollector("notifier")
+registry.register(stats)
+
+
+def start_exporter(port=METRICS_PORT):
+    """
+    Serves every metric on http://0.0.0.0:<port>/metrics, from a background thread.
+    """
+    start_http_server(port, registry=registry)
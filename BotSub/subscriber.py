@@ -1,34 +1,45 @@
-import redis
+import asyncio
+import redis.asyncio as aioredis
 import telebot
 import os
 
 from dotenv import load_dotenv
 
+from dispatcher import NotificationDispatcher
+from notifier_metrics import start_exporter, stats
+from trade_stream import TradeStreamConsumer
+
 load_dotenv("./../.env")
 
-# Configuration de la connexion Redis
-redis_client = redis.StrictRedis(host="redis", port=6379, charset="utf-8", decode_responses=True)
-pubsub = redis_client.pubsub()
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", 60))
 
-# Souscrire au canal Redis
-pubsub.subscribe('trade_channel')
+# Configuration de la connexion Redis
+redis_client = aioredis.Redis(host="redis", port=6379, decode_responses=True)
 
 # Initialiser TeleBot avec votre token
 bot = telebot.TeleBot(os.getenv("TELEGRAM_BOT_TOKEN"))
 
-# Fonction pour écouter les messages Redis et agir
-def listen_for_trades():
-    for message in pubsub.listen():
-        if message['type'] == 'message':
-            # The message data is already decoded, thanks to decode_responses=True
-            trade_info = message['data']
-            
-            parts = trade_info.split('# ')
-            chat_id = parts[1]
-            message_info = parts[0]
+# Envoyer les notifications via Telegram, en respectant ses limites de débit
+dispatcher = NotificationDispatcher(lambda chat_id, text: bot.send_message(chat_id=chat_id, text=text))
+
+# Lire les événements de trade du stream Redis
+consumer = TradeStreamConsumer(redis_client, dispatcher.deliver)
+
+
+stats.add("dispatcher", dispatcher.stats)
+stats.add("trade_stream", consumer.stats)
+
+
+async def report_metrics():
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        print(f"Notifications: {dispatcher.stats()} stream: {consumer.stats()}")
+
 
-            # Envoyer une notification via Telegram
-            bot.send_message(chat_id=chat_id, text=message_info)
+async def main():
+    start_exporter()
+    dispatcher.start()
+    await asyncio.gather(consumer.run(), report_metrics())
 
 # Lancer l'écoute dans un thread ou un processus séparé si nécessaire
-listen_for_trades()
+asyncio.run(main())
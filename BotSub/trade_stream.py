@@ -0,0 +1,170 @@
+import asyncio
+import os
+import socket
+
+import redis
+
+from notifier_metrics import ERRORS
+
+
+TRADE_STREAM = os.getenv("TRADE_STREAM", "trade_events")
+TRADE_STREAM_GROUP = os.getenv("TRADE_STREAM_GROUP", "notifiers")
+# Must be unique per replica; the container hostname is.
+TRADE_STREAM_CONSUMER = os.getenv("TRADE_STREAM_CONSUMER", socket.gethostname())
+TRADE_STREAM_BATCH = int(os.getenv("TRADE_STREAM_BATCH", 50))
+TRADE_STREAM_BLOCK_MS = int(os.getenv("TRADE_STREAM_BLOCK_MS", 5000))
+TRADE_STREAM_CLAIM_IDLE_MS = int(os.getenv("TRADE_STREAM_CLAIM_IDLE_MS", 60000))
+TRADE_STREAM_MAX_INFLIGHT = int(os.getenv("TRADE_STREAM_MAX_INFLIGHT", 500))
+
+
+def render(fields):
+    """
+    Turns a trade stream entry into the Telegram message sent for it.
+
+    Parameters:
+        fields (dict): The entry, as written by the trader agent's trade_events module.
+
+    Returns:
+        str: The notification text.
+    """
+    if fields["type"] == "recap":
+        return (f"📊📊 RECAP 📊📊\nTotal trades made: {fields['trades']}\n"
+                f"Cash Value: {fields['cash_value']}$\nPortfolio Value: {fields['portfolio_value']}$")
+    if fields["side"] == "buy":
+        return f"BUY {fields['qty']} shares of {fields['symbol']} at {fields['price']}$ 💸"
+    return f"SELL {fields['qty'] or 'all'} shares of {fields['symbol']} at {fields['price']}$ 💰"
+
+
+class TradeStreamConsumer:
+    """
+    Reads trade events from a Redis Stream as one member of a consumer group, and sends them.
+
+    Replicas in the same group share the entries between them. Sends run concurrently, up to
+    `max_inflight` at a time, and an entry is acknowledged only once its message is sent, so
+    entries of a replica that stopped mid-batch stay pending: the replica resumes them when it
+    restarts, and the others claim them once they have been idle for `claim_idle_ms`. Sent
+    entries are also marked in Redis, so an entry claimed or reread after it was sent but
+    before it was acknowledged is not sent twice.
+
+    Attributes:
+        redis (redis.asyncio.Redis): Client on the Redis holding the stream, with decode_responses.
+        send (callable): Coroutine function awaited as send(chat_id, text) for every entry,
+            returning once the message is sent.
+        stream (str): Name of the stream.
+        group (str): Consumer group shared by the replicas.
+        consumer (str): Name of this replica within the group.
+        batch_size (int): Maximum number of entries read per call.
+        block_ms (int): How long a read waits for new entries.
+        claim_idle_ms (int): Idle time after which another replica's pending entries are taken over.
+        max_inflight (int): Maximum number of entries being sent at once.
+        sent_ttl (int): Seconds a sent entry is remembered for.
+    """
+    def __init__(self, redis_client, send, stream=TRADE_STREAM, group=TRADE_STREAM_GROUP,
+                 consumer=TRADE_STREAM_CONSUMER, batch_size=TRADE_STREAM_BATCH,
+                 block_ms=TRADE_STREAM_BLOCK_MS, claim_idle_ms=TRADE_STREAM_CLAIM_IDLE_MS,
+                 max_inflight=TRADE_STREAM_MAX_INFLIGHT, sent_ttl=24 * 3600):
+        self.redis = redis_client
+        self.send = send
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_inflight = max_inflight
+        self.sent_ttl = sent_ttl
+        self.sent = 0
+        self.duplicates = 0
+        self.failures = 0
+        # Position in the entries this consumer read but did not acknowledge before it last
+        # stopped, or None once they are all handled.
+        self._backlog = "0"
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._inflight = set()
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def poll(self):
+        """
+        Reads one batch of entries and starts sending them.
+
+        Returns:
+            int: Number of entries read.
+        """
+        entries = []
+        if self._backlog is not None:
+            entries = await self._read(self._backlog)
+            self._backlog = entries[-1][0] if entries else None
+        if not entries:
+            _, entries, _ = await self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                                  min_idle_time=self.claim_idle_ms, count=self.batch_size)
+        if not entries:
+            entries = await self._read(">", block=self.block_ms)
+        for entry_id, fields in entries:
+            await self.handle(entry_id, fields)
+        return len(entries)
+
+    async def handle(self, entry_id, fields):
+        if await self.redis.exists(self._sent_key(entry_id)):
+            self.duplicates += 1
+            await self.ack(entry_id)
+            return
+        try:
+            chat_id, text = fields["chat_id"], render(fields)
+        except KeyError as e:
+            print(f"Dropping malformed trade event {entry_id}: missing {e}")
+            await self.ack(entry_id)
+            return
+        # Stop reading while too many sends are queued, e.g. when Telegram rate-limits us.
+        await self._slots.acquire()
+        task = asyncio.create_task(self._deliver(entry_id, chat_id, text))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def ack(self, entry_id):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._sent_key(entry_id), 1, ex=self.sent_ttl)
+            pipe.xack(self.stream, self.group, entry_id)
+            await pipe.execute()
+
+    async def drain(self):
+        """
+        Waits for the sends in progress to finish.
+        """
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def run(self):
+        await self.ensure_group()
+        while True:
+            await self.poll()
+
+    def stats(self):
+        return {"sent": self.sent, "duplicates": self.duplicates, "failures": self.failures, "inflight": len(self._inflight)}
+
+    async def _deliver(self, entry_id, chat_id, text):
+        try:
+            await self.send(chat_id, text)
+        except Exception as e:
+            # Left pending: it is retried once claimed again after claim_idle_ms.
+            self.failures += 1
+            ERRORS.labels("trade_stream").inc()
+            print(f"Error sending trade event {entry_id} to {chat_id}: {e}")
+            return
+        finally:
+            self._slots.release()
+        self.sent += 1
+        await self.ack(entry_id)
+
+    def _sent_key(self, entry_id):
+        return f"{self.stream}:{self.group}:sent:{entry_id}"
+
+    async def _read(self, last_id, block=None):
+        response = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: last_id},
+                                         count=self.batch_size, block=block)
+        # Entries deleted by trimming while pending come back without fields.
+        return [(entry_id, fields) for _, entries in response or [] for entry_id, fields in entries if fields]
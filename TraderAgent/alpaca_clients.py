@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import alpaca_trade_api as tradeapi
+
+# Statuses Alpaca answers when it refuses the credentials themselves.
+REJECTED_STATUSES = (401, 403)
+
+
+class AccountSnapshot:
+    """
+    The account figures the API reports, as of `fetched_at`.
+
+    Attributes:
+        cash (str): Cash available, as returned by Alpaca.
+        portfolio_value (str): Total portfolio value, as returned by Alpaca.
+        fetched_at (float): Monotonic time the snapshot was taken.
+    """
+    def __init__(self, cash, portfolio_value, fetched_at):
+        self.cash = cash
+        self.portfolio_value = portfolio_value
+        self.fetched_at = fetched_at
+
+
+class AlpacaClientRegistry:
+    """
+    Shares one Alpaca REST client per set of credentials and caches account snapshots.
+
+    A REST client holds its own HTTP session, so reusing it keeps its connections alive instead
+    of setting up a new one per request. Account snapshots are kept for `snapshot_ttl` seconds,
+    and concurrent requests for the same account while a fetch is in flight all wait for that
+    one fetch instead of sending their own. A snapshot is only kept along with its client, so
+    both are bounded by `max_clients`.
+
+    Attributes:
+        base_url (str): Alpaca endpoint the clients talk to.
+        snapshot_ttl (float): How long, in seconds, an account snapshot is served from the cache.
+        max_clients (int): Number of clients kept; the least recently used one is closed beyond.
+    """
+    def __init__(self, base_url, snapshot_ttl=5, max_clients=1000):
+        self.base_url = base_url
+        self.snapshot_ttl = snapshot_ttl
+        self.max_clients = max_clients
+        self.upstream_calls = 0
+        self._clients = OrderedDict()
+        self._snapshots = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _key(self, api_key, api_secret):
+        return api_key, hashlib.sha256(api_secret.encode("utf-8")).hexdigest()
+
+    def client(self, api_key, api_secret):
+        """
+        Returns the shared REST client of a set of credentials, creating it on first use.
+        """
+        key = self._key(api_key, api_secret)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = tradeapi.REST(key_id=api_key, secret_key=api_secret, base_url=self.base_url)
+                self._clients[key] = client
+                while len(self._clients) > self.max_clients:
+                    evicted_key, evicted = self._clients.popitem(last=False)
+                    self._snapshots.pop(evicted_key, None)
+                    self._close(evicted)
+            self._clients.move_to_end(key)
+            return client
+
+    async def account(self, api_key, api_secret, fresh=False):
+        """
+        Returns a snapshot of an account, from the cache if it is recent enough.
+
+        Parameters:
+            api_key (str): Alpaca API key.
+            api_secret (str): Alpaca API secret.
+            fresh (bool): Ignore the cached snapshot.
+
+        Returns:
+            AccountSnapshot: The account's cash and portfolio value.
+
+        Raises:
+            Exception: Whatever the Alpaca client raised, e.g. for invalid credentials.
+        """
+        key = self._key(api_key, api_secret)
+        snapshot = self._snapshots.get(key)
+        if not fresh and snapshot is not None and time.monotonic() - snapshot.fetched_at < self.snapshot_ttl:
+            return snapshot
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch(key, api_key, api_secret))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(inflight)
+
+    def invalidate(self, api_key, api_secret):
+        self._snapshots.pop(self._key(api_key, api_secret), None)
+
+    def clear(self):
+        with self._lock:
+            for client in self._clients.values():
+                self._close(client)
+            self._clients.clear()
+            self._snapshots.clear()
+
+    def stats(self):
+        return {"clients": len(self._clients), "snapshots": len(self._snapshots), "upstream_calls": self.upstream_calls}
+
+    async def _fetch(self, key, api_key, api_secret):
+        client = self.client(api_key, api_secret)
+        self.upstream_calls += 1
+        try:
+            account = await asyncio.to_thread(client.get_account)
+        except Exception as e:
+            # Do not keep clients of credentials Alpaca rejects. Timeouts and server errors say
+            # nothing about the credentials: the client stays shared.
+            if getattr(getattr(e, "response", None), "status_code", None) in REJECTED_STATUSES:
+                with self._lock:
+                    if self._clients.get(key) is client:
+                        del self._clients[key]
+                        self._snapshots.pop(key, None)
+            raise
+        snapshot = AccountSnapshot(account.cash, account.portfolio_value, time.monotonic())
+        with self._lock:
+            # The client may have been evicted meanwhile.
+            if self._clients.get(key) is client:
+                self._snapshots[key] = snapshot
+        return snapshot
+
+    @staticmethod
+    def _close(client):
+        session = getattr(client, "_session", None)
+        if session is not None:
+            session.close()
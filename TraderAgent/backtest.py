@@ -0,0 +1,217 @@
+"""
+Runs MLStrategy's trading rules over historical bars and headlines read from local files.
+
+Every headline that falls in one of the simulated days' news windows is scored up front, in a
+single batched pass of the sentiment model; the simulation itself then only aggregates those
+scores day by day, so it needs neither the network nor one model call per simulated day.
+With --store, the daily sentiment is read from a SentimentStore instead, and only the days it
+does not hold yet are scored (and then added to it).
+
+Bars are a CSV file with date, open, high, low and close columns (a Yahoo Finance export
+works). Headlines are a CSV file with created_at and headline columns, or a JSONL file of
+Alpaca news items.
+
+Usage:
+    python backtest.py --bars AAPL.csv --news AAPL_news.jsonl --amount 1000 --cash 100000
+    python backtest.py --bars AAPL.csv --news AAPL_news.jsonl --store ./sentiment_store --symbol AAPL
+"""
+import argparse
+import bisect
+import math
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import sentiment
+from sentiment_store import SentimentStore
+from signals import BRACKETS, SENTIMENT_THRESHOLD, trading_signal
+
+
+NEWS_WINDOW = timedelta(days=3)
+NEWS_LIMIT = 10
+
+
+def load_bars(path):
+    bars = pd.read_csv(path)
+    bars.columns = [column.strip().lower() for column in bars.columns]
+    bars["date"] = pd.to_datetime(bars["date"], utc=True).dt.tz_localize(None).dt.normalize()
+    return bars.sort_values("date").reset_index(drop=True)[["date", "open", "high", "low", "close"]]
+
+
+def load_news(path):
+    news = pd.read_json(path, lines=True) if path.endswith(".jsonl") else pd.read_csv(path)
+    news["created_at"] = pd.to_datetime(news["created_at"], utc=True).dt.tz_localize(None)
+    return news.sort_values("created_at").reset_index(drop=True)[["created_at", "headline"]]
+
+
+def news_windows(days, news, window=NEWS_WINDOW, limit=NEWS_LIMIT):
+    """
+    Returns the headlines the strategy would have seen on each day: the newest `limit` ones
+    published in the `window` before the end of that day.
+    """
+    times = news["created_at"].tolist()
+    headlines = news["headline"].tolist()
+    windows = []
+    for day in days:
+        end = bisect.bisect_right(times, day + timedelta(days=1))
+        start = bisect.bisect_left(times, day - window)
+        windows.append(headlines[max(start, end - limit):end][::-1])
+    return windows
+
+
+class Lot:
+    def __init__(self, side, quantity, price):
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        take_profit, stop_loss = BRACKETS[side]
+        self.take_profit = price * take_profit
+        self.stop_loss = price * stop_loss
+
+    def exit_price(self, high, low):
+        # Daily bars do not tell which level was hit first: assume the stop loss.
+        if self.side == "buy":
+            if low <= self.stop_loss:
+                return self.stop_loss
+            if high >= self.take_profit:
+                return self.take_profit
+        else:
+            if high >= self.stop_loss:
+                return self.stop_loss
+            if low <= self.take_profit:
+                return self.take_profit
+        return None
+
+    def value(self, price):
+        return self.quantity * price if self.side == "buy" else -self.quantity * price
+
+
+def daily_sentiment(days, windows, score, aggregate, store=None, symbol=None):
+    """
+    Returns the (probability, label) of each day, or None for days without headlines.
+
+    Days already held by `store` are read from it; the others are scored in one batched pass
+    and written to it.
+
+    Returns:
+        tuple: The sentiment of each day and the number of headlines scored.
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    stored = store.read(symbol, days[0], days[-1]).lookup() if store is not None and len(days) else {}
+    missing = [i for i, (day, window) in enumerate(zip(days, windows)) if window and day not in stored]
+    unique = list(dict.fromkeys(headline for i in missing for headline in windows[i]))
+    logits = dict(zip(unique, score(unique))) if unique else {}
+
+    computed = {}
+    for i in missing:
+        rows = [logits[headline] for headline in windows[i]]
+        computed[i] = rows, aggregate(rows)
+    if store is not None and computed:
+        store.put(symbol, days[missing],
+                  [[sum(column) for column in zip(*rows)] for rows, _ in computed.values()],
+                  [probability for _, (probability, _) in computed.values()],
+                  [sentiment.labels.index(label) for _, (_, label) in computed.values()])
+    daily = [computed[i][1] if i in computed else stored.get(day) for i, day in enumerate(days)]
+    return daily, len(unique)
+
+
+def run_backtest(bars, news, amount_to_spend, cash, threshold=SENTIMENT_THRESHOLD, score=None, aggregate=None,
+                 store=None, symbol=None):
+    """
+    Simulates one MLStrategy session, iterating once per bar at its closing price.
+
+    Orders fill at the close; their bracket legs are checked against the high and low of the
+    following bars.
+
+    Parameters:
+        bars (pandas.DataFrame): Daily bars, see `load_bars`.
+        news (pandas.DataFrame): Headlines, see `load_news`.
+        amount_to_spend (float): Amount the strategy may spend per order.
+        cash (float): Starting cash.
+        threshold (float): Probability above which the sentiment is acted on.
+        score (callable): Scores a list of headlines; defaults to the configured backend.
+        aggregate (callable): Aggregates a day's logits; defaults to the configured backend's.
+        store (SentimentStore): Store the daily sentiment is read from and written to, if any.
+        symbol (str): Symbol the bars and headlines are of, required with `store`.
+
+    Returns:
+        dict: P&L, trade count, timings and throughput of the run.
+    """
+    started = time.perf_counter()
+    score = score or sentiment.score_headlines
+    aggregate = aggregate or sentiment.get_backend().aggregate
+
+    windows = news_windows(bars["date"], news)
+    daily, headlines_scored = daily_sentiment(bars["date"], windows, score, aggregate, store, symbol)
+    scored = time.perf_counter()
+
+    starting_cash = cash
+    lots = []
+    last_trade = None
+    trades = 0
+    for bar, day in zip(bars.itertuples(index=False), daily):
+        for lot in list(lots):
+            price = lot.exit_price(bar.high, bar.low)
+            if price is not None:
+                cash += lot.value(price)
+                lots.remove(lot)
+
+        probability, label = day or (0, "neutral")
+        last_price = bar.close
+        equity = cash + sum(lot.value(last_price) for lot in lots)
+        close_first, side = trading_signal(label, probability, last_trade, amount_to_spend, last_price, cash, threshold)
+        if side is None:
+            continue
+        if close_first:
+            cash = equity
+            lots = []
+            trades += 1
+        quantity = math.floor(amount_to_spend / last_price)
+        lots.append(Lot(side, quantity, last_price))
+        cash -= lots[-1].value(last_price)
+        trades += 1
+        last_trade = side
+
+    final_price = bars["close"].iloc[-1] if len(bars) else 0
+    equity = cash + sum(lot.value(final_price) for lot in lots)
+    finished = time.perf_counter()
+    return {
+        "days": len(bars),
+        "headlines_scored": headlines_scored,
+        "trades": trades,
+        "starting_cash": starting_cash,
+        "final_equity": equity,
+        "pnl": equity - starting_cash,
+        "return_pct": (equity / starting_cash - 1) * 100,
+        "scoring_seconds": scored - started,
+        "simulation_seconds": finished - scored,
+        "days_per_second": len(bars) / (finished - started),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", required=True)
+    parser.add_argument("--news", required=True)
+    parser.add_argument("--amount", type=float, default=1000)
+    parser.add_argument("--cash", type=float, default=100000)
+    parser.add_argument("--threshold", type=float, default=SENTIMENT_THRESHOLD)
+    parser.add_argument("--store", help="directory of a SentimentStore to read and extend")
+    parser.add_argument("--symbol", help="symbol of the bars, defaults to the bars file name")
+    args = parser.parse_args()
+
+    store = SentimentStore(args.store) if args.store else None
+    symbol = args.symbol or os.path.splitext(os.path.basename(args.bars))[0].upper()
+    report = run_backtest(load_bars(args.bars), load_news(args.news), args.amount, args.cash, args.threshold,
+                          store=store, symbol=symbol)
+    print(f"days simulated:   {report['days']} ({report['headlines_scored']} headlines scored in {report['scoring_seconds']:.2f}s)")
+    print(f"trades:           {report['trades']}")
+    print(f"P&L:              {report['pnl']:.2f}$ ({report['return_pct']:.2f}%)")
+    print(f"throughput:       {report['days_per_second']:.0f} simulated days/s")
+
+
+if __name__ == "__main__":
+    main()
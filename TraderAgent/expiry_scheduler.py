@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+import time
+
+
+class ExpiryScheduler:
+    """
+    Fires a callback when a session reaches its end time, for any number of sessions.
+
+    Deadlines are kept in a min-heap and a single task sleeps until the earliest one, so the
+    cost does not grow with the number of sessions waiting and sessions are stopped on time
+    rather than on the next poll. Every deadline is also written to a Redis sorted set, so they
+    survive a restart: `start` reloads them and fires the ones that passed while the agent was
+    down right away.
+
+    Rescheduling or cancelling a chat ID leaves its old heap entry in place; entries that no
+    longer match `deadlines` are skipped when they reach the top.
+
+    Attributes:
+        redis (redis.asyncio.Redis): Client the deadlines are persisted with.
+        on_expire (callable): Coroutine function called with the chat ID of an expired session.
+        key (str): Name of the sorted set holding the deadlines, as epoch seconds.
+        deadlines (dict): Current deadline of every scheduled chat ID.
+    """
+    def __init__(self, redis, on_expire, key="session_expiry"):
+        self.redis = redis
+        self.on_expire = on_expire
+        self.key = key
+        self.deadlines = {}
+        self.fired = 0
+        self.max_lateness = 0.0
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._callbacks = set()
+
+    async def schedule(self, chat_id, deadline):
+        """
+        Sets, or moves, the end time of a chat ID's session.
+
+        Parameters:
+            chat_id (str): The chat ID whose session expires.
+            deadline (datetime): When to stop the session.
+        """
+        at = deadline.timestamp()
+        await self.redis.zadd(self.key, {chat_id: at})
+        self._push(chat_id, at)
+
+    async def cancel(self, chat_id):
+        await self.redis.zrem(self.key, chat_id)
+        self.deadlines.pop(chat_id, None)
+
+    async def load(self):
+        """
+        Reloads the deadlines persisted in Redis.
+        """
+        for chat_id, at in await self.redis.zrange(self.key, 0, -1, withscores=True):
+            self._push(chat_id, at)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "scheduled": len(self.deadlines),
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "max_lateness_seconds": self.max_lateness,
+            "next_expiry_in": self._next_deadline() - time.time() if self.deadlines else None,
+        }
+
+    def _push(self, chat_id, at):
+        self.deadlines[chat_id] = at
+        heapq.heappush(self._heap, (at, chat_id))
+        # Only the earliest deadline matters to the sleeping task.
+        if self._heap[0] == (at, chat_id):
+            self._wakeup.set()
+
+    def _next_deadline(self):
+        while self._heap and self.deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    async def _run(self):
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"Error loading the session deadlines: {e}")
+        while True:
+            self._wakeup.clear()
+            at = self._next_deadline()
+            delay = None if at is None else at - time.time()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, chat_id = heapq.heappop(self._heap)
+            del self.deadlines[chat_id]
+            self.fired += 1
+            self.max_lateness = max(self.max_lateness, -delay)
+            # Run the callback on its own, so a slow stop does not hold back the next expiries.
+            callback = asyncio.create_task(self._expire(chat_id))
+            self._callbacks.add(callback)
+            callback.add_done_callback(self._callbacks.discard)
+
+    async def _expire(self, chat_id):
+        try:
+            if chat_id not in self.deadlines:
+                await self.redis.zrem(self.key, chat_id)
+            await self.on_expire(chat_id)
+        except Exception as e:
+            print(f"Error expiring the session of chat ID {chat_id}: {e}")
@@ -0,0 +1,157 @@
+import os
+from contextlib import contextmanager
+
+import redis
+import redis.asyncio as aioredis
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from tracing import tracer
+
+
+# From a millisecond, where Redis calls sit, to half a minute for Alpaca calls and model batches.
+# When set, before prometheus_client is imported, every process (the API and the session workers)
+# records its histograms and counters in files there, and a scrape merges them all. It must be
+# emptied when the service starts, e.g. by mounting a tmpfs on it.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+registry = CollectorRegistry()
+
+STAGE_SECONDS = Histogram("trader_stage_seconds", "Time spent in each stage of a trading iteration",
+                          ["stage"], buckets=LATENCY_BUCKETS, registry=registry)
+REQUEST_SECONDS = Histogram("trader_request_seconds", "Time spent handling each API endpoint",
+                            ["path"], buckets=LATENCY_BUCKETS, registry=registry)
+REDIS_SECONDS = Histogram("trader_redis_command_seconds", "Round trip of each Redis command",
+                          ["command"], buckets=LATENCY_BUCKETS, registry=registry)
+BATCH_HEADLINES = Histogram("trader_sentiment_batch_headlines", "Headlines scored per model batch",
+                            buckets=BATCH_BUCKETS, registry=registry)
+TRADES = Counter("trader_trades", "Orders submitted by the strategies", ["side"], registry=registry)
+ERRORS = Counter("trader_errors", "Errors caught, by component", ["component"], registry=registry)
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of a trading iteration, both in STAGE_SECONDS and as a span of the trace the
+    current thread is recording, if any.
+    """
+    with tracer.span(name), STAGE_SECONDS.labels(name).time():
+        yield
+
+
+class StatsCollector:
+    """
+    Exports the numbers returned by the components' `stats()` as gauges, read when scraped.
+
+    Queue depths, cache sizes and the like are already tracked by the components; reading them
+    at scrape time adds nothing to the code paths that update them.
+
+    With session workers, the components running along the sessions (news feed and trigger,
+    sentiment cache and batcher, tracer) are idle in the API process. They are read from every
+    worker through `workers` instead, and each gauge is labelled with the process it comes from.
+
+    Attributes:
+        prefix (str): Prefix of the exported metric names.
+        workers (callable): Returns the `read(sessions=True)` of every session worker, or None
+            when the sessions run in this process.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.workers = None
+        self._sources = {}
+        self._sessions = set()
+
+    def add(self, name, stats, sessions=False):
+        """
+        Parameters:
+            name (str): Name of the component, part of its metric names.
+            stats (callable): Returns a dict; its int and float values are exported.
+            sessions (bool): The component runs along the trading sessions.
+        """
+        self._sources[name] = stats
+        if sessions:
+            self._sessions.add(name)
+
+    def read(self, sessions=None):
+        """
+        Parameters:
+            sessions (bool): Only read the components running along the sessions if True, only
+                the others if False, all of them if None.
+
+        Returns:
+            dict: The numbers of each component, by component name.
+        """
+        read = {}
+        for name, stats in list(self._sources.items()):
+            if sessions is not None and (name in self._sessions) != sessions:
+                continue
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting the stats of {name}: {e}")
+                continue
+            read[name] = {key: value for key, value in values.items()
+                          if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "status"}
+        return read
+
+    def collect(self):
+        if self.workers is None:
+            for name, values in self.read().items():
+                for key, value in values.items():
+                    yield GaugeMetricFamily(f"{self.prefix}_{name}_{key}", f"{key} of {name}", value=value)
+            return
+        processes = [("api", self.read(sessions=False))]
+        try:
+            processes += [(f"session-worker-{index}", read) for index, read in enumerate(self.workers())]
+        except Exception as e:
+            print(f"Error collecting the stats of the session workers: {e}")
+        families = {}
+        for process, read in processes:
+            for name, values in read.items():
+                for key, value in values.items():
+                    metric = f"{self.prefix}_{name}_{key}"
+                    if metric not in families:
+                        families[metric] = GaugeMetricFamily(metric, f"{key} of {name}", labels=["process"])
+                    families[metric].add_metric([process], value)
+        yield from families.values()
+
+
+stats = StatsCollector("trader")
+registry.register(stats)
+
+if PROMETHEUS_MULTIPROC_DIR:
+    # The histograms and counters of every process, read from their files, plus this one's gauges.
+    scraped = CollectorRegistry()
+    multiprocess.MultiProcessCollector(scraped)
+    scraped.register(stats)
+else:
+    scraped = registry
+
+
+def exposition():
+    """
+    Returns:
+        tuple: The body and content type of a scrape of every metric.
+    """
+    return generate_latest(scraped), CONTENT_TYPE_LATEST
+
+
+class TimedRedis(redis.StrictRedis):
+    """
+    Redis client recording the round trip of every command it sends outside of a pipeline.
+    """
+    def execute_command(self, *args, **options):
+        with REDIS_SECONDS.labels(str(args[0]).lower()).time():
+            return super().execute_command(*args, **options)
+
+
+class TimedAsyncRedis(aioredis.Redis):
+    """
+    Asyncio counterpart of TimedRedis.
+    """
+    async def execute_command(self, *args, **options):
+        with REDIS_SECONDS.labels(str(args[0]).lower()).time():
+            return await super().execute_command(*args, **options)
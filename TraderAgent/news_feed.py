@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from metrics import stage
+
+
+NEWS_WINDOW_DAYS = int(os.getenv("NEWS_WINDOW_DAYS", 3))
+NEWS_LIMIT = int(os.getenv("NEWS_LIMIT", 10))
+NEWS_REFRESH_SECONDS = float(os.getenv("NEWS_REFRESH_SECONDS", 60))
+# Windows no session has read for this long are dropped. Sessions read every 24H, so keep more.
+NEWS_IDLE_SECONDS = float(os.getenv("NEWS_IDLE_SECONDS", 2 * 24 * 3600))
+# Largest page Alpaca's news endpoint returns.
+NEWS_MAX_PAGE = 50
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def format_timestamp(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SymbolWindow:
+    """
+    Rolling window of the news items of one symbol.
+
+    Attributes:
+        items (dict): News items keyed by their Alpaca id, as (created_at, headline) tuples.
+        newest (datetime): Creation time of the newest item seen, where the next fetch starts.
+        fetched_at (float): Monotonic time of the last fetch, or None before the first one.
+        read_at (float): Monotonic time a session last asked for the window.
+    """
+    def __init__(self):
+        self.items = {}
+        self.newest = None
+        self.fetched_at = None
+        self.read_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class NewsFeed:
+    """
+    Keeps a rolling news window per symbol, shared by every strategy trading that symbol.
+
+    The first request for a symbol fetches the whole window; later ones only ask Alpaca for items
+    created since the newest item already held, and not more often than every
+    `refresh_seconds`. Items older than the window are evicted on every read, and the windows of
+    symbols no session has read for `idle_seconds` are dropped.
+
+    Attributes:
+        window (timedelta): How far back headlines are kept.
+        limit (int): Maximum number of headlines served (and fetched per call), newest first.
+        refresh_seconds (float): Minimum delay between two fetches of the same symbol.
+        idle_seconds (float): How long the window of a symbol nobody reads is kept.
+    """
+    def __init__(self, window=timedelta(days=NEWS_WINDOW_DAYS), limit=NEWS_LIMIT, refresh_seconds=NEWS_REFRESH_SECONDS,
+                 idle_seconds=NEWS_IDLE_SECONDS):
+        self.window = window
+        self.limit = limit
+        self.refresh_seconds = refresh_seconds
+        self.idle_seconds = idle_seconds
+        self.api_calls = 0
+        self.reads = 0
+        self.evicted = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def headlines(self, symbol, api, now=None):
+        """
+        Returns the newest headlines of a symbol within the window ending at `now`.
+
+        Parameters:
+            symbol (str): Ticker symbol.
+            api (alpaca_trade_api.REST): Client used if the window needs refreshing.
+            now (datetime): End of the window, timezone-aware. Defaults to the current time.
+
+        Returns:
+            list[str]: Up to `limit` headlines, newest first.
+        """
+        return self.headlines_many([symbol], api, now)[symbol]
+
+    def headlines_many(self, symbols, api, now=None):
+        """
+        Returns the newest headlines of several symbols, refreshing the stale windows in a
+        single Alpaca call.
+
+        The call is made for all stale symbols at once, with a page of up to NEWS_MAX_PAGE items,
+        so a symbol with much more news than the others may take a larger share of it.
+
+        Returns:
+            dict: Up to `limit` headlines of each symbol, newest first.
+        """
+        now = now or datetime.now(timezone.utc)
+        symbols = sorted(set(symbols))
+        read_at = time.monotonic()
+        with self._lock:
+            self._evict_idle(read_at)
+            windows = {symbol: self._windows.setdefault(symbol, SymbolWindow()) for symbol in symbols}
+            for window in windows.values():
+                window.read_at = read_at
+
+        # Locks are always taken in symbol order, so concurrent baskets cannot deadlock.
+        for symbol in symbols:
+            windows[symbol].lock.acquire()
+        try:
+            self.reads += len(symbols)
+            stale = {symbol: window for symbol, window in windows.items()
+                     if window.fetched_at is None or time.monotonic() - window.fetched_at >= self.refresh_seconds}
+            if stale:
+                self._refresh(stale, api, now)
+            return {symbol: self._read(window, now) for symbol, window in windows.items()}
+        finally:
+            for symbol in symbols:
+                windows[symbol].lock.release()
+
+    def add(self, symbol, item_id, created_at, headline):
+        """
+        Adds a news item pushed by a stream to the window of its symbol.
+
+        Where the next refresh starts is left alone, so items the stream missed are still
+        fetched; the ones it delivered are deduplicated by id. Items of symbols without a window
+        are dropped: the first read of the symbol fetches them anyway.
+        """
+        with self._lock:
+            window = self._windows.get(symbol)
+        if window is None:
+            return
+        with window.lock:
+            window.items[item_id] = (created_at, headline)
+
+    def stats(self):
+        return {"symbols": len(self._windows), "reads": self.reads, "api_calls": self.api_calls, "evicted": self.evicted}
+
+    def _evict_idle(self, now):
+        idle = [symbol for symbol, window in self._windows.items() if now - window.read_at >= self.idle_seconds]
+        for symbol in idle:
+            del self._windows[symbol]
+        self.evicted += len(idle)
+
+    def _read(self, window, now):
+        oldest = now - self.window
+        for item_id in [item_id for item_id, (created_at, _) in window.items.items() if created_at < oldest]:
+            del window.items[item_id]
+        newest_first = sorted(window.items.values(), key=lambda item: item[0], reverse=True)
+        return [headline for created_at, headline in newest_first if created_at <= now][:self.limit]
+
+    def _refresh(self, windows, api, now):
+        starts = [window.newest if window.newest is not None else now - self.window for window in windows.values()]
+        with stage("get_news"):
+            news = api.get_news(symbol=",".join(windows), start=format_timestamp(min(starts)),
+                                limit=min(NEWS_MAX_PAGE, self.limit * len(windows)))
+        self.api_calls += 1
+        fetched_at = time.monotonic()
+        for window in windows.values():
+            window.fetched_at = fetched_at
+        for ev in news:
+            raw = ev.__dict__["_raw"]
+            created_at = parse_timestamp(raw["created_at"])
+            # Items of a single-symbol request belong to that symbol whatever else they mention.
+            for symbol in windows if len(windows) == 1 else set(raw.get("symbols", ())) & set(windows):
+                window = windows[symbol]
+                window.items[raw["id"]] = (created_at, raw["headline"])
+                if window.newest is None or created_at > window.newest:
+                    window.newest = created_at
+
+
+news_feed = NewsFeed()
@@ -0,0 +1,322 @@
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+
+# "off" keeps the 24H timer only; "stream" listens to Alpaca's news stream; "replay" plays a
+# JSONL file of Alpaca news items, e.g. to test or measure the strategy offline.
+NEWS_TRIGGER = os.getenv("NEWS_TRIGGER", "off")
+NEWS_DEBOUNCE_SECONDS = float(os.getenv("NEWS_DEBOUNCE_SECONDS", 2))
+NEWS_MAX_WAIT_SECONDS = float(os.getenv("NEWS_MAX_WAIT_SECONDS", 10))
+NEWS_MIN_INTERVAL_SECONDS = float(os.getenv("NEWS_MIN_INTERVAL_SECONDS", 300))
+NEWS_TRIGGER_WORKERS = int(os.getenv("NEWS_TRIGGER_WORKERS", 8))
+NEWS_STREAM_API_KEY = os.getenv("NEWS_STREAM_API_KEY")
+NEWS_STREAM_API_SECRET = os.getenv("NEWS_STREAM_API_SECRET")
+NEWS_REPLAY_PATH = os.getenv("NEWS_REPLAY_PATH")
+NEWS_REPLAY_SPEED = float(os.getenv("NEWS_REPLAY_SPEED", 1))
+LATENCY_SAMPLES = 1000
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class NewsEvent:
+    """
+    Headlines of a session's symbols coalesced into one re-evaluation.
+
+    Attributes:
+        arrived_at (float): Monotonic time the first of these headlines arrived.
+        symbols (set): Symbols the headlines were about.
+        headlines (int): Number of headlines coalesced.
+        due (float): Monotonic time the re-evaluation is scheduled for.
+        held_until (float): Monotonic time before which the re-evaluation may not run, if it was
+            held, e.g. until the market opens.
+    """
+    def __init__(self, arrived_at, symbol):
+        self.arrived_at = arrived_at
+        self.symbols = {symbol}
+        self.headlines = 1
+        self.due = None
+        self.held_until = None
+
+
+class NewsTrigger:
+    """
+    Turns incoming headlines into re-evaluations of the sessions trading their symbols.
+
+    A headline schedules a re-evaluation of every session subscribed to its symbol, `debounce`
+    seconds later. Headlines arriving in the meantime push it back, so a burst of news about a
+    symbol causes one re-evaluation, but never more than `max_wait` seconds after the first one.
+    A session is not re-evaluated within `min_interval` seconds of its previous iteration, so it
+    cannot trade more often than that on news; the re-evaluation is deferred, not dropped.
+    A session may also `hold` a re-evaluation it cannot run yet, e.g. while the market is closed;
+    headlines arriving until then are coalesced into it.
+
+    Re-evaluations are run on a small thread pool, off the thread that schedules them.
+
+    Attributes:
+        debounce (float): Quiet time after a headline before re-evaluating.
+        max_wait (float): Longest a re-evaluation is pushed back by further headlines.
+        min_interval (float): Minimum time between two iterations of a session.
+        feed (NewsFeed): Feed incoming headlines are also added to, if any, so the re-evaluation
+            sees them without waiting for the feed's next refresh.
+    """
+    def __init__(self, debounce=NEWS_DEBOUNCE_SECONDS, max_wait=NEWS_MAX_WAIT_SECONDS,
+                 min_interval=NEWS_MIN_INTERVAL_SECONDS, workers=NEWS_TRIGGER_WORKERS, feed=None):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.min_interval = min_interval
+        self.feed = feed
+        self.source = None
+        self.headlines = 0
+        self.triggers = 0
+        self.coalesced = 0
+        self.deferred = 0
+        self.held = 0
+        self.evaluation_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.order_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._subscribers = {}
+        self._by_symbol = defaultdict(set)
+        self._pending = {}
+        self._last_run = {}
+        self._heap = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="news-trigger")
+        self._thread = None
+
+    def subscribe(self, key, symbols, callback):
+        """
+        Re-evaluates a session on news about its symbols.
+
+        Parameters:
+            key (str): Identifies the session, e.g. its session ID.
+            symbols (list[str]): Symbols the session trades.
+            callback (callable): Called with a NewsEvent to re-evaluate the session.
+        """
+        with self._condition:
+            self.unsubscribe(key)
+            self._subscribers[key] = (list(symbols), callback)
+            for symbol in symbols:
+                self._by_symbol[symbol].add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="news-trigger", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, key):
+        with self._condition:
+            symbols, _ = self._subscribers.pop(key, ((), None))
+            for symbol in symbols:
+                self._by_symbol[symbol].discard(key)
+                if not self._by_symbol[symbol]:
+                    del self._by_symbol[symbol]
+            self._pending.pop(key, None)
+            self._last_run.pop(key, None)
+
+    def start(self, source):
+        """
+        Starts feeding the trigger from a source, unless one was already started.
+        """
+        with self._condition:
+            if self.source is not None:
+                return
+            self.source = source
+        source.start(self)
+
+    def publish(self, symbol, headline, item_id=None, created_at=None):
+        """
+        Hands an incoming headline to the trigger.
+
+        Parameters:
+            symbol (str): Symbol the headline is about.
+            headline (str): The headline.
+            item_id: Identifier of the news item, used to add it to the feed.
+            created_at (datetime): When the item was published, timezone-aware.
+        """
+        arrived_at = time.monotonic()
+        if self.feed is not None and item_id is not None:
+            self.feed.add(symbol, item_id, created_at or datetime.now(timezone.utc), headline)
+        with self._condition:
+            self.headlines += 1
+            for key in self._by_symbol.get(symbol, ()):
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = NewsEvent(arrived_at, symbol)
+                else:
+                    event.symbols.add(symbol)
+                    event.headlines += 1
+                    self.coalesced += 1
+                due = min(arrived_at + self.debounce, event.arrived_at + self.max_wait)
+                earliest = self._last_run.get(key, float("-inf")) + self.min_interval
+                if earliest > due:
+                    if event.due is None or event.due < earliest:
+                        self.deferred += 1
+                    due = earliest
+                if event.held_until is not None:
+                    due = max(due, event.held_until)
+                event.due = due
+                heapq.heappush(self._heap, (due, key))
+            self._condition.notify()
+
+    def hold(self, key, event, seconds):
+        """
+        Schedules a re-evaluation the session could not run again, `seconds` from now.
+
+        Parameters:
+            key (str): The session.
+            event (NewsEvent): The event it was called with.
+            seconds (float): How long to hold it, e.g. until the market opens.
+        """
+        with self._condition:
+            if key not in self._subscribers:
+                return
+            pending = self._pending.get(key)
+            if pending is not None:
+                event.symbols |= pending.symbols
+                event.headlines += pending.headlines
+            event.held_until = event.due = time.monotonic() + seconds
+            self._pending[key] = event
+            self.held += 1
+            heapq.heappush(self._heap, (event.due, key))
+            self._condition.notify()
+
+    def ran(self, key):
+        """
+        Records that a session just iterated, whatever triggered it.
+        """
+        with self._condition:
+            if key in self._subscribers:
+                self._last_run[key] = time.monotonic()
+
+    def ordered(self, event):
+        """
+        Records that a re-evaluation submitted an order, measuring the headline-to-order latency.
+        """
+        if event is not None:
+            self.order_latencies.append(time.monotonic() - event.arrived_at)
+
+    def stats(self):
+        return {
+            "mode": getattr(self.source, "name", None),
+            "subscribers": len(self._subscribers),
+            "pending": len(self._pending),
+            "headlines": self.headlines,
+            "triggers": self.triggers,
+            "coalesced": self.coalesced,
+            "deferred": self.deferred,
+            "held": self.held,
+            "evaluation_latency_p50": percentile(self.evaluation_latencies, .5),
+            "order_latency_p50": percentile(self.order_latencies, .5),
+            "order_latency_p99": percentile(self.order_latencies, .99),
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    # Entries whose event was rescheduled, run or unsubscribed are stale.
+                    while self._heap and (self._pending.get(self._heap[0][1]) is None
+                                          or self._pending[self._heap[0][1]].due != self._heap[0][0]):
+                        heapq.heappop(self._heap)
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+                _, key = heapq.heappop(self._heap)
+                event = self._pending.pop(key)
+                self._last_run[key] = now
+                _, callback = self._subscribers[key]
+                self.triggers += 1
+            self._executor.submit(self._evaluate, key, callback, event)
+
+    def _evaluate(self, key, callback, event):
+        self.evaluation_latencies.append(time.monotonic() - event.arrived_at)
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"Error re-evaluating session {key} on news: {e}")
+
+
+class AlpacaNewsSource:
+    """
+    Feeds a NewsTrigger from Alpaca's real-time news stream, subscribed to every symbol.
+    """
+    name = "stream"
+
+    def __init__(self, api_key=NEWS_STREAM_API_KEY, api_secret=NEWS_STREAM_API_SECRET):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.stream = None
+
+    def start(self, trigger):
+        from alpaca_trade_api.stream import Stream
+
+        async def on_news(news):
+            created_at = news.created_at
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00")) if isinstance(created_at, str) else created_at
+            for symbol in news.symbols:
+                trigger.publish(symbol, news.headline, news.id, created_at)
+
+        def run():
+            # The stream runs its own event loop, in this thread.
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.stream = Stream(self.api_key, self.api_secret)
+            self.stream.subscribe_news(on_news, "*")
+            self.stream.run()
+
+        threading.Thread(target=run, name="news-stream", daemon=True).start()
+
+
+class ReplaySource:
+    """
+    Feeds a NewsTrigger from a JSONL file of Alpaca news items, keeping the delays between
+    their creation times divided by `speed`. Items are stamped with the time they are replayed.
+    """
+    name = "replay"
+
+    def __init__(self, path=NEWS_REPLAY_PATH, speed=NEWS_REPLAY_SPEED):
+        self.path = path
+        self.speed = speed
+        self.replayed = 0
+        self.done = threading.Event()
+
+    def items(self):
+        with open(self.path) as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        for item in items:
+            item["created_at"] = datetime.fromisoformat(item["created_at"].replace("Z", "+00:00"))
+        return sorted(items, key=lambda item: item["created_at"])
+
+    def start(self, trigger):
+        threading.Thread(target=self.replay, args=(trigger,), name="news-replay", daemon=True).start()
+
+    def replay(self, trigger):
+        items = self.items()
+        started = time.monotonic()
+        for i, item in enumerate(items):
+            delay = (item["created_at"] - items[0]["created_at"]).total_seconds() / self.speed
+            time.sleep(max(0, started + delay - time.monotonic()))
+            for symbol in item.get("symbols", ()):
+                trigger.publish(symbol, item["headline"], item.get("id", f"replay-{i}"), datetime.now(timezone.utc))
+            self.replayed += 1
+        self.done.set()
+
+
+def make_source(mode=NEWS_TRIGGER):
+    """
+    Returns the source selected by `NEWS_TRIGGER`, or None when event-driven mode is off.
+    """
+    if mode == "stream":
+        return AlpacaNewsSource()
+    if mode == "replay":
+        return ReplaySource()
+    return None
@@ -0,0 +1,447 @@
+import hashlib
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import BATCH_HEADLINES, ERRORS, TimedRedis, stage
+from sentiment_cache import SentimentCache
+
+
+MODEL_NAME = "mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis"
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch")
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", "./onnx")
+SENTIMENT_ONNX_THREADS = int(os.getenv("SENTIMENT_ONNX_THREADS", 0))
+SENTIMENT_MAX_LENGTH = int(os.getenv("SENTIMENT_MAX_LENGTH", 128))
+SENTIMENT_LENGTH_BUCKETS = [int(edge) for edge in os.getenv("SENTIMENT_LENGTH_BUCKETS", "16,32,64").split(",")]
+SENTIMENT_BUCKET_SIZE = int(os.getenv("SENTIMENT_BUCKET_SIZE", 32))
+SENTIMENT_MAX_BATCH = int(os.getenv("SENTIMENT_MAX_BATCH", 64))
+SENTIMENT_MAX_WAIT_MS = float(os.getenv("SENTIMENT_MAX_WAIT_MS", 5))
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", 10000))
+SENTIMENT_CACHE_TTL = int(os.getenv("SENTIMENT_CACHE_TTL", 7 * 24 * 3600))
+
+labels = ["negative", "neutral", "positive"]
+
+
+class Backend:
+    """
+    Base class of the inference backends selectable through `SENTIMENT_BACKEND`.
+
+    Subclasses implement `score`, which turns headlines into per-label logits.
+    """
+    name = None
+
+    def score(self, news):
+        """
+        Scores a list of headlines.
+
+        Parameters:
+            news (list[str]): Headlines to score.
+
+        Returns:
+            list[list[float]]: Logits of each headline, one value per label.
+        """
+        raise NotImplementedError
+
+    def aggregate(self, rows):
+        """
+        Aggregates per-headline logits into a single (probability, sentiment) pair.
+
+        The logits are summed over headlines and then passed through a softmax, which is the
+        aggregation the strategy has always used.
+
+        Parameters:
+            rows (list[list[float]]): Logits of each headline.
+
+        Returns:
+            tuple: The probability of the winning label and the label itself.
+        """
+        summed = [sum(column) for column in zip(*rows)]
+        top = max(summed)
+        exps = [math.exp(value - top) for value in summed]
+        best = exps.index(max(exps))
+        return exps[best] / sum(exps), labels[best]
+
+
+class StubBackend(Backend):
+    """
+    Model-free backend used by tests and local runs: it never imports torch or transformers.
+
+    Each headline gets deterministic pseudo-logits derived from its hash, so results are stable
+    across runs and processes.
+    """
+    name = "stub"
+
+    def score(self, news):
+        rows = []
+        for headline in news:
+            digest = hashlib.sha256(headline.encode("utf-8")).digest()
+            rows.append([(digest[i] - 128) / 32 for i in range(len(labels))])
+        return rows
+
+
+def bucket_by_length(lengths, edges=SENTIMENT_LENGTH_BUCKETS, bucket_size=SENTIMENT_BUCKET_SIZE):
+    """
+    Groups sequences of similar length so that each group is padded only to its own longest one.
+
+    Every sequence goes to the first bucket whose edge is at least its length (sequences longer
+    than the last edge share a final bucket), and buckets holding more than `bucket_size`
+    sequences are split.
+
+    Parameters:
+        lengths (list[int]): Token count of each sequence.
+        edges (list[int]): Upper bounds of the buckets, in increasing order.
+        bucket_size (int): Maximum number of sequences per group.
+
+    Returns:
+        list[list[int]]: Indices into `lengths`, one list per group, shortest sequences first.
+    """
+    buckets = [[] for _ in range(len(edges) + 1)]
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        buckets[next((b for b, edge in enumerate(edges) if lengths[i] <= edge), len(edges))].append(i)
+    return [bucket[start:start + bucket_size] for bucket in buckets for start in range(0, len(bucket), bucket_size)]
+
+
+class TokenizedBackend(Backend):
+    """
+    Base class of the backends running the real tokenizer and model.
+
+    Headlines are tokenized once with truncation to SENTIMENT_MAX_LENGTH tokens, grouped by
+    length with `bucket_by_length`, and each group is padded and run separately. The logits are
+    put back in the original order, so callers never see the bucketing.
+    """
+    tensor_type = None
+
+    def forward(self, batch):
+        """
+        Runs the model on one padded batch and returns its logits as a list of rows.
+        """
+        raise NotImplementedError
+
+    def score(self, news):
+        input_ids = self.tokenizer(news, truncation=True, max_length=SENTIMENT_MAX_LENGTH)["input_ids"]
+        rows = [None] * len(news)
+        for bucket in bucket_by_length([len(ids) for ids in input_ids]):
+            batch = self.tokenizer.pad({"input_ids": [input_ids[i] for i in bucket],
+                                        "attention_mask": [[1] * len(input_ids[i]) for i in bucket]},
+                                       padding=True, return_tensors=self.tensor_type)
+            for i, row in zip(bucket, self.forward(batch)):
+                rows[i] = row
+        return rows
+
+
+class TorchBackend(TokenizedBackend):
+    """
+    The fine-tuned distilroberta model run through PyTorch.
+    """
+    name = "torch"
+    tensor_type = "pt"
+
+    def __init__(self):
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        import torch
+
+        self.torch = torch
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        self.model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).to(self.device)
+        self.model.eval()
+
+    def forward(self, batch):
+        batch = batch.to(self.device)
+        with self.torch.no_grad():
+            result = self.model(batch["input_ids"], attention_mask=batch["attention_mask"])["logits"]
+        return result.cpu().tolist()
+
+    def aggregate(self, rows):
+        torch = self.torch
+        result = torch.nn.functional.softmax(torch.sum(torch.tensor(rows, dtype=torch.float32), 0), dim=-1)
+        best = int(torch.argmax(result))
+        # A plain float, like the other backends, so it can be stored and serialized as is.
+        return float(result[best]), labels[best]
+
+
+def onnx_model_path(quantized=False):
+    return os.path.join(SENTIMENT_ONNX_DIR, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def export_onnx(quantized=False):
+    """
+    Exports the PyTorch model to ONNX, optionally followed by dynamic int8 quantization.
+
+    The export needs torch and transformers. It only runs once per SENTIMENT_ONNX_DIR, later
+    processes load the files written here.
+
+    Parameters:
+        quantized (bool): Also write the int8 weight-quantized model.
+
+    Returns:
+        str: Path of the requested model file.
+    """
+    path = onnx_model_path()
+    if not os.path.exists(path):
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        import torch
+
+        os.makedirs(SENTIMENT_ONNX_DIR, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).eval()
+        tokens = tokenizer(["Stock market today: S&P 500, Nasdaq hit fresh records"], return_tensors="pt")
+        dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "logits": {0: "batch"}}
+        torch.onnx.export(model, (tokens["input_ids"], tokens["attention_mask"]), path,
+                          input_names=["input_ids", "attention_mask"], output_names=["logits"],
+                          dynamic_axes=dynamic_axes, opset_version=17, dynamo=False)
+
+    if not quantized:
+        return path
+    quantized_path = onnx_model_path(quantized=True)
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+class OnnxBackend(TokenizedBackend):
+    """
+    The same model exported to ONNX and run through ONNX Runtime on the CPU.
+
+    Only the tokenizer comes from transformers; torch is needed once, to export the model when
+    SENTIMENT_ONNX_DIR does not hold it yet.
+    """
+    name = "onnx"
+    tensor_type = "np"
+    quantized = False
+
+    def __init__(self):
+        from transformers import AutoTokenizer
+        import onnxruntime
+
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        options = onnxruntime.SessionOptions()
+        if SENTIMENT_ONNX_THREADS:
+            options.intra_op_num_threads = SENTIMENT_ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(export_onnx(self.quantized), options,
+                                                    providers=["CPUExecutionProvider"])
+
+    def forward(self, batch):
+        logits, = self.session.run(["logits"], {"input_ids": batch["input_ids"].astype("int64"),
+                                                "attention_mask": batch["attention_mask"].astype("int64")})
+        return logits.tolist()
+
+
+class QuantizedOnnxBackend(OnnxBackend):
+    """
+    ONNX backend with int8 dynamically quantized weights: smaller and faster, slightly less exact.
+    """
+    name = "onnx-int8"
+    quantized = True
+
+
+BACKENDS = {
+    "stub": StubBackend,
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+    "onnx-int8": QuantizedOnnxBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+model_load_seconds = None
+
+
+def get_backend():
+    """
+    Returns the inference backend selected by `SENTIMENT_BACKEND`, loading it on first use.
+
+    Supported values are "torch" (default), "onnx", "onnx-int8" and "stub".
+    """
+    global _backend, model_load_seconds
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            started = time.perf_counter()
+            backend = BACKENDS[SENTIMENT_BACKEND]()
+            model_load_seconds = time.perf_counter() - started
+            print(f"Sentiment backend '{backend.name}' loaded in {model_load_seconds:.2f}s")
+            _backend = backend
+    return _backend
+
+
+def is_ready():
+    return _backend is not None
+
+
+def warmup():
+    """
+    Loads the backend and runs one forward pass so the first real request does not pay for it.
+
+    Returns:
+        dict: Seconds spent loading the model and running the warm-up inference.
+    """
+    backend = get_backend()
+    started = time.perf_counter()
+    backend.score(["Stock market today: S&P 500, Nasdaq hit fresh records"])
+    return {"backend": backend.name,
+            "model_load_seconds": model_load_seconds,
+            "warmup_seconds": time.perf_counter() - started}
+
+
+def score_headlines(news):
+    return get_backend().score(news)
+
+
+class SentimentBatcher:
+    """
+    Collects sentiment requests coming from every running strategy and scores them together.
+
+    Each call to `score` enqueues its headlines and blocks until a background worker has run
+    them through the model. The worker waits up to `max_wait_ms` after the first pending request
+    for more requests to arrive, concatenates their headlines into one padded batch of at most
+    `max_batch` headlines, and hands each caller back the logits of its own headlines.
+
+    Attributes:
+        max_batch (int): Maximum number of headlines merged into one forward pass.
+        max_wait_ms (float): How long the worker waits for more requests before scoring.
+    """
+    def __init__(self, score_fn=score_headlines, max_batch=SENTIMENT_MAX_BATCH, max_wait_ms=SENTIMENT_MAX_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.requests = 0
+        self.batches = 0
+        self.headlines = 0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, news):
+        """
+        Enqueues a list of headlines and returns a future resolved with their logits.
+        """
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((list(news), future))
+        return future
+
+    def score(self, news):
+        return self.submit(news).result()
+
+    def stats(self):
+        return {"requests": self.requests, "batches": self.batches, "headlines": self.headlines,
+                "queue_depth": self._queue.qsize()}
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="sentiment-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        if self._carry is not None:
+            pending, self._carry = [self._carry], None
+        else:
+            pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[0]) > self.max_batch:
+                # Keep the oversized request for the next batch instead of growing this one.
+                self._carry = item
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            news = [headline for headlines, _ in pending for headline in headlines]
+            try:
+                with stage("model_batch"):
+                    logits = self.score_fn(news)
+            except Exception as e:
+                ERRORS.labels("sentiment").inc()
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            BATCH_HEADLINES.observe(len(news))
+            self.requests += len(pending)
+            self.batches += 1
+            self.headlines += len(news)
+            offset = 0
+            for headlines, future in pending:
+                future.set_result(logits[offset:offset + len(headlines)])
+                offset += len(headlines)
+
+
+batcher = SentimentBatcher()
+cache = SentimentCache(
+    TimedRedis(host="redis", port=6379, decode_responses=True),
+    max_entries=SENTIMENT_CACHE_SIZE,
+    ttl=SENTIMENT_CACHE_TTL,
+    # Truncation changes the logits: a new max length must not read the old ones.
+    namespace=f"sentiment:logits:{SENTIMENT_BACKEND}:{MODEL_NAME}:{SENTIMENT_MAX_LENGTH}",
+)
+
+
+def headline_logits(news):
+    """
+    Returns the logits of each headline, read from the cache or scored through the batcher.
+    """
+    rows = cache.get_many(news)
+    missing = list(dict.fromkeys(headline for headline, row in zip(news, rows) if row is None))
+    if missing:
+        scored = dict(zip(missing, batcher.score(missing)))
+        cache.put_many(missing, [scored[headline] for headline in missing])
+        rows = [scored[headline] if row is None else row for headline, row in zip(news, rows)]
+    return rows
+
+
+def estimate_sentiment(news):
+    if news:
+        return get_backend().aggregate(headline_logits(news))
+    else:
+        return 0, labels[-1]
+
+
+def logits_by_key(news_by_key):
+    """
+    Returns the logits of several lists of headlines, looked up in the cache and scored through
+    the batcher together, so a basket of symbols costs one batch rather than one per symbol.
+
+    Parameters:
+        news_by_key (dict): Headlines keyed by e.g. symbol.
+
+    Returns:
+        dict: The logits of each key's headlines.
+    """
+    unique = list(dict.fromkeys(headline for news in news_by_key.values() for headline in news))
+    logits = dict(zip(unique, headline_logits(unique))) if unique else {}
+    return {key: [logits[headline] for headline in news] for key, news in news_by_key.items()}
+
+
+def estimate_sentiments(news_by_key):
+    """
+    Returns:
+        dict: The (probability, sentiment) of each key, as `estimate_sentiment` returns it.
+    """
+    backend = get_backend()
+    return {key: backend.aggregate(rows) if rows else (0, labels[-1])
+            for key, rows in logits_by_key(news_by_key).items()}
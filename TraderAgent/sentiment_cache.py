@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import redis
+
+
+class SentimentCache:
+    """
+    Two-tier cache of per-headline logits keyed by a hash of the headline text.
+
+    The first tier is an in-process LRU, the second one lives in the shared Redis instance so
+    that every TraderAgent process (and restarts) benefit from headlines scored elsewhere. Redis
+    failures are counted and treated as misses: the cache never prevents a headline from being
+    scored.
+
+    Attributes:
+        redis_client (redis.StrictRedis): Client used for the shared tier, or None to disable it.
+        max_entries (int): Capacity of the in-process LRU.
+        ttl (int): Expiry in seconds of the Redis entries.
+        namespace (str): Prefix of the Redis keys, so logits of different models never mix.
+    """
+    def __init__(self, redis_client=None, max_entries=10000, ttl=7 * 24 * 3600, namespace="sentiment:logits"):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.redis_errors = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(headline):
+        return hashlib.sha256(headline.encode("utf-8")).hexdigest()
+
+    def get_many(self, headlines):
+        """
+        Looks up the logits of several headlines.
+
+        Parameters:
+            headlines (list[str]): Headlines to look up.
+
+        Returns:
+            list: For each headline, its logits as a list of floats, or None on a miss.
+        """
+        keys = [self.key(headline) for headline in headlines]
+        found = [None] * len(keys)
+        remote = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                logits = self._entries.get(key)
+                if logits is not None:
+                    self._entries.move_to_end(key)
+                    found[i] = logits
+                    self.hits_local += 1
+                else:
+                    remote.append(i)
+
+        if remote and self.redis_client is not None:
+            try:
+                values = self.redis_client.mget([f"{self.namespace}:{keys[i]}" for i in remote])
+            except redis.RedisError:
+                self.redis_errors += 1
+                values = [None] * len(remote)
+            with self._lock:
+                for i, value in zip(remote, values):
+                    if value is not None:
+                        found[i] = json.loads(value)
+                        self._remember(keys[i], found[i])
+                        self.hits_redis += 1
+
+        self.misses += sum(1 for logits in found if logits is None)
+        return found
+
+    def put_many(self, headlines, logits):
+        """
+        Stores freshly computed logits in both tiers.
+
+        Parameters:
+            headlines (list[str]): Scored headlines.
+            logits (list[list[float]]): Logits of each headline, in the same order.
+        """
+        keys = [self.key(headline) for headline in headlines]
+        with self._lock:
+            for key, row in zip(keys, logits):
+                self._remember(key, row)
+
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, row in zip(keys, logits):
+                    pipe.set(f"{self.namespace}:{key}", json.dumps(row), ex=self.ttl)
+                pipe.execute()
+            except redis.RedisError:
+                self.redis_errors += 1
+
+    def stats(self):
+        return {
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "size": len(self._entries),
+        }
+
+    def _remember(self, key, logits):
+        self._entries[key] = logits
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
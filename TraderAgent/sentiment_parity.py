@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+
+import sentiment
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parity_headlines.txt")
+
+
+def load_corpus(path=CORPUS_PATH):
+    """
+    Reads the fixed headline corpus, one headline per line, ignoring blank lines and comments.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def check_parity(reference, candidate, corpus):
+    """
+    Compares the labels two backends assign to every headline of the corpus and to the corpus
+    as a whole.
+
+    Parameters:
+        reference (sentiment.Backend): Backend considered correct, usually the PyTorch one.
+        candidate (sentiment.Backend): Backend under test.
+        corpus (list[str]): Headlines to score.
+
+    Returns:
+        dict: Number of headlines, label mismatches, largest logit difference and whether the
+        aggregated sentiment matches.
+    """
+    reference_rows = reference.score(corpus)
+    candidate_rows = candidate.score(corpus)
+
+    mismatches = []
+    max_logit_diff = 0.0
+    for headline, expected, actual in zip(corpus, reference_rows, candidate_rows):
+        expected_label = sentiment.labels[expected.index(max(expected))]
+        actual_label = sentiment.labels[actual.index(max(actual))]
+        if expected_label != actual_label:
+            mismatches.append({"headline": headline, "expected": expected_label, "actual": actual_label})
+        max_logit_diff = max(max_logit_diff, *(abs(a - b) for a, b in zip(expected, actual)))
+
+    return {
+        "headlines": len(corpus),
+        "mismatches": mismatches,
+        "max_logit_diff": max_logit_diff,
+        "aggregate_matches": reference.aggregate(reference_rows)[1] == candidate.aggregate(candidate_rows)[1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that a sentiment backend labels the parity corpus like the PyTorch model.")
+    parser.add_argument("backend", choices=sorted(sentiment.BACKENDS), help="Backend to check")
+    parser.add_argument("--reference", default="torch", choices=sorted(sentiment.BACKENDS))
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    report = check_parity(sentiment.BACKENDS[args.reference](), sentiment.BACKENDS[args.backend](), corpus)
+
+    print(f"{args.backend} vs {args.reference}: {len(report['mismatches'])}/{report['headlines']} label mismatches, "
+          f"max logit difference {report['max_logit_diff']:.4f}, aggregate {'matches' if report['aggregate_matches'] else 'DIFFERS'}")
+    for mismatch in report["mismatches"]:
+        print(f"  {mismatch['expected']} -> {mismatch['actual']}: {mismatch['headline']}")
+    sys.exit(1 if report["mismatches"] or not report["aggregate_matches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
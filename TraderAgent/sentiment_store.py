@@ -0,0 +1,224 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from sentiment import labels
+
+
+SENTIMENT_STORE_DIR = os.getenv("SENTIMENT_STORE_DIR", "./sentiment_store")
+
+# One raw, append-only file per column and symbol.
+COLUMNS = {
+    "days": (np.int32, ()),
+    "logits": (np.float32, (len(labels),)),
+    "probability": (np.float32, ()),
+    "label": (np.int8, ()),
+}
+
+
+def to_days(values):
+    return np.asarray(values, dtype="datetime64[D]").astype(np.int32)
+
+
+class SentimentSeries:
+    """
+    Daily sentiment of one symbol over a range of days.
+
+    Attributes:
+        days (numpy.ndarray): Days, as datetime64[D], in increasing order.
+        logits (numpy.ndarray): Summed logits of each day's headlines, one column per label.
+        probability (numpy.ndarray): Probability of each day's label.
+        label (numpy.ndarray): Index of each day's label in `sentiment.labels`.
+    """
+    def __init__(self, days, logits, probability, label):
+        self.days = days.astype("datetime64[D]")
+        self.logits = logits
+        self.probability = probability
+        self.label = label
+
+    def __len__(self):
+        return len(self.days)
+
+    def labels(self):
+        return [labels[index] for index in self.label]
+
+    def lookup(self):
+        """
+        Returns:
+            dict: The (probability, label) of every day, keyed by datetime64[D] day.
+        """
+        return {day: (float(probability), labels[label])
+                for day, probability, label in zip(self.days, self.probability, self.label)}
+
+
+class SentimentStore:
+    """
+    Per-symbol, per-day aggregated sentiment kept in columnar files on disk.
+
+    Each symbol has a directory holding one raw array file per column. New days are appended to
+    the end of the files, and reads memory-map them and binary-search the requested range, so
+    reading a year of a symbol costs a few page faults rather than parsing or model calls.
+
+    Days of a symbol are kept sorted: writing days after the last stored one appends, writing
+    the last stored day again overwrites it in place (e.g. as the day's news comes in), and
+    writing earlier days rewrites the symbol's files.
+
+    Session worker processes share the files, so writes hold an exclusive `flock` on the
+    symbol's lock file, and reads open the columns under a shared one. A reader reopens them
+    once another process has changed them.
+
+    Attributes:
+        root (str): Directory the symbols' files are kept in.
+    """
+    def __init__(self, root=SENTIMENT_STORE_DIR):
+        self.root = root
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        # Skips the staging directory of the rewrites.
+        return sorted(name for name in os.listdir(self.root) if not name.startswith("."))
+
+    def append(self, symbol, day, logits, probability, label):
+        """
+        Writes the sentiment of one day.
+
+        Parameters:
+            symbol (str): The symbol.
+            day (datetime.date): The day.
+            logits (list[float]): Summed logits of the day's headlines.
+            probability (float): Probability of the day's label.
+            label (str): The day's label.
+        """
+        self.put(symbol, [day], [logits], [probability], [labels.index(label)])
+
+    def put(self, symbol, days, logits, probability, label):
+        """
+        Writes the sentiment of several days of a symbol, replacing the days already stored.
+
+        Parameters:
+            label (list[int]): Index of each day's label in `sentiment.labels`.
+        """
+        rows = {
+            "days": to_days(days),
+            "logits": np.asarray(logits, dtype=np.float32).reshape(-1, len(labels)),
+            "probability": np.asarray(probability, dtype=np.float32),
+            "label": np.asarray(label, dtype=np.int8),
+        }
+        order = np.argsort(rows["days"], kind="stable")
+        rows = {name: column[order] for name, column in rows.items()}
+        if len(rows["days"]) == 0:
+            return
+        with self._lock, self._flock(symbol, fcntl.LOCK_EX):
+            self._maps.pop(symbol, None)
+            stored = self._load(symbol)
+            count = len(stored["days"])
+            last = stored["days"][-1] if count else None
+            first = rows["days"][0]
+            if last is None or first > last:
+                self._write(symbol, rows, mode="ab")
+            elif first == last and len(rows["days"]) == 1:
+                self._overwrite_last(symbol, rows, count)
+            else:
+                keep = ~np.isin(stored["days"], rows["days"])
+                merged = {name: np.concatenate([np.asarray(stored[name])[keep], rows[name]]) for name in COLUMNS}
+                order = np.argsort(merged["days"], kind="stable")
+                self._rewrite(symbol, {name: column[order] for name, column in merged.items()})
+
+    def read(self, symbol, start=None, end=None):
+        """
+        Reads the days of a symbol between `start` and `end`, both included.
+
+        Returns:
+            SentimentSeries: The stored days in that range, possibly none.
+        """
+        with self._lock:
+            version, columns = self._maps.get(symbol, (None, None))
+            if columns is None or version != self._version(symbol):
+                with self._flock(symbol, fcntl.LOCK_SH):
+                    version = self._version(symbol)
+                    columns = self._load(symbol)
+                self._maps[symbol] = version, columns
+        days = columns["days"]
+        lo = 0 if start is None else int(np.searchsorted(days, to_days(start), side="left"))
+        hi = len(days) if end is None else int(np.searchsorted(days, to_days(end), side="right"))
+        return SentimentSeries(*(columns[name][lo:hi] for name in COLUMNS))
+
+    def read_many(self, symbols, start=None, end=None):
+        return {symbol: self.read(symbol, start, end) for symbol in symbols}
+
+    def _path(self, symbol, name):
+        return os.path.join(self.root, symbol, f"{name}.bin")
+
+    def _version(self, symbol):
+        # Changes with every append, in-place overwrite (mtime) and rewrite (inode).
+        try:
+            stat = os.stat(self._path(symbol, "days"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @contextmanager
+    def _flock(self, symbol, operation):
+        directory = os.path.join(self.root, symbol)
+        if operation == fcntl.LOCK_SH and not os.path.isdir(directory):
+            # Nothing to read, and no directory should be created for it.
+            yield
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "lock"), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self, symbol):
+        counts = []
+        for name, (dtype, shape) in COLUMNS.items():
+            path = self._path(symbol, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // (np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int))))
+        # A write interrupted between two columns leaves some of them longer: ignore the extra rows.
+        count = min(counts)
+        columns = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            if count:
+                columns[name] = np.memmap(self._path(symbol, name), dtype=dtype, mode="r", shape=(count,) + shape)
+            else:
+                columns[name] = np.empty((0,) + shape, dtype=dtype)
+        return columns
+
+    def _write(self, symbol, rows, mode):
+        os.makedirs(os.path.join(self.root, symbol), exist_ok=True)
+        count = len(self._load(symbol)["days"]) if mode == "ab" else 0
+        for name, (dtype, shape) in COLUMNS.items():
+            with open(self._path(symbol, name), mode) as f:
+                if mode == "ab":
+                    # Drop the extra rows an interrupted write may have left.
+                    f.truncate(count * np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int)))
+                f.write(np.ascontiguousarray(rows[name], dtype=dtype).tobytes())
+
+    def _overwrite_last(self, symbol, rows, count):
+        for name in COLUMNS:
+            column = np.memmap(self._path(symbol, name), dtype=COLUMNS[name][0], mode="r+",
+                               shape=(count,) + COLUMNS[name][1])
+            column[-1] = rows[name][0]
+            column.flush()
+            del column
+
+    def _rewrite(self, symbol, rows):
+        # On the filesystem of the symbols, so the files are swapped in by a rename, but out of symbols().
+        temporary = os.path.join(self.root, ".staging", symbol)
+        os.makedirs(temporary, exist_ok=True)
+        for name, (dtype, _) in COLUMNS.items():
+            with open(os.path.join(temporary, f"{name}.bin"), "wb") as f:
+                f.write(np.ascontiguousarray(rows[name], dtype=dtype).tobytes())
+        for name in COLUMNS:
+            os.replace(os.path.join(temporary, f"{name}.bin"), self._path(symbol, name))
+        os.rmdir(temporary)
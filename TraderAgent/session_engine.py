@@ -0,0 +1,120 @@
+import threading
+import time
+
+from metrics import stats as metric_stats
+from tracing import profiler, tracer
+
+
+class TradingSession:
+    """
+    Everything that belongs to one user's running trading session.
+
+    Attributes:
+        chat_id (str): Telegram chat ID owning the session.
+        credentials (dict): Alpaca credentials of that user, in lumibot's format.
+        parameters (dict): Strategy parameters (symbol, amount to spend...).
+        broker (lumibot.brokers.Broker): Broker built from the session's own credentials.
+        strategy (MLStrategy): The running strategy.
+        trader (lumibot.traders.Trader): Trader running only this session's strategy.
+        started_at (float): Wall-clock time the session was started.
+    """
+    def __init__(self, chat_id, credentials, parameters, broker, strategy, trader):
+        self.chat_id = chat_id
+        self.credentials = credentials
+        self.parameters = parameters
+        self.broker = broker
+        self.strategy = strategy
+        self.trader = trader
+        self.started_at = time.time()
+
+    @property
+    def trade_counter(self):
+        return getattr(self.strategy, "trade_counter", 0)
+
+
+class SessionEngine:
+    """
+    Runs one independent trading session per chat ID.
+
+    Each session gets its own broker, credentials and trader from `launch`, so starting or
+    stopping a session is a dictionary operation plus that session's own start-up or shutdown,
+    and never touches the other users' sessions.
+
+    Starting and stopping block on the broker, so the API calls them from a thread, off the
+    event loop. Traces and profiles are taken in the engine's process, where the sessions run.
+
+    Attributes:
+        launch (callable): Called as launch(chat_id, credentials, parameters) and returning the
+            (broker, strategy, trader) of a started session.
+    """
+    def __init__(self, launch):
+        self.launch = launch
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(self, chat_id, credentials, parameters):
+        """
+        Starts a session for a chat ID, stopping the previous one of that chat ID if any.
+
+        Returns:
+            TradingSession: The started session.
+        """
+        self.stop(chat_id)
+        broker, strategy, trader = self.launch(chat_id, credentials, parameters)
+        session = TradingSession(chat_id, credentials, parameters, broker, strategy, trader)
+        with self._lock:
+            # Another start of this chat ID may have finished while this one was launching.
+            previous = self._sessions.get(chat_id)
+            self._sessions[chat_id] = session
+        if previous is not None:
+            previous.trader.stop_all()
+        return session
+
+    def stop(self, chat_id):
+        """
+        Stops the session of a chat ID.
+
+        Returns:
+            TradingSession: The stopped session, or None if that chat ID had none.
+        """
+        with self._lock:
+            session = self._sessions.pop(chat_id, None)
+        if session is not None:
+            session.trader.stop_all()
+        tracer.drop(chat_id)
+        return session
+
+    def trace(self, chat_id, chrome=False):
+        """
+        Returns:
+            The spans recorded for a chat ID's sessions (see Tracer.spans), or their Chrome trace
+            if `chrome`.
+        """
+        return tracer.chrome_trace(chat_id) if chrome else tracer.spans(chat_id)
+
+    def profile(self, seconds, interval):
+        """
+        Samples the stacks of the process running the sessions, see SamplingProfiler.profile.
+        """
+        return profiler.profile(seconds, interval)
+
+    def stats(self):
+        """
+        Returns:
+            dict: The stats of the components running along the sessions in this process, see
+                StatsCollector.read.
+        """
+        return metric_stats.read(sessions=True)
+
+    def get(self, chat_id):
+        return self._sessions.get(chat_id)
+
+    def chat_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._sessions
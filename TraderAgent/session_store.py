@@ -0,0 +1,116 @@
+import json
+import os
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+SESSION_EVENTS_CHANNEL = os.getenv("SESSION_EVENTS_CHANNEL", "session_events")
+
+
+class SessionRecord(BaseModel):
+    """
+    Everything stored in Redis for one user, under the hash named after their chat ID.
+
+    Every field is stored JSON-encoded, so booleans and missing values come back typed instead of
+    as "true" or "null" strings.
+    """
+    # Legacy records hold amounts as bare numbers, e.g. 1000 instead of "1000".
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    chat_id: str
+    api_key: str
+    api_secret: str
+    session_alive: bool = False
+    ticker: Optional[str] = None
+    end_time: Optional[str] = None
+    amount_to_spend: Optional[str] = None
+
+
+SESSION_FIELDS = ("session_alive", "ticker", "end_time", "amount_to_spend")
+
+
+def encode(fields):
+    return {key: json.dumps(value) for key, value in fields.items()}
+
+
+def decode(data):
+    fields = {}
+    for key, value in data.items():
+        try:
+            fields[key] = json.loads(value)
+        except ValueError:
+            # Records written before the store existed hold some raw, unquoted strings.
+            fields[key] = value
+    return fields
+
+
+class SessionStore:
+    """
+    Typed access to the per-user session records kept in Redis.
+
+    Writes send the whole change in one pipelined round trip, and `get_many` reads any number of
+    records in one round trip as well. Every write also announces the chat ID on `channel`, so
+    the Bot can drop its cached copy of that record.
+
+    Attributes:
+        redis (redis.asyncio.Redis): Client the records are read from and written to.
+        channel (str): Pub/sub channel the chat IDs of changed records are published on.
+    """
+    def __init__(self, redis, channel=SESSION_EVENTS_CHANNEL):
+        self.redis = redis
+        self.channel = channel
+
+    async def save(self, record):
+        """
+        Writes a whole record, replacing the previous one of that chat ID.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(record.chat_id)
+            pipe.hset(record.chat_id, mapping=encode(record.model_dump(exclude={"chat_id"})))
+            pipe.publish(self.channel, record.chat_id)
+            await pipe.execute()
+
+    async def update(self, chat_id, **fields):
+        """
+        Overwrites some fields of an existing record.
+        """
+        unknown = set(fields) - set(SessionRecord.model_fields)
+        if unknown:
+            raise ValueError(f"Unknown session fields: {sorted(unknown)}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(chat_id, mapping=encode(fields))
+            pipe.publish(self.channel, chat_id)
+            await pipe.execute()
+
+    async def clear_session(self, chat_id):
+        """
+        Marks the session of a chat ID as stopped, keeping its credentials.
+        """
+        await self.update(chat_id, session_alive=False, ticker=None, end_time=None, amount_to_spend=None)
+
+    async def get(self, chat_id):
+        """
+        Returns:
+            SessionRecord: The record of the chat ID, or None if it has none.
+        """
+        return self._parse(chat_id, await self.redis.hgetall(chat_id))
+
+    async def get_many(self, chat_ids):
+        """
+        Reads several records in a single round trip.
+
+        Returns:
+            dict: The record of every requested chat ID, None for chat IDs without one.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for chat_id in chat_ids:
+                pipe.hgetall(chat_id)
+            results = await pipe.execute()
+        return {chat_id: self._parse(chat_id, data) for chat_id, data in zip(chat_ids, results)}
+
+    @staticmethod
+    def _parse(chat_id, data):
+        if not data:
+            return None
+        return SessionRecord(chat_id=chat_id, **decode(data))
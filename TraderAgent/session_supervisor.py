@@ -0,0 +1,275 @@
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from multiprocessing.connection import wait
+
+from session_engine import SessionEngine
+from tracing import flame_graph
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    Every node is placed `replicas` times on the ring so keys spread evenly, and adding or
+    removing a node only moves the keys of that node.
+    """
+    def __init__(self, nodes, replicas=100):
+        self._ring = sorted((self._hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+    def node(self, key):
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class RemoteSession:
+    """
+    What the supervisor knows about a session stopped in a worker process.
+    """
+    def __init__(self, chat_id, worker, trade_counter):
+        self.chat_id = chat_id
+        self.worker = worker
+        self.trade_counter = trade_counter
+
+
+def worker_main(commands, replies, launch):
+    """
+    Entry point of a worker process: runs a SessionEngine and executes the commands it receives.
+
+    Trades are published to Redis straight from the strategies running here; only command
+    results travel back through `replies`, the write end of a pipe of this worker's own.
+    """
+    engine = SessionEngine(launch)
+    lock = threading.Lock()
+
+    def reply(request_id, ok, result):
+        with lock:
+            replies.send((request_id, ok, result))
+
+    def profile(request_id, seconds, interval):
+        try:
+            reply(request_id, True, engine.profile(seconds, interval))
+        except Exception as e:
+            reply(request_id, False, repr(e))
+
+    while True:
+        request_id, op, args = commands.get()
+        if op == "shutdown":
+            for chat_id in engine.chat_ids():
+                engine.stop(chat_id)
+            reply(request_id, True, None)
+            return
+        try:
+            if op == "start":
+                engine.start(*args)
+                result = None
+            elif op == "stop":
+                session = engine.stop(*args)
+                result = None if session is None else session.trade_counter
+            elif op == "list":
+                result = engine.chat_ids()
+            elif op == "trace":
+                result = engine.trace(*args)
+            elif op == "stats":
+                result = engine.stats()
+            elif op == "profile":
+                # Sampled in the background, so session commands are still answered meanwhile.
+                threading.Thread(target=profile, args=(request_id, *args), name="session-profile", daemon=True).start()
+                continue
+            else:
+                raise ValueError(f"Unknown command {op}")
+            reply(request_id, True, result)
+        except Exception as e:
+            reply(request_id, False, repr(e))
+
+
+class SessionSupervisor:
+    """
+    Spreads trading sessions over a pool of worker processes, each running its own SessionEngine.
+
+    Sessions are assigned to workers by consistent hashing on the chat ID, so start and stop
+    commands for a chat ID always reach the worker holding its session. The supervisor exposes
+    the same start/stop/get interface as SessionEngine, so the API does not care which one runs.
+
+    Commands block until the worker answers, for at most `timeout` seconds. Every worker answers
+    on a pipe of its own, so one exiting mid-reply cannot jam the others; commands still waiting
+    on it fail right away instead of waiting for the timeout.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        launch (callable): Session launcher, see SessionEngine. It must be importable from the
+            workers, i.e. a module-level function.
+        timeout (float): Seconds to wait for a worker to answer a command.
+    """
+    def __init__(self, workers, launch, timeout=60):
+        self.workers = workers
+        self.launch = launch
+        self.timeout = timeout
+        self.ring = HashRing(range(workers))
+        self._context = multiprocessing.get_context("spawn")
+        self._replies = [None] * workers
+        self._pipes = {}
+        self._commands = [None] * workers
+        self._processes = [None] * workers
+        self._pending = {}
+        self._sessions = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        for index in range(workers):
+            self._spawn(index)
+        self._reader = threading.Thread(target=self._read_replies, name="session-supervisor", daemon=True)
+        self._reader.start()
+
+    def start(self, chat_id, credentials, parameters):
+        worker = self.ring.node(chat_id)
+        self._call(worker, "start", (chat_id, credentials, parameters))
+        with self._lock:
+            self._sessions[chat_id] = worker
+
+    def stop(self, chat_id):
+        worker = self.ring.node(chat_id)
+        trade_counter = self._call(worker, "stop", (chat_id,))
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+        return None if trade_counter is None else RemoteSession(chat_id, worker, trade_counter)
+
+    def get(self, chat_id):
+        return self._sessions.get(chat_id)
+
+    def chat_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def trace(self, chat_id, chrome=False):
+        return self._call(self.ring.node(chat_id), "trace", (chat_id, chrome))
+
+    def profile(self, seconds, interval):
+        """
+        Profiles every worker at once, see SessionEngine.profile. Their stacks are merged, each
+        under a root frame naming its worker; the API process itself is not sampled.
+
+        Returns:
+            dict: The merged profile, or None if a worker is already being profiled.
+        """
+        def call(worker):
+            return self._call(worker, "profile", (seconds, interval), timeout=seconds + self.timeout)
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = list(pool.map(call, range(self.workers)))
+        if any(result is None for result in results):
+            return None
+        folded = Counter()
+        for worker, result in enumerate(results):
+            for stack, count in result["folded"].items():
+                folded[f"session-worker-{worker};{stack}"] += count
+        return {"seconds": results[0]["seconds"], "interval": interval, "workers": self.workers,
+                "samples": sum(result["samples"] for result in results),
+                "folded": dict(folded.most_common()), "flame_graph": flame_graph(folded)}
+
+    def stats(self, timeout=5):
+        """
+        Reads the stats of every worker at once, see SessionEngine.stats.
+
+        Returns:
+            list[dict]: The stats of each worker, by worker index.
+        """
+        def call(worker):
+            return self._call(worker, "stats", (), timeout=timeout)
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(call, range(self.workers)))
+
+    def shutdown(self):
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                self._call(index, "shutdown", ())
+                process.join(self.timeout)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._sessions
+
+    def _spawn(self, index):
+        reader, writer = self._context.Pipe(duplex=False)
+        self._commands[index] = self._context.Queue()
+        self._processes[index] = self._context.Process(target=worker_main, name=f"session-worker-{index}",
+                                                       args=(self._commands[index], writer, self.launch),
+                                                       daemon=True)
+        self._processes[index].start()
+        # Only the worker writes: the pipe reads EOF as soon as it exits.
+        writer.close()
+        self._replies[index] = reader
+        self._pipes[reader] = index
+
+    def _call(self, worker, op, args, timeout=None):
+        failed = []
+        with self._lock:
+            # Its pipe may read EOF before the process is reaped.
+            if not self._processes[worker].is_alive() or self._replies[worker] not in self._pipes:
+                # The sessions of a dead worker are gone: forget them and start a fresh process.
+                print(f"Session worker {worker} died, restarting it.")
+                failed = self._forget(worker, self._replies[worker])
+                self._spawn(worker)
+            future = Future()
+            request_id = next(self._ids)
+            self._pending[request_id] = (self._replies[worker], future)
+        self._fail(failed)
+        self._commands[worker].put((request_id, op, args))
+        try:
+            return future.result(timeout or self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise
+
+    def _forget(self, worker, pipe):
+        """
+        Forgets the sessions of a worker that exited, if it was not restarted since, under the lock.
+
+        Returns:
+            list[Future]: The commands left unanswered on its pipe.
+        """
+        if self._replies[worker] is pipe:
+            self._sessions = {chat_id: w for chat_id, w in self._sessions.items() if w != worker}
+        failed = [request_id for request_id, (replies, _) in self._pending.items() if replies is pipe]
+        return [self._pending.pop(request_id)[1] for request_id in failed]
+
+    @staticmethod
+    def _fail(futures):
+        for future in futures:
+            future.set_exception(RuntimeError("Session worker exited before answering"))
+
+    def _read_replies(self):
+        while True:
+            with self._lock:
+                pipes = list(self._pipes)
+            for pipe in wait(pipes, timeout=1):
+                try:
+                    self._resolve(*pipe.recv())
+                except (EOFError, OSError):
+                    # The worker exited, possibly mid-reply: nothing more will come from it.
+                    with self._lock:
+                        failed = self._forget(self._pipes.pop(pipe), pipe)
+                    pipe.close()
+                    self._fail(failed)
+
+    def _resolve(self, request_id, ok, result):
+        with self._lock:
+            _, future = self._pending.pop(request_id, (None, None))
+        if future is None:
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(result))
@@ -0,0 +1,80 @@
+import math
+import os
+
+
+SENTIMENT_THRESHOLD = .9
+MAX_BASKET_SIZE = int(os.getenv("MAX_BASKET_SIZE", 10))
+
+# Take-profit and stop-loss levels of the bracket orders, as multiples of the entry price.
+BRACKETS = {
+    "buy": (1.20, .95),
+    "sell": (.8, 1.05),
+}
+
+
+def trading_signal(sentiment, probability, last_trade, amount_to_spend, last_price, cash, threshold=SENTIMENT_THRESHOLD):
+    """
+    Decides what MLStrategy does on one trading iteration.
+
+    Kept free of broker calls so live trading and backtests apply exactly the same rules.
+
+    Parameters:
+        sentiment (str): Label of the aggregated news sentiment.
+        probability (float): Probability of that label.
+        last_trade (str): Side of the previous order, "buy", "sell" or None.
+        amount_to_spend (float): Amount the strategy may spend per order.
+        last_price (float): Current price of the symbol.
+        cash (float): Cash available in the account.
+        threshold (float): Probability above which the sentiment is acted on.
+
+    Returns:
+        tuple: Whether to close every position first, and the side of the order to submit
+            ("buy", "sell", or None to do nothing).
+    """
+    if not (amount_to_spend > last_price and amount_to_spend < cash) or probability <= threshold:
+        return False, None
+    if sentiment == "positive":
+        return last_trade == "sell", "buy"
+    if sentiment == "negative":
+        return last_trade == "buy", "sell"
+    return False, None
+
+
+def parse_basket(tickers):
+    """
+    Splits the ticker of a session into the symbols it trades, e.g. "AAPL, msft" into
+    ["AAPL", "MSFT"]. Sessions have always stored a single ticker, which is a basket of one.
+    """
+    return list(dict.fromkeys(symbol.strip().upper() for symbol in tickers.split(",") if symbol.strip()))
+
+
+def basket_signals(sentiments, prices, last_trades, amount_to_spend, cash, threshold=SENTIMENT_THRESHOLD):
+    """
+    Decides the orders of one iteration over a basket of symbols sharing a budget.
+
+    Each symbol may spend an equal share of `amount_to_spend` per order, and the orders are
+    granted in decreasing order of sentiment probability until the cash runs out. A basket of
+    one symbol trades exactly as `trading_signal` decides.
+
+    Parameters:
+        sentiments (dict): The (probability, label) of each symbol.
+        prices (dict): Current price of each symbol.
+        last_trades (dict): Side of the previous order of each symbol.
+        amount_to_spend (float): Amount the whole basket may spend per iteration.
+        cash (float): Cash available in the account.
+        threshold (float): Probability above which the sentiment is acted on.
+
+    Returns:
+        list[tuple]: (symbol, close_first, side, quantity) of each order to submit.
+    """
+    budget = amount_to_spend / len(prices) if prices else 0
+    orders = []
+    for symbol in sorted(prices, key=lambda symbol: sentiments[symbol][0], reverse=True):
+        probability, sentiment = sentiments[symbol]
+        close_first, side = trading_signal(sentiment, probability, last_trades.get(symbol), budget, prices[symbol], cash, threshold)
+        if side is None:
+            continue
+        quantity = math.floor(budget / prices[symbol])
+        orders.append((symbol, close_first, side, quantity))
+        cash -= quantity * prices[symbol]
+    return orders
@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+
+
+TICKER_INDEX_PATH = os.getenv("TICKER_INDEX_PATH", "./ticker_index.json")
+TICKER_INDEX_TTL = float(os.getenv("TICKER_INDEX_TTL", 6 * 3600))
+
+
+def normalize(symbol):
+    # Alpaca writes share classes as BRK.B where Yahoo writes BRK-B.
+    return symbol.strip().upper().replace("-", ".")
+
+
+def alpaca_symbols(api):
+    """
+    Lists the symbols of every active, tradable asset of an Alpaca account.
+    """
+    return [asset.symbol for asset in api.list_assets(status="active") if asset.tradable]
+
+
+class TickerIndex:
+    """
+    In-memory set of the tradable symbols, so validating a ticker needs no network round trip.
+
+    The set is loaded from a snapshot file on startup, so it is usable before the first refresh
+    and without network access, and refreshed in a background thread every `ttl` seconds. Every
+    refresh rewrites the snapshot.
+
+    Attributes:
+        load (callable): Returns the current list of tradable symbols, or None if the index
+            has no source to refresh from.
+        path (str): Snapshot file, or None to keep the index in memory only.
+        ttl (float): Seconds after which the index is refreshed.
+    """
+    def __init__(self, load, path=TICKER_INDEX_PATH, ttl=TICKER_INDEX_TTL):
+        self.load = load
+        self.path = path
+        self.ttl = ttl
+        self.symbols = frozenset()
+        self.loaded_at = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.lookups = 0
+        self.undecided = 0
+        self._stop = threading.Event()
+        self._worker = None
+
+    def lookup(self, symbol):
+        """
+        Parameters:
+            symbol (str): The ticker to check, in Alpaca or Yahoo notation.
+
+        Returns:
+            bool: Whether the symbol is tradable, or None if the index is empty and cannot tell.
+        """
+        self.lookups += 1
+        if not self.symbols:
+            self.undecided += 1
+            return None
+        return normalize(symbol) in self.symbols
+
+    def load_snapshot(self):
+        """
+        Loads the symbols saved by the last refresh, if any.
+
+        Returns:
+            bool: Whether a snapshot was loaded.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable ticker snapshot {self.path}: {e}")
+            return False
+        self.symbols = frozenset(normalize(symbol) for symbol in snapshot["symbols"])
+        self.loaded_at = snapshot["fetched_at"]
+        return True
+
+    def refresh(self):
+        """
+        Reloads the symbols from the source and saves them to the snapshot file.
+
+        Returns:
+            bool: Whether the index was refreshed. On failure the previous symbols are kept.
+        """
+        try:
+            symbols = self.load()
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"Error refreshing the ticker index: {e}")
+            return False
+        if symbols is None:
+            return False
+        self.symbols = frozenset(normalize(symbol) for symbol in symbols)
+        self.loaded_at = time.time()
+        self.refreshes += 1
+        if self.path:
+            self._save_snapshot()
+        return True
+
+    def is_stale(self):
+        return self.loaded_at is None or time.time() - self.loaded_at >= self.ttl
+
+    def start(self):
+        """
+        Loads the snapshot and starts refreshing the index in the background.
+        """
+        self.load_snapshot()
+        if self._worker is None:
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name="ticker-index", daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        self._worker = None
+
+    def stats(self):
+        return {
+            "symbols": len(self.symbols),
+            "age_seconds": None if self.loaded_at is None else time.time() - self.loaded_at,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "lookups": self.lookups,
+            "undecided": self.undecided,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.is_stale():
+                self.refresh()
+            # Retry failed refreshes sooner than a full TTL.
+            delay = self.ttl - (time.time() - self.loaded_at) if self.loaded_at is not None else 0
+            self._stop.wait(min(max(delay, 60), self.ttl))
+
+    def _save_snapshot(self):
+        # Written to a temporary file first so a crash never leaves a truncated snapshot behind.
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump({"fetched_at": self.loaded_at, "symbols": sorted(self.symbols)}, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Error saving the ticker snapshot {self.path}: {e}")
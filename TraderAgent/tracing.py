@@ -0,0 +1,187 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+
+
+TRACE_CAPACITY = int(os.getenv("TRACE_CAPACITY", 2000))
+TRACE_SESSIONS = int(os.getenv("TRACE_SESSIONS", 1000))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+
+class Span:
+    """
+    One timed phase of a trace.
+
+    Attributes:
+        name (str): Name of the phase.
+        start_ns (int): Wall-clock start, in nanoseconds since the epoch.
+        duration_ns (int): Duration, in nanoseconds.
+        depth (int): Nesting depth, 0 for a root span.
+        thread (int): Identifier of the thread the span ran on.
+        args (dict): Extra details, e.g. what triggered an iteration.
+    """
+    __slots__ = ("name", "start_ns", "duration_ns", "depth", "thread", "args")
+
+    def __init__(self, name, start_ns, duration_ns, depth, thread, args):
+        self.name = name
+        self.start_ns = start_ns
+        self.duration_ns = duration_ns
+        self.depth = depth
+        self.thread = thread
+        self.args = args
+
+    def to_dict(self):
+        return {"name": self.name, "start_ns": self.start_ns, "duration_ns": self.duration_ns,
+                "depth": self.depth, "thread": self.thread, "args": self.args}
+
+
+class Tracer:
+    """
+    Records nested timing spans per session, keeping the latest `capacity` spans of each.
+
+    A span opened with a key starts a trace on the current thread; spans opened inside it, on
+    the same thread and without a key, belong to the same session and are nested under it.
+    Spans opened outside of any trace are not recorded, so shared helpers can be instrumented
+    whoever calls them.
+
+    Attributes:
+        capacity (int): Spans kept per session; older ones are dropped.
+        max_sessions (int): Sessions kept; the least recently traced one is dropped beyond it.
+    """
+    def __init__(self, capacity=TRACE_CAPACITY, max_sessions=TRACE_SESSIONS):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, key=None, **args):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if key is None:
+            if not stack:
+                yield
+                return
+            key = stack[-1]
+        stack.append(key)
+        start_ns = time.time_ns()
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration_ns = time.perf_counter_ns() - started
+            stack.pop()
+            self._record(key, Span(name, start_ns, duration_ns, len(stack), threading.get_ident(), args))
+
+    def spans(self, key):
+        """
+        Returns:
+            list[dict]: The recorded spans of a session, ordered by start time.
+        """
+        with self._lock:
+            spans = list(self._buffers.get(key, ()))
+        return [span.to_dict() for span in sorted(spans, key=lambda span: (span.start_ns, span.depth))]
+
+    def chrome_trace(self, key):
+        """
+        Returns the spans of a session in the Chrome trace event format, which chrome://tracing
+        and Perfetto open.
+        """
+        return {
+            "traceEvents": [{"name": span["name"], "ph": "X", "ts": span["start_ns"] / 1000,
+                             "dur": span["duration_ns"] / 1000, "pid": os.getpid(), "tid": span["thread"],
+                             "args": span["args"]} for span in self.spans(key)],
+            "displayTimeUnit": "ms",
+        }
+
+    def drop(self, key):
+        with self._lock:
+            self._buffers.pop(key, None)
+
+    def stats(self):
+        return {"sessions": len(self._buffers), "spans": sum(len(buffer) for buffer in list(self._buffers.values()))}
+
+    def _record(self, key, span):
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = deque(maxlen=self.capacity)
+                if len(self._buffers) > self.max_sessions:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(key)
+            buffer.append(span)
+
+
+def frame_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def flame_graph(folded):
+    """
+    Turns folded stacks into the nested {"name", "value", "children"} tree flame graph viewers
+    (e.g. d3-flame-graph or speedscope) read.
+    """
+    root = {"name": "root", "value": 0, "children": {}}
+    for stack, count in folded.items():
+        root["value"] += count
+        node = root
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"name": frame, "value": 0, "children": {}})
+            node["value"] += count
+
+    def listed(node):
+        return {"name": node["name"], "value": node["value"],
+                "children": [listed(child) for child in node["children"].values()]}
+    return listed(root)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread of the process at a fixed interval.
+
+    Only one profile runs at a time. The thread running the sampler is left out of the samples.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds, interval=0.005):
+        """
+        Samples for `seconds`, blocking the calling thread.
+
+        Returns:
+            dict: The folded stacks ("outer;...;inner" -> samples), their flame graph tree, and
+                the sample count; or None if a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            seconds = min(seconds, PROFILE_MAX_SECONDS)
+            folded = Counter()
+            own = threading.get_ident()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own:
+                        folded[";".join(frame_stack(frame))] += 1
+                samples += 1
+                time.sleep(interval)
+            return {"seconds": seconds, "interval": interval, "samples": samples,
+                    "folded": dict(folded.most_common()), "flame_graph": flame_graph(folded)}
+        finally:
+            self._lock.release()
+
+
+tracer = Tracer()
+profiler = SamplingProfiler()
@@ -0,0 +1,59 @@
+import os
+import time
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+TRADE_STREAM = os.getenv("TRADE_STREAM", "trade_events")
+# Approximate number of events kept in the stream; older ones are trimmed as new ones arrive.
+TRADE_STREAM_MAXLEN = int(os.getenv("TRADE_STREAM_MAXLEN", 100000))
+
+
+class TradeEvent(BaseModel):
+    """
+    An order submitted by a trading session.
+
+    Attributes:
+        qty (int): Number of shares, or None when the whole position is sold.
+        price (float): Last price of the symbol when the order was submitted.
+        timestamp (float): Epoch seconds the order was submitted at.
+    """
+    type: str = "trade"
+    chat_id: str
+    session_id: str
+    side: str
+    qty: Optional[int] = None
+    symbol: str
+    price: float
+    timestamp: float = Field(default_factory=time.time)
+
+
+class RecapEvent(BaseModel):
+    """
+    Summary of a session, sent when it reaches its end time.
+    """
+    type: str = "recap"
+    chat_id: str
+    trades: int
+    cash_value: Optional[str] = None
+    portfolio_value: Optional[str] = None
+    timestamp: float = Field(default_factory=time.time)
+
+
+def to_fields(event):
+    # Stream entries are flat string maps; missing values are sent as empty strings.
+    return {key: "" if value is None else str(value) for key, value in event.model_dump().items()}
+
+
+def publish(redis, event, stream=TRADE_STREAM, maxlen=TRADE_STREAM_MAXLEN):
+    """
+    Appends an event to the trade stream.
+
+    Works with both the synchronous and the asyncio Redis clients: with the latter, the result
+    must be awaited.
+
+    Returns:
+        str: The ID of the stream entry (or an awaitable of it).
+    """
+    return redis.xadd(stream, to_fields(event), maxlen=maxlen, approximate=True)
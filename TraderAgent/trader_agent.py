@@ -1,61 +1,121 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, Response
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
+from typing import List, Optional
 from dotenv import load_dotenv
-import redis
-import json
+import redis.asyncio as aioredis
 import os
-import alpaca_trade_api as tradeapi
 import yfinance as yf
 from lumibot.brokers import Alpaca
-from lumibot.backtesting import YahooDataBacktesting
 from lumibot.strategies.strategy import Strategy
 from lumibot.traders import Trader
 from datetime import datetime 
-from alpaca_trade_api import REST 
 from timedelta import Timedelta 
 import asyncio
-import math
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-
-
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-
-tokenizer = AutoTokenizer.from_pretrained("mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis")
-model = AutoModelForSequenceClassification.from_pretrained("mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis").to(device)
-labels = ["negative", "neutral", "positive"]
+import hmac
+import uuid
+import threading
+import sentiment
+from sentiment import estimate_sentiments, logits_by_key
+from sentiment_store import SentimentStore
+from news_feed import NEWS_LIMIT, news_feed
+from news_trigger import NewsTrigger, make_source
+from session_engine import SessionEngine
+from session_supervisor import SessionSupervisor
+from session_store import SessionRecord, SessionStore
+from alpaca_clients import AlpacaClientRegistry
+from ticker_index import TickerIndex, alpaca_symbols
+from expiry_scheduler import ExpiryScheduler
+from trade_events import RecapEvent, TradeEvent, publish
+from tracing import tracer
+from metrics import ERRORS, REQUEST_SECONDS, TRADES, TimedAsyncRedis, TimedRedis, exposition, stage
+from metrics import stats as metric_stats
+from signals import BRACKETS, MAX_BASKET_SIZE, basket_signals, parse_basket
 
-def estimate_sentiment(news):
-    if news:
-        tokens = tokenizer(news, return_tensors="pt", padding=True).to(device)
-
-        result = model(tokens["input_ids"], attention_mask=tokens["attention_mask"])[
-            "logits"
-        ]
-        result = torch.nn.functional.softmax(torch.sum(result, 0), dim=-1)
-        probability = result[torch.argmax(result)]
-        sentiment = labels[torch.argmax(result)]
-        return probability, sentiment
-    else:
-        return 0, labels[-1]
 
 load_dotenv('./../')
 
-r = redis.StrictRedis(host="redis", port=6379, charset="utf-8", decode_responses=True) #Change to redis for docker
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+# Shared by the request handlers and the session expiry tasks. Requests wait for a free
+# connection instead of opening more than REDIS_MAX_CONNECTIONS.
+r = TimedAsyncRedis(connection_pool=aioredis.BlockingConnectionPool(
+    host="redis", port=6379, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS, timeout=10)) #Change to redis for docker
+# Strategies run in their own threads (or worker processes), outside of the event loop, and
+# append their trades to the trade stream with it.
+r_sync = TimedRedis(host="redis", port=6379, decode_responses=True)
+store = SessionStore(r)
 
 
 BASE_URL_ALPACA = os.getenv("BASE_URL_ALPACA")
-CHAT_ID = ""
-TRADE_COUNTER = 0
-ONGOING_SESSION = {}
+ACCOUNT_SNAPSHOT_TTL = float(os.getenv("ACCOUNT_SNAPSHOT_TTL", 5))
+alpaca_clients = AlpacaClientRegistry(BASE_URL_ALPACA or "https://paper-api.alpaca.markets", snapshot_ttl=ACCOUNT_SNAPSHOT_TTL)
+# Account the tradable asset list is read from. Without one, the ticker index is only loaded
+# from its snapshot and unknown tickers are checked against Yahoo Finance.
+TICKER_INDEX_API_KEY = os.getenv("TICKER_INDEX_API_KEY")
+TICKER_INDEX_API_SECRET = os.getenv("TICKER_INDEX_API_SECRET")
+TRADER_WORKERS = int(os.getenv("TRADER_WORKERS", 0))
+SENTIMENT_WARMUP_ON_STARTUP = os.getenv("SENTIMENT_WARMUP_ON_STARTUP", "false").lower() == "true"
+STARTUP_TIMINGS = {"import_seconds": None, "first_request_seconds": None}
+# Required in the X-Admin-Token header of the admin endpoints, which are disabled without it.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Live sessions record each day's aggregated sentiment, which backtests then read back.
+sentiment_store = SentimentStore()
+# Re-evaluates live sessions when news about their symbols arrives, on top of the 24H timer.
+# The source is started by the first session, in the process that runs it.
+news_trigger = NewsTrigger(feed=news_feed)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global engine
+    if TRADER_WORKERS > 0:
+        # Created here rather than at import time: the workers import this module too.
+        engine = SessionSupervisor(TRADER_WORKERS, launch_session)
+        metric_stats.workers = engine.stats
+    ticker_index.start()
+    expiry.start()
+    if SENTIMENT_WARMUP_ON_STARTUP:
+        # Warm the model in the background so the container accepts requests right away.
+        asyncio.get_running_loop().run_in_executor(None, sentiment.warmup)
+    yield
+    ticker_index.stop()
+    await expiry.stop()
+    if TRADER_WORKERS > 0:
+        metric_stats.workers = None
+        engine.shutdown()
+    await r.aclose()
+
+def load_tradable_symbols():
+    if not (TICKER_INDEX_API_KEY and TICKER_INDEX_API_SECRET):
+        return None
+    return alpaca_symbols(alpaca_clients.client(TICKER_INDEX_API_KEY, TICKER_INDEX_API_SECRET))
+
+ticker_index = TickerIndex(load_tradable_symbols)
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Labelled by route template, so /checkcredentials/{chat_id} is one series.
+    route = request.scope.get("route")
+    if route is not None:
+        REQUEST_SECONDS.labels(route.path).observe(time.perf_counter() - started)
+    return response
 
-ALPACA_CREDS = {
-    "API_KEY":None, 
-    "API_SECRET": None, 
-    "PAPER": True
-}
 
-app = FastAPI()
+@app.middleware("http")
+async def record_first_request(request: Request, call_next):
+    response = await call_next(request)
+    if STARTUP_TIMINGS["first_request_seconds"] is None:
+        STARTUP_TIMINGS["first_request_seconds"] = time.perf_counter() - _import_started
+        print(f"First request served {STARTUP_TIMINGS['first_request_seconds']:.2f}s after import started")
+    return response
 
 class Credentials(BaseModel):
     chat_id: str
@@ -67,122 +127,234 @@ class Ticker(BaseModel):
     
 class Session(BaseModel):
     chat_id: str
-    session_alive: bool
-    ticker: str
-    end_time: str
-    amount_to_spend: str
+    session_alive: bool = False
+    ticker: Optional[str] = None
+    end_time: Optional[str] = None
+    amount_to_spend: Optional[str] = None
+
+class ChatIds(BaseModel):
+    chat_ids: List[str]
+
+class ProfileRequest(BaseModel):
+    seconds: float = 10
+    interval_ms: float = 5
 
 
 class MLStrategy(Strategy):
-    def initialize(self, symbol, amount_to_spend): 
-        self.symbol = symbol
+    def initialize(self, symbol, amount_to_spend, chat_id, api_key, api_secret, session_id=None): 
+        # A comma-separated ticker is a basket, traded by one session under a shared budget.
+        self.symbols = parse_basket(symbol)
         self.sleeptime = "24H"
-        self.last_trade = None 
+        self.last_trades = dict.fromkeys(self.symbols)
         self.amount_to_spend = float(amount_to_spend)
-        self.api = REST(base_url=BASE_URL_ALPACA, key_id=ALPACA_CREDS["API_KEY"], secret_key=ALPACA_CREDS["API_SECRET"])
-
-    def position_sizing(self): 
-        last_price = self.get_last_price(self.symbol)
-        quantity = math.floor(self.amount_to_spend / last_price)
-        return self.amount_to_spend, last_price, quantity
+        self.chat_id = chat_id
+        self.session_id = session_id or uuid.uuid4().hex
+        self.trade_counter = 0
+        self.api = alpaca_clients.client(api_key, api_secret)
+        # Held by every iteration, timer or news, and by the strategy's shutdown.
+        self.iteration_lock = threading.Lock()
+        self.stopped = False
+        source = None if self.is_backtesting else make_source()
+        if source is not None:
+            news_trigger.subscribe(self.session_id, self.symbols, self.on_news)
+            news_trigger.start(source)
+
+    def on_abrupt_closing(self):
+        self.stop_news()
+
+    def on_strategy_end(self):
+        self.stop_news()
+
+    def stop_news(self):
+        news_trigger.unsubscribe(self.session_id)
+        # Waits for a news iteration in progress, and keeps one already handed out from trading.
+        with self.iteration_lock:
+            self.stopped = True
+
+    def publish_trade(self, symbol, side, quantity, last_price):
+        self.trade_counter += 1
+        with tracer.span("publish_trade"):
+            publish(r_sync, TradeEvent(chat_id=self.chat_id, session_id=self.session_id, side=side,
+                                       qty=quantity, symbol=symbol, price=last_price))
+
+    def get_prices(self):
+        if len(self.symbols) == 1:
+            with stage("get_last_price"):
+                return {self.symbols[0]: self.get_last_price(self.symbols[0])}
+        # One quote request for the whole basket.
+        with stage("get_last_price"):
+            prices = self.get_last_prices(self.symbols)
+        return {getattr(asset, "symbol", asset): price for asset, price in prices.items() if price is not None}
 
     def get_dates(self): 
         today = self.get_datetime()
         three_days_prior = today - Timedelta(days=3)
         return today.strftime('%Y-%m-%d'), three_days_prior.strftime('%Y-%m-%d')
 
-    def get_sentiment(self): 
-        today, three_days_prior = self.get_dates()
-        news = self.api.get_news(symbol=self.symbol, 
-                                 start=three_days_prior, 
-                                 end=today) 
-        news = [ev.__dict__["_raw"]["headline"] for ev in news]
-        probability, sentiment = estimate_sentiment(news)
-        return probability, sentiment 
+    def get_sentiments(self): 
+        if self.is_backtesting:
+            today, three_days_prior = self.get_dates()
+            # As many headlines as each symbol would get on its own, so the first ones of the
+            # basket do not take them all.
+            with stage("get_news"):
+                news = self.api.get_news(symbol=",".join(self.symbols), 
+                                         start=three_days_prior, 
+                                         end=today,
+                                         limit=NEWS_LIMIT * len(self.symbols)) 
+            news_by_symbol = {symbol: [] for symbol in self.symbols}
+            for ev in news:
+                raw = ev.__dict__["_raw"]
+                for symbol in self.symbols if len(self.symbols) == 1 else set(raw.get("symbols", ())) & set(self.symbols):
+                    if len(news_by_symbol[symbol]) < NEWS_LIMIT:
+                        news_by_symbol[symbol].append(raw["headline"])
+            with stage("estimate_sentiment"):
+                return estimate_sentiments(news_by_symbol)
+        # Live sessions share one rolling window per symbol instead of refetching 3 days of news.
+        news_by_symbol = news_feed.headlines_many(self.symbols, self.api, self.get_datetime())
+        backend = sentiment.get_backend()
+        sentiments = {}
+        with stage("estimate_sentiment"):
+            logits = logits_by_key(news_by_symbol)
+        with tracer.span("record_sentiment"):
+            for symbol, rows in logits.items():
+                if not rows:
+                    sentiments[symbol] = 0, sentiment.labels[-1]
+                    continue
+                sentiments[symbol] = probability, label = backend.aggregate(rows)
+                try:
+                    sentiment_store.append(symbol, self.get_datetime().date(), [sum(column) for column in zip(*rows)],
+                                           probability, label)
+                except OSError as e:
+                    ERRORS.labels("sentiment_store").inc()
+                    print(f"Could not record the sentiment of {symbol}: {e}")
+        return sentiments
+
+    def close_symbol(self, symbol):
+        if len(self.symbols) == 1:
+            self.sell_all()
+            return
+        for order in self.get_orders():
+            if order.asset.symbol == symbol:
+                self.cancel_order(order)
+        position = self.get_position(symbol)
+        if position is not None and position.quantity:
+            side = "sell" if position.quantity > 0 else "buy"
+            self.submit_order(self.create_order(symbol, abs(position.quantity), side))
 
     def on_trading_iteration(self):
-        global TRADE_COUNTER
-        amount_to_spend, last_price, quantity = self.position_sizing() 
-        probability, sentiment = self.get_sentiment()
-        cash = self.get_cash()
-
-        if amount_to_spend > last_price and amount_to_spend < cash: 
-
-            if sentiment == "positive" and probability > .9: 
-                if self.last_trade == "sell": 
-                    self.sell_all() 
-                    TRADE_COUNTER += 1
-                    trade_info = f'SELL all shares of {self.symbol} at {last_price}$ 💰# {CHAT_ID}'
-                    r.publish('trade_channel',trade_info)
+        self.iterate()
+
+    def on_news(self, event):
+        # News comes in at any hour, but lumibot only runs the timer while the market is open:
+        # hold the re-evaluation until it opens too.
+        if not self.broker.is_market_open():
+            news_trigger.hold(self.session_id, event, max(self.broker.get_time_to_open() or 0, 60))
+            return
+        self.iterate(event)
+
+    def iterate(self, event=None):
+        # The timer and the news trigger run iterations from different threads.
+        with self.iteration_lock:
+            if self.stopped:
+                return
+            with tracer.span("iteration", key=self.chat_id, trigger="news" if event else "timer"):
+                news_trigger.ran(self.session_id)
+                self.trade(event)
+
+    def trade(self, event=None):
+        with tracer.span("sizing"):
+            prices = self.get_prices()
+        with tracer.span("sentiment"):
+            sentiments = self.get_sentiments()
+        with stage("get_cash"):
+            cash = self.get_cash()
+
+        with tracer.span("decide"):
+            orders = basket_signals(sentiments, prices, self.last_trades, self.amount_to_spend, cash)
+        for symbol, close_first, side, quantity in orders:
+            last_price = prices[symbol]
+            if close_first: 
+                with tracer.span("close_position", symbol=symbol):
+                    self.close_symbol(symbol) 
+                self.publish_trade(symbol, "sell", None, last_price)
+            take_profit, stop_loss = BRACKETS[side]
+            if side == "buy": 
                 order = self.create_order(
-                    asset=self.symbol, 
+                    asset=symbol, 
                     quantity=quantity, 
                     side="buy",
-                    take_profit_price=round(last_price*1.20, 2), 
-                    stop_loss_price=round(last_price*.95, 2),
+                    take_profit_price=round(last_price*take_profit, 2), 
+                    stop_loss_price=round(last_price*stop_loss, 2),
                 )
-                self.submit_order(order) 
-                TRADE_COUNTER += 1
-                trade_info = f'BUY {quantity} shares of {self.symbol} at {last_price}$ 💸# {CHAT_ID}'
-                r.publish('trade_channel',trade_info)
-                self.last_trade = "buy"
-            elif sentiment == "negative" and probability > .9: 
-                if self.last_trade == "buy": 
-                    self.sell_all() 
-                    TRADE_COUNTER += 1
-                    trade_info = f'SELL all shares of {self.symbol} at {last_price}$ 💰# {CHAT_ID}'
-                    r.publish('trade_channel',trade_info)
+            else: 
                 order = self.create_order(
-                    self.symbol, 
+                    symbol, 
                     quantity, 
                     "sell", 
                     type="bracket", 
-                    take_profit_price=last_price*.8, 
-                    stop_loss_price=last_price*1.05
+                    take_profit_price=last_price*take_profit, 
+                    stop_loss_price=last_price*stop_loss
                 )
+            with stage("submit_order"):
                 self.submit_order(order) 
-                TRADE_COUNTER += 1
-                trade_info = f'SELL {quantity} shares of {self.symbol} at {last_price}$ 💰# {CHAT_ID}'
-                r.publish('trade_channel',trade_info)
-                self.last_trade = "sell"
+            TRADES.labels(side).inc()
+            news_trigger.ordered(event)
+            self.publish_trade(symbol, side, quantity, last_price)
+            self.last_trades[symbol] = side
             
 
-trader = Trader()
+def launch_session(chat_id, credentials, parameters):
+    broker = Alpaca(credentials)
+    strategy = MLStrategy(name=f'mlstrat-{chat_id}', broker=broker, 
+                parameters={**parameters, "chat_id": chat_id, "session_id": uuid.uuid4().hex,
+                            "api_key": credentials["API_KEY"], "api_secret": credentials["API_SECRET"]})
+    trader = Trader()
+    trader.add_strategy(strategy)
+    trader.run_all_async()
+    return broker, strategy, trader
+
+
+engine = SessionEngine(launch_session)
 
 @app.get("/checkcredentials/{chat_id}")
 async def check_credentials(chat_id: str):
     try:
-        data_from_redis = r.hgetall(chat_id)
-        if data_from_redis == {}:
+        record = await store.get(chat_id)
+        if record is None:
             return {"message": "No credentials found", "status": 404}
-        data = {key: value.strip('"') for key, value in data_from_redis.items()}
+        data = record.model_dump(exclude={"chat_id"})
         data['status'] = 200
         return data
     except Exception as e:
+        ERRORS.labels("check_credentials").inc()
+        return {"message": "Error retrieving credentials", "status": 500}
+
+
+@app.post("/checkcredentials/")
+async def check_credentials_batch(request_body: ChatIds):
+    try:
+        records = await store.get_many(request_body.chat_ids)
+        sessions = {chat_id: record.model_dump(exclude={"chat_id"}) if record else None 
+                    for chat_id, record in records.items()}
+        return {"sessions": sessions, "status": 200}
+    except Exception as e:
+        ERRORS.labels("check_credentials").inc()
         return {"message": "Error retrieving credentials", "status": 500}
     
 
 @app.post("/verifyandstorecredentials/")
 async def verify_and_store_credentials(request_body: Credentials):
     try:
-        api = tradeapi.REST(request_body.api_key, request_body.api_secret, base_url="https://paper-api.alpaca.markets")
-        account = api.get_account()
-
-        data = {
-            'api_key': request_body.api_key,
-            'api_secret': request_body.api_secret
-        }
+        account = await alpaca_clients.account(request_body.api_key, request_body.api_secret)
 
         try:
-            for key, value in data.items():
-                r.hset(request_body.chat_id, key, value)
-            for key in ['session_alive','ticker','end_time','amount_to_spend']:
-                r.hset(request_body.chat_id, key, json.dumps(None))
+            await store.save(SessionRecord(chat_id=request_body.chat_id, 
+                                           api_key=request_body.api_key, 
+                                           api_secret=request_body.api_secret))
         except Exception as e:
+            ERRORS.labels("store_credentials").inc()
             return {"message": "Error storing credentials"}
         
-        ALPACA_CREDS["API_KEY"] = request_body.api_key
-        ALPACA_CREDS["API_SECRET"] = request_body.api_secret
         # If the account information is successfully retrieved, return a success message
         return {"message": "Credentials verified, account is active and not restricted from trading.",
                 "status": 200}
@@ -191,138 +363,204 @@ async def verify_and_store_credentials(request_body: Credentials):
                 "status": 404}
     
 
+@app.get("/ready")
+async def ready():
+    return {"status": 200 if sentiment.is_ready() else 503,
+            "ready": sentiment.is_ready(),
+            "backend": sentiment.SENTIMENT_BACKEND,
+            "model_load_seconds": sentiment.model_load_seconds,
+            **STARTUP_TIMINGS}
+
+
+@app.post("/warmup")
+async def warmup():
+    try:
+        timings = await asyncio.to_thread(sentiment.warmup)
+        return {"status": 200, "message": "Model warmed up", **timings}
+    except Exception as e:
+        return {"status": 500, "message": "Error warming up the model"}
+
+
+@app.get("/metrics")
+async def metrics():
+    # With session workers, a scrape waits on their stats: keep it off the loop.
+    body, content_type = await asyncio.to_thread(exposition)
+    return Response(body, media_type=content_type)
+
+
+@app.get("/sentiment/stats")
+async def sentiment_stats():
+    return {"cache": sentiment.cache.stats(), "batcher": sentiment.batcher.stats(), "status": 200}
+
+
+@app.get("/alpaca/stats")
+async def alpaca_stats():
+    return {**alpaca_clients.stats(), "status": 200}
+
+
+@app.get("/news/stats")
+async def news_stats():
+    return {**news_feed.stats(), "status": 200}
+
+
+@app.get("/news/trigger/stats")
+async def news_trigger_stats():
+    return {**news_trigger.stats(), "status": 200}
+
+
+@app.get("/sessions/{chat_id}/trace")
+async def session_trace(chat_id: str, format: str = "json"):
+    # Recorded where the session runs, which may be a worker process.
+    chrome = format == "chrome"
+    trace = await asyncio.to_thread(engine.trace, chat_id, chrome)
+    if not (trace["traceEvents"] if chrome else trace):
+        return {"status": 404, "message": "No trace for this session"}
+    if chrome:
+        # Served as is, so it can be saved and opened in chrome://tracing or Perfetto.
+        return trace
+    return {"chat_id": chat_id, "spans": trace, "status": 200}
+
+
+@app.post("/admin/profile/")
+async def profile(request_body: ProfileRequest, request: Request):
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return {"status": 403, "message": "Forbidden"}
+    # Samples the processes running the sessions: this one, or every worker.
+    result = await asyncio.to_thread(engine.profile, request_body.seconds, request_body.interval_ms / 1000)
+    if result is None:
+        return {"status": 409, "message": "A profile is already running"}
+    return {**result, "status": 200}
+
+
+@app.get("/sessions/expiry/stats")
+async def expiry_stats():
+    return {**expiry.stats(), "status": 200}
+
+
+@app.get("/tickers/stats")
+async def ticker_stats():
+    return {**ticker_index.stats(), "status": 200}
+
+
 @app.post("/check_ticker/")
 async def check_ticker(request_body: Ticker):
     try:
-        existingTicker = yf.Ticker(request_body.ticker)
-        hist = existingTicker.history(period="1d")
-        if hist.empty: 
-            return {"status": 404, "message": "Ticker not found"}
+        symbols = parse_basket(request_body.ticker)
+        if not symbols or len(symbols) > MAX_BASKET_SIZE:
+            return {"status": 400, "message": f"Expected between 1 and {MAX_BASKET_SIZE} tickers"}
+        for symbol in symbols:
+            exists = ticker_index.lookup(symbol)
+            if exists is None:
+                # The index is not loaded yet: ask Yahoo Finance about this one ticker.
+                existingTicker = yf.Ticker(symbol)
+                hist = await asyncio.to_thread(existingTicker.history, period="1d")
+                exists = not hist.empty
+            if not exists:
+                return {"status": 404, "message": f"Ticker {symbol} not found" if len(symbols) > 1 else "Ticker not found"}
         return {"status": 200, "message": "Ticker exists"}
     except Exception as e:
+        ERRORS.labels("check_ticker").inc()
         return {"status": 500, "message": "Internal server error"}
 
 
 @app.post("/store_and_start_new_session/")
 async def store_and_start_new_session(request_body: Session):
-    global CHAT_ID
     try:
-        global trader
-
-        data_from_redis = r.hgetall(request_body.chat_id)
-        if data_from_redis == {}:
+        record = await store.get(request_body.chat_id)
+        if record is None:
             return {"message": "No credentials found", "status": 404}
         
 
-        api = tradeapi.REST(data_from_redis['api_key'], data_from_redis['api_secret'], base_url="https://paper-api.alpaca.markets")
-        total_cash = api.get_account().cash
+        # The session spends from this cash: not from a snapshot predating the last trades.
+        total_cash = (await alpaca_clients.account(record.api_key, record.api_secret, fresh=True)).cash
         if float(request_body.amount_to_spend) > float(total_cash):
             return {"status": 403, "message": "Insufficient funds"}
         
-        ALPACA_CREDS["API_KEY"] = data_from_redis['api_key']
-        ALPACA_CREDS["API_SECRET"] = data_from_redis['api_secret']
-
-        broker = Alpaca(ALPACA_CREDS)
-        strategy = MLStrategy(name='mlstrat', broker=broker, 
-                    parameters={"symbol":request_body.ticker, 
-                                "amount_to_spend": request_body.amount_to_spend})        
-
-        trader.add_strategy(strategy)
-        trader.run_all_async()
-
-        data = {
-            'session_alive': request_body.session_alive,
-            'ticker': request_body.ticker,
-            'end_time': request_body.end_time,
-            'amount_to_spend': request_body.amount_to_spend
+        credentials = {
+            "API_KEY": record.api_key, 
+            "API_SECRET": record.api_secret, 
+            "PAPER": True
         }
-        
-        for key, value in data.items():
-            if type(value) == str:
-                r.hset(request_body.chat_id, key, value)
-            else:
-                r.hset(request_body.chat_id, key, json.dumps(value))     #Maybe need to change to value only and json.dumps because it add "" to the value
-                
-        # Convert end_time to a datetime object
-        end_time_dt = datetime.strptime(request_body.end_time, "%Y-%m-%d %H:%M:%S")
-        end_time_dt = end_time_dt - Timedelta(hours=2)
-        now = datetime.now()
-        time_remaining = end_time_dt - now
-
-        task = asyncio.create_task(check_and_stop_session(request_body.chat_id, end_time_dt))
-        ONGOING_SESSION[request_body.chat_id] = task
-
-        # # Start the asynchronous loop in the background
-        # asyncio.create_task(check_and_stop_session(request_body.chat_id, end_time_dt))
+        # Starting a session sets up its broker, or waits on a worker process: keep it off the loop.
+        await asyncio.to_thread(engine.start, request_body.chat_id, credentials, 
+                                {"symbol": request_body.ticker, "amount_to_spend": request_body.amount_to_spend})
+
+        try:
+            await store.update(request_body.chat_id, 
+                               session_alive=request_body.session_alive, 
+                               ticker=request_body.ticker, 
+                               end_time=request_body.end_time, 
+                               amount_to_spend=request_body.amount_to_spend)
+
+            # Convert end_time to a datetime object
+            end_time_dt = datetime.strptime(request_body.end_time, "%Y-%m-%d %H:%M:%S")
+            end_time_dt = end_time_dt - Timedelta(hours=2)
+
+            await expiry.schedule(request_body.chat_id, end_time_dt)
+        except Exception:
+            # A session that is not recorded or scheduled could not be stopped nor expire: undo it.
+            await asyncio.to_thread(engine.stop, request_body.chat_id)
+            await store.clear_session(request_body.chat_id)
+            raise
     
-        CHAT_ID = request_body.chat_id
         return {"status": 200, "message": "Session saved and started succesfully"}    
 
     except Exception as e:
+        ERRORS.labels("store_and_start").inc()
         return{"status": 500, "message": "Internal server error"}
 
 @app.post("/stop_session/")
 async def stop_session(request_body: Session):
-    response = stop_session_for_chat_id(request_body.chat_id)
+    response = await stop_session_for_chat_id(request_body.chat_id)
     return response
 
 
-async def check_and_stop_session(chat_id: str, end_time: datetime):
-    try:
-        while True:
-            await asyncio.sleep(60)
-            now = datetime.now()
-            time_remaining = end_time - now
-            if now >= end_time:
-                response = stop_session_for_chat_id(chat_id)
-                trade_counter = response.get('counter')
-                cash_value = response.get('cash_value')
-                portfolio_value = response.get('portfolio_value')
-                trade_info = f"📊📊 RECAP 📊📊\nTotal trades made: {trade_counter}\nCash Value: {cash_value}$\nPortfolio Value: {portfolio_value}$# {CHAT_ID}"
-                r.publish('trade_channel',trade_info)
-                break
-    except asyncio.CancelledError:
-        print(f"Session check task for chat ID {chat_id} was cancelled.")        
-
-def stop_session_for_chat_id(chat_id: str):
+async def expire_session(chat_id: str):
+    response = await stop_session_for_chat_id(chat_id)
+    await publish(r, RecapEvent(chat_id=chat_id, 
+                                trades=response.get('counter') or 0, 
+                                cash_value=response.get('cash_value'), 
+                                portfolio_value=response.get('portfolio_value')))
 
-    try:
-        global trader
-        global ONGOING_SESSION
-        global TRADE_COUNTER
+expiry = ExpiryScheduler(r, expire_session)
 
-        data_from_redis = r.hgetall(chat_id)
-        if data_from_redis == {}:
-            return {"message": "No credentials found", "status": 404}
 
-        data = {
-            'session_alive': False,
-            'ticker': None,
-            'end_time': None,
-            'amount_to_spend': None
-        }
+async def stop_session_for_chat_id(chat_id: str):
 
-        for key, value in data.items():
-            r.hset(chat_id, key, json.dumps(value))
+    try:
+        record = await store.get(chat_id)
+        if record is None:
+            return {"message": "No credentials found", "status": 404}
+
+        await store.clear_session(chat_id)
 
-        task = ONGOING_SESSION.get(chat_id)
-        if task:
-            task.cancel()
-            print(f"Task for chat ID {chat_id} cancelled.")
-            del ONGOING_SESSION[chat_id]  # Clean up the reference
+        await expiry.cancel(chat_id)
 
-        trader.stop_all()
-        trader = Trader()
+        session = await asyncio.to_thread(engine.stop, chat_id)
+        counter = session.trade_counter if session else 0
 
-        api = tradeapi.REST(ALPACA_CREDS["API_KEY"], ALPACA_CREDS["API_SECRET"], base_url="https://paper-api.alpaca.markets")
-        account = api.get_account()
+        # The recap reports the account as the session left it, after its last trades.
+        account = await alpaca_clients.account(record.api_key, record.api_secret, fresh=True)
         portfolio_value = account.portfolio_value
         cash_value = account.cash
-        counter = TRADE_COUNTER
-
-        TRADE_COUNTER = 0
         
         return {"status": 200, "message": "Session stopped succesfully", "counter": counter ,"cash_value": cash_value, "portfolio_value": portfolio_value}
 
     except Exception as e:
+        ERRORS.labels("stop_session").inc()
         return {"status": 500, "message": "Internal server error"}
+
+
+metric_stats.add("sessions", lambda: {"active": len(engine)})
+metric_stats.add("sentiment_cache", sentiment.cache.stats, sessions=True)
+metric_stats.add("sentiment_batcher", sentiment.batcher.stats, sessions=True)
+metric_stats.add("news_feed", news_feed.stats, sessions=True)
+metric_stats.add("news_trigger", news_trigger.stats, sessions=True)
+metric_stats.add("expiry", expiry.stats)
+metric_stats.add("alpaca_clients", alpaca_clients.stats)
+metric_stats.add("ticker_index", ticker_index.stats)
+metric_stats.add("tracer", tracer.stats, sessions=True)
+
+
+STARTUP_TIMINGS["import_seconds"] = time.perf_counter() - _import_started
+print(f"trader_agent imported in {STARTUP_TIMINGS['import_seconds']:.2f}s")
@@ -0,0 +1,96 @@
+"""
+Measures the cost of one trading iteration over N symbols, run as N single-symbol sessions
+(as before) and as one basket session.
+
+Each Alpaca call (a quote or a news page) sleeps for `--rtt-ms` to stand in for the network,
+and headlines are scored by the stub sentiment backend through the shared cache and batcher,
+so the comparison counts round trips and model batches, not model speed. News windows and the
+sentiment cache start empty every run, as on the first iteration of the day.
+
+Usage:
+    python benchmarks/bench_basket_iteration.py --sizes 1 5 10 20 --rtt-ms 20
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("SENTIMENT_BACKEND", "stub")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent"))
+
+import fakeredis
+from alpaca_trade_api.entity_v2 import NewsListV2
+
+import sentiment
+from news_feed import NewsFeed, format_timestamp
+from signals import basket_signals
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class FakeAlpaca:
+    """
+    Serves quotes and ten headlines per symbol, counting calls and sleeping for each of them.
+    """
+    def __init__(self, rtt, now):
+        self.rtt = rtt
+        self.now = now
+        self.calls = 0
+
+    def get_last_prices(self, symbols):
+        self.calls += 1
+        time.sleep(self.rtt)
+        return {symbol: 100.0 for symbol in symbols}
+
+    def get_news(self, symbol, start, limit):
+        self.calls += 1
+        time.sleep(self.rtt)
+        symbols = symbol.split(",")
+        return NewsListV2([{"id": f"{s}-{i}", "headline": f"{s} headline {i}", "symbols": [s],
+                            "created_at": format_timestamp(self.now)} for s in symbols for i in range(limit // len(symbols))])
+
+
+def iteration(api, feed, symbols, now):
+    prices = api.get_last_prices(symbols)
+    sentiments = sentiment.estimate_sentiments(feed.headlines_many(symbols, api, now))
+    return basket_signals(sentiments, prices, {}, 1000 * len(symbols), 10 ** 6)
+
+
+def run(size, rtt, runs, basket):
+    now = datetime.now(timezone.utc)
+    symbols = [f"S{i:03d}" for i in range(size)]
+    timings, calls = [], 0
+    for _ in range(runs):
+        sentiment.cache.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+        api, feed = FakeAlpaca(rtt, now), NewsFeed(refresh_seconds=0)
+        t0 = time.perf_counter()
+        if basket:
+            iteration(api, feed, symbols, now)
+        else:
+            for symbol in symbols:
+                iteration(api, feed, [symbol], now)
+        timings.append(time.perf_counter() - t0)
+        calls = api.calls
+    return percentile(timings, .5), calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--rtt-ms", type=float, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'symbols':>8} {'sessions ms':>12} {'calls':>6} {'basket ms':>10} {'calls':>6}")
+    for size in args.sizes:
+        single, single_calls = run(size, args.rtt_ms / 1000, args.runs, basket=False)
+        basket, basket_calls = run(size, args.rtt_ms / 1000, args.runs, basket=True)
+        print(f"{size:>8} {single * 1000:>12.1f} {single_calls:>6} {basket * 1000:>10.1f} {basket_calls:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compares how fast the Bot handles updates when polling Telegram and in webhook mode.
+
+Both modes run a real TeleBot with a message handler that sleeps `--handler-ms`, standing for
+the agent calls a handler makes. In polling mode getUpdates is faked to hand out the updates
+100 at a time, as Telegram does, and the bot runs with the thread pool bot.py used before
+(`--polling-threads`). In webhook mode the updates are posted to the local webhook endpoint by
+`--clients` concurrent connections, and handled by the chat-ordered pool.
+
+The benchmark reports updates per second, and how many updates were handled out of order
+within their chat.
+
+Usage:
+    python benchmarks/bench_bot_ingestion.py --updates 2000 --chats 200 --handler-ms 20
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import telebot
+from telebot import apihelper
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Bot"))
+
+from webhook import ChatOrderedPool, WebhookServer
+
+
+def make_updates(count, chats):
+    return [{"update_id": i + 1, "message": {"message_id": i + 1, "date": 0, "text": str(i),
+                                             "chat": {"id": i % chats, "type": "private"},
+                                             "from": {"id": i % chats, "is_bot": False, "first_name": "user"}}}
+            for i in range(count)]
+
+
+class Recorder:
+    def __init__(self, bot, total, handler_seconds):
+        self.total = total
+        self.handled = 0
+        self.out_of_order = 0
+        self.last_seen = {}
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+        @bot.message_handler(func=lambda message: True)
+        def handle(message):
+            time.sleep(handler_seconds)
+            with self.lock:
+                if int(message.text) < self.last_seen.get(message.chat.id, -1):
+                    self.out_of_order += 1
+                self.last_seen[message.chat.id] = int(message.text)
+                self.handled += 1
+                if self.handled == self.total:
+                    self.done.set()
+
+
+def run_polling(updates, threads, handler_seconds):
+    pending = list(updates)
+
+    def get_updates(token, offset=None, limit=None, timeout=None, allowed_updates=None, long_polling_timeout=None):
+        batch = [update for update in pending if update["update_id"] >= (offset or 0)][:limit or 100]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+    # Polling starts by asking Telegram who the bot is.
+    apihelper.get_me = lambda token: {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+    apihelper.get_updates = get_updates
+    bot = telebot.TeleBot("123:benchmark", num_threads=threads, validate_token=False)
+    recorder = Recorder(bot, len(updates), handler_seconds)
+    started = time.perf_counter()
+    threading.Thread(target=bot.polling, kwargs={"interval": 0, "timeout": 1}, daemon=True).start()
+    recorder.done.wait()
+    elapsed = time.perf_counter() - started
+    bot.stop_polling()
+    return elapsed, recorder
+
+
+def run_webhook(updates, workers, clients, handler_seconds):
+    bot = telebot.TeleBot("123:benchmark", threaded=False, validate_token=False)
+    recorder = Recorder(bot, len(updates), handler_seconds)
+    server = WebhookServer(lambda update: bot.process_new_updates([telebot.types.Update.de_json(update)]),
+                           ChatOrderedPool(workers=workers), host="127.0.0.1", port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}{server.path}"
+
+    local = threading.local()
+
+    def post(update):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        local.session.post(url, json=update)
+
+    started = time.perf_counter()
+    # Telegram delivers the updates of a chat one at a time, in order: so does the harness.
+    by_chat = {}
+    for update in updates:
+        by_chat.setdefault(update["message"]["chat"]["id"], []).append(update)
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(lambda chat_updates: [post(update) for update in chat_updates], by_chat.values()))
+    recorder.done.wait()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return elapsed, recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--handler-ms", type=float, default=20)
+    parser.add_argument("--polling-threads", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates, args.chats)
+    handler_seconds = args.handler_ms / 1000
+    for mode, (elapsed, recorder) in (
+            ("polling", run_polling(updates, args.polling_threads, handler_seconds)),
+            ("webhook", run_webhook(updates, args.workers, args.clients, handler_seconds))):
+        print(f"{mode:8} {args.updates / elapsed:8.0f} updates/s  ({elapsed:.2f}s, {recorder.out_of_order} out of order)")
+
+
+if __name__ == "__main__":
+    main()
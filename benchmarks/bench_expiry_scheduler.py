@@ -0,0 +1,69 @@
+"""
+Schedules thousands of session expiries on the ExpiryScheduler and measures how late they fire.
+
+Deadlines are spread over `--spread` seconds, against an in-memory Redis. The old design ran
+one task per session polling every 60 seconds, so a session could be stopped up to a minute
+late and every session cost a wake-up per minute; here one task wakes per deadline.
+
+Usage:
+    python benchmarks/bench_expiry_scheduler.py --sessions 10000 --spread 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent"))
+
+from expiry_scheduler import ExpiryScheduler
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(sessions, spread):
+    deadlines = {}
+    lateness = []
+    done = asyncio.Event()
+
+    async def on_expire(chat_id):
+        lateness.append(time.time() - deadlines[chat_id])
+        if len(lateness) == sessions:
+            done.set()
+
+    scheduler = ExpiryScheduler(fakeredis.FakeAsyncRedis(decode_responses=True), on_expire)
+    scheduler.start()
+    now = datetime.now()
+    t0 = time.perf_counter()
+    for i in range(sessions):
+        deadline = now + timedelta(seconds=1 + random.uniform(0, spread))
+        deadlines[str(i)] = deadline.timestamp()
+        await scheduler.schedule(str(i), deadline)
+    schedule_seconds = time.perf_counter() - t0
+
+    await asyncio.wait_for(done.wait(), spread + 30)
+    await scheduler.stop()
+    return schedule_seconds, lateness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--spread", type=float, default=5)
+    args = parser.parse_args()
+
+    schedule_seconds, lateness = asyncio.run(run(args.sessions, args.spread))
+    print(f"sessions scheduled: {args.sessions} in {schedule_seconds:.2f}s ({args.sessions / schedule_seconds:.0f}/s)")
+    print(f"expiry lateness:    p50 {statistics.median(lateness) * 1000:.2f} ms, p99 {percentile(lateness, 0.99) * 1000:.2f} ms, max {max(lateness) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Replays bursts of headlines through the NewsTrigger and measures how long a subscribed session
+takes to submit an order after the first headline of a burst arrives.
+
+Each of `--sessions` sessions trades one of `--symbols` symbols. A re-evaluation stands in for
+the strategy's iteration by sleeping `--evaluate-ms` and then submitting an order. With the 24H
+timer alone the same headline waits 12 hours on average for the next iteration.
+
+Usage:
+    python benchmarks/bench_news_trigger.py --sessions 200 --symbols 50 --bursts 20 --debounce 0.5
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent"))
+
+from news_trigger import NewsTrigger
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=5)
+    parser.add_argument("--debounce", type=float, default=.5)
+    parser.add_argument("--evaluate-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    trigger = NewsTrigger(debounce=args.debounce, max_wait=args.debounce * 5, min_interval=0)
+    symbols = [f"S{i:03d}" for i in range(args.symbols)]
+    evaluations = threading.Semaphore(0)
+
+    def evaluate(event):
+        time.sleep(args.evaluate_ms / 1000)
+        trigger.ordered(event)
+        evaluations.release()
+
+    for i in range(args.sessions):
+        trigger.subscribe(f"session-{i}", [symbols[i % args.symbols]], evaluate)
+
+    rng = random.Random(0)
+    expected = 0
+    for _ in range(args.bursts):
+        symbol = rng.choice(symbols)
+        expected += sum(1 for i in range(args.sessions) if symbols[i % args.symbols] == symbol)
+        for _ in range(args.burst_size):
+            trigger.publish(symbol, "headline")
+            time.sleep(args.debounce / 10)
+        # Let the burst settle so bursts of the same symbol are not merged.
+        time.sleep(args.debounce * 1.5)
+    for _ in range(expected):
+        evaluations.acquire()
+
+    latencies = list(trigger.order_latencies)
+    stats = trigger.stats()
+    print(f"{stats['headlines']} headlines -> {stats['triggers']} re-evaluations ({stats['coalesced']} coalesced)")
+    print(f"headline to order: p50 {percentile(latencies, .5):.2f}s  p99 {percentile(latencies, .99):.2f}s"
+          f"  (24H timer: 43200s on average)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Load test of a Redis-backed FastAPI handler, before and after the move to the asyncio client.
+
+"before" is the /checkcredentials/ handler as it used to be, calling the synchronous client
+from an async handler; "after" awaits the asyncio client through a bounded connection pool, as
+trader_agent.py now does. Both talk to an in-memory fakeredis with the same simulated network
+round trip, so the difference is only how the event loop is used.
+
+Usage:
+    python benchmarks/bench_redis_handlers.py --requests 1000 --rate 1000 --rtt-ms 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import fakeredis
+import httpx
+from fastapi import FastAPI
+
+
+class SlowRedis:
+    """
+    Wraps a synchronous client, adding a blocking delay to every command.
+    """
+    def __init__(self, client, delay):
+        self.client = client
+        self.delay = delay
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.delay)
+            return command(*args, **kwargs)
+        return call
+
+
+class SlowAsyncRedis(SlowRedis):
+    """
+    Wraps an asyncio client, adding a non-blocking delay to every command and bounding the
+    number of commands in flight like a connection pool does.
+    """
+    def __init__(self, client, delay, max_connections):
+        super().__init__(client, delay)
+        self.pool = asyncio.Semaphore(max_connections)
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            async with self.pool:
+                await asyncio.sleep(self.delay)
+                return await command(*args, **kwargs)
+        return call
+
+
+def build_app(r, is_async):
+    app = FastAPI()
+
+    @app.get("/checkcredentials/{chat_id}")
+    async def check_credentials(chat_id: str):
+        data_from_redis = (await r.hgetall(chat_id)) if is_async else r.hgetall(chat_id)
+        if data_from_redis == {}:
+            return {"message": "No credentials found", "status": 404}
+        data = {key: value.strip('"') for key, value in data_from_redis.items()}
+        data['status'] = 200
+        return data
+
+    return app
+
+
+async def load(app, requests, rate):
+    """
+    Sends requests at a fixed arrival rate and measures each latency from its scheduled send
+    time, so time spent queued behind a blocked event loop is counted.
+    """
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+        started = time.perf_counter()
+
+        async def one(i):
+            scheduled = started + i / rate
+            await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+            response = await client.get(f"/checkcredentials/{i % 100}")
+            latencies.append(time.perf_counter() - scheduled)
+            assert response.json()["status"] == 200
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+            "requests_per_second": requests / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1000, help="Arrival rate in requests per second")
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--max-connections", type=int, default=50)
+    args = parser.parse_args()
+
+    server = fakeredis.FakeServer()
+    seed = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    for chat_id in range(100):
+        seed.hset(str(chat_id), mapping={"api_key": "key", "api_secret": "secret", "session_alive": "false"})
+
+    delay = args.rtt_ms / 1000
+    before = build_app(SlowRedis(fakeredis.FakeStrictRedis(server=server, decode_responses=True), delay), is_async=False)
+    after = build_app(SlowAsyncRedis(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), delay,
+                                     args.max_connections), is_async=True)
+
+    print(f"{args.requests} requests at {args.rate:.0f} req/s, simulated Redis RTT {args.rtt_ms} ms")
+    for name, app in [("before (sync client)", before), ("after (asyncio client)", after)]:
+        result = asyncio.run(load(app, args.requests, args.rate))
+        print(f"{name:<24} p50 {result['p50_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   {result['requests_per_second']:7.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
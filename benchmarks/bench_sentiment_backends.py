@@ -0,0 +1,78 @@
+"""
+Compares latency and memory of the sentiment backends on the parity headline corpus.
+
+Every backend runs in its own subprocess so that its peak RSS is not polluted by the others.
+
+Usage:
+    python benchmarks/bench_sentiment_backends.py --backends torch onnx onnx-int8
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+TRADER_AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent")
+sys.path.insert(0, TRADER_AGENT_DIR)
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(name, batch_sizes, repeats):
+    import sentiment
+    from sentiment_parity import load_corpus
+
+    corpus = load_corpus()
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    backend = sentiment.BACKENDS[name]()
+    load_seconds = time.perf_counter() - started
+    backend.score(corpus[:1])
+
+    latencies = {}
+    for batch_size in batch_sizes:
+        batch = (corpus * (batch_size // len(corpus) + 1))[:batch_size]
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            backend.score(batch)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        latencies[str(batch_size)] = {"median_ms": median * 1000, "headlines_per_second": batch_size / median}
+
+    return {"backend": name, "load_seconds": load_seconds, "baseline_rss_mb": baseline_rss,
+            "peak_rss_mb": rss_mb(), "latency": latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32, 64])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.batch_sizes, args.repeats)))
+        return
+
+    results = []
+    for name in args.backends:
+        command = [sys.executable, __file__, "--worker", name, "--repeats", str(args.repeats),
+                   "--batch-sizes", *map(str, args.batch_sizes)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'backend':<10} {'load s':>7} {'rss MB':>8} " + " ".join(f"{'b=' + str(b) + ' ms':>10}" for b in args.batch_sizes))
+    for result in results:
+        cells = " ".join(f"{result['latency'][str(b)]['median_ms']:>10.1f}" for b in args.batch_sizes)
+        print(f"{result['backend']:<10} {result['load_seconds']:>7.2f} {result['peak_rss_mb']:>8.0f} {cells}")
+
+
+if __name__ == "__main__":
+    main()
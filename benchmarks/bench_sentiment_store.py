@@ -0,0 +1,66 @@
+"""
+Fills a SentimentStore with years of daily sentiment for hundreds of symbols and measures how
+long reading one year of every symbol takes.
+
+Each read memory-maps the symbol's columns and binary-searches the range, so its cost depends
+on the number of symbols rather than on the length of their history. Reads are timed both
+from a fresh store (opening the files) and from a store that already has them mapped.
+
+Usage:
+    python benchmarks/bench_sentiment_store.py --symbols 500 --years 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent"))
+
+from sentiment_store import SentimentStore
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    end = np.datetime64("2024-12-31")
+    days = np.arange(end - 365 * args.years + 1, end + 1)
+    symbols = [f"SYM{i:04d}" for i in range(args.symbols)]
+    with tempfile.TemporaryDirectory() as root:
+        store = SentimentStore(root)
+        t0 = time.perf_counter()
+        for symbol in symbols:
+            logits = rng.normal(size=(len(days), 3))
+            store.put(symbol, days, logits, rng.random(len(days)), logits.argmax(axis=1))
+        write_seconds = time.perf_counter() - t0
+
+        cold, warm = [], []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            series = SentimentStore(root).read_many(symbols, end - 364, end)
+            cold.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            store.read_many(symbols, end - 364, end)
+            warm.append(time.perf_counter() - t0)
+        rows = sum(len(s) for s in series.values())
+
+    print(f"wrote {args.symbols} symbols x {len(days)} days in {write_seconds:.2f}s")
+    print(f"read one year of every symbol ({rows} rows):")
+    print(f"  fresh store:  p50 {percentile(cold, .5) * 1000:.1f} ms  p99 {percentile(cold, .99) * 1000:.1f} ms")
+    print(f"  mapped store: p50 {percentile(warm, .5) * 1000:.1f} ms  p99 {percentile(warm, .99) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Starts and stops hundreds of concurrent sessions on the SessionEngine.
+
+Each fake session runs its own thread, like a lumibot strategy does, so the benchmark measures
+the engine's bookkeeping plus thread start-up and shutdown, and checks that stopping one session
+never disturbs the others.
+
+Usage:
+    python benchmarks/bench_session_engine.py --sessions 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TraderAgent"))
+
+from session_engine import SessionEngine
+
+
+class FakeTrader:
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(0.05):
+            self.strategy.iterations += 1
+
+    def stop_all(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+
+class FakeStrategy:
+    def __init__(self):
+        self.iterations = 0
+        self.trade_counter = 0
+
+
+def launch(chat_id, credentials, parameters):
+    strategy = FakeStrategy()
+    return object(), strategy, FakeTrader(strategy)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--stops", type=int, default=100)
+    args = parser.parse_args()
+
+    engine = SessionEngine(launch)
+    start_latencies = []
+    started = time.perf_counter()
+    for i in range(args.sessions):
+        credentials = {"API_KEY": f"key-{i}", "API_SECRET": f"secret-{i}", "PAPER": True}
+        t0 = time.perf_counter()
+        engine.start(str(i), credentials, {"symbol": "AAPL", "amount_to_spend": "1000"})
+        start_latencies.append(time.perf_counter() - t0)
+    start_total = time.perf_counter() - started
+
+    time.sleep(0.2)
+    victims = random.sample(range(args.sessions), min(args.stops, args.sessions))
+    stop_latencies = []
+    for i in victims:
+        t0 = time.perf_counter()
+        engine.stop(str(i))
+        stop_latencies.append(time.perf_counter() - t0)
+
+    survivors = [engine.get(chat_id) for chat_id in engine.chat_ids()]
+    disturbed = sum(1 for session in survivors if not session.trader.is_alive())
+
+    print(f"sessions started:  {args.sessions} in {start_total:.2f}s ({args.sessions / start_total:.0f}/s)")
+    print(f"start latency:     p50 {statistics.median(start_latencies) * 1000:.2f} ms, p99 {percentile(start_latencies, 0.99) * 1000:.2f} ms")
+    print(f"stop latency:      p50 {statistics.median(stop_latencies) * 1000:.2f} ms, p99 {percentile(stop_latencies, 0.99) * 1000:.2f} ms")
+    print(f"sessions running:  {len(survivors)}, disturbed by stops: {disturbed}")
+
+    for chat_id in engine.chat_ids():
+        engine.stop(chat_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Performance baseline of the services, run offline and stored as JSON to compare commits.
+
+Three groups of benchmarks:
+    sentiment  estimate_sentiment over batch sizes and headline lengths, cold (scored by the
+               model through the batcher) and warm (served by the cache).
+    api        every TraderAgent endpoint, called concurrently through the ASGI app, with
+               Redis in memory and Alpaca, yfinance and the trading sessions stubbed. lumibot
+               is stubbed too when it is not installed, since no session really runs.
+    notifier   BotSub fan-out: trade events read from the stream, rendered and sent through
+               the dispatcher to a stubbed Telegram, with the rate limits lifted.
+
+The sentiment group uses the backend selected by SENTIMENT_BACKEND, "stub" by default so the
+suite needs neither the model nor the network; set it to compare real backends. A group whose
+service cannot be imported here is recorded as skipped, with the reason; the modules stubbed
+in are listed under "stubbed".
+
+Every result is a number with the direction that is better. Comparing against a baseline
+flags the results that got worse by more than `--threshold` (a fraction) and exits with 1.
+
+Usage:
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --only sentiment notifier --baseline main.json --threshold 0.2
+    python benchmarks/suite.py --compare main.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import ModuleType, SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+os.environ.setdefault("SENTIMENT_BACKEND", "stub")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "TraderAgent"))
+sys.path.insert(0, os.path.join(ROOT, "BotSub"))
+
+import fakeredis
+
+GROUPS = ("sentiment", "api", "notifier")
+BATCH_SIZES = (1, 8, 32, 128)
+HEADLINE_WORDS = {"short": 8, "medium": 25, "long": 60}
+WORDS = "stocks rally as earnings beat forecasts while guidance slips on weaker demand and rates".split()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def result(value, unit, better):
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def headlines(count, words, seed):
+    # Unique per seed, so every cold run misses the cache.
+    return [f"{seed}-{i} " + " ".join(WORDS[(i + j) % len(WORDS)] for j in range(words)) for i in range(count)]
+
+
+def bench_sentiment(repeat):
+    import sentiment
+    from sentiment_cache import SentimentCache
+
+    results = {}
+    sentiment.get_backend()
+    for length, words in HEADLINE_WORDS.items():
+        for size in BATCH_SIZES:
+            cold, warm = [], []
+            for run in range(repeat):
+                sentiment.cache = SentimentCache(fakeredis.FakeStrictRedis(decode_responses=True), namespace="bench")
+                news = headlines(size, words, f"{length}-{size}-{run}")
+                started = time.perf_counter()
+                sentiment.estimate_sentiment(news)
+                cold.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                sentiment.estimate_sentiment(news)
+                warm.append(time.perf_counter() - started)
+            name = f"sentiment.{length}.batch_{size}"
+            results[f"{name}.cold_headlines_per_second"] = result(size / statistics.median(cold), "headlines/s", "higher")
+            results[f"{name}.warm_headlines_per_second"] = result(size / statistics.median(warm), "headlines/s", "higher")
+    return results
+
+
+def stub_lumibot():
+    """
+    Registers stand-in lumibot modules if lumibot is not installed, so trader_agent imports.
+
+    Returns:
+        bool: True if lumibot was stubbed.
+    """
+    try:
+        import lumibot  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    class Strategy:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    for name, attributes in {"lumibot": {}, "lumibot.brokers": {"Alpaca": MagicMock()},
+                             "lumibot.strategies": {}, "lumibot.strategies.strategy": {"Strategy": Strategy},
+                             "lumibot.traders": {"Trader": MagicMock()}}.items():
+        module = sys.modules[name] = ModuleType(name)
+        module.__dict__.update(attributes)
+    return True
+
+
+def stub_session_engine():
+    from session_engine import SessionEngine
+    from tracing import tracer
+
+    def launch(chat_id, credentials, parameters):
+        # What a first iteration would record, for the trace endpoint to serve.
+        with tracer.span("iteration", key=chat_id, trigger="timer"):
+            for name in ("sizing", "sentiment", "decide"):
+                with tracer.span(name):
+                    pass
+        return None, SimpleNamespace(trade_counter=0), SimpleNamespace(stop_all=lambda: None)
+    return SessionEngine(launch)
+
+
+async def call_endpoint(client, method, path, payloads, concurrency, headers=None):
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(payload):
+        async with slots:
+            started = time.perf_counter()
+            response = await client.request(method, path(payload) if callable(path) else path,
+                                            json=None if method == "GET" else payload, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            # Failed calls would make the endpoint look fast: stop instead.
+            if response.headers["content-type"].startswith("application/json"):
+                body = response.json()
+                if body.get("status", 200) >= 500:
+                    raise RuntimeError(f"{method} {response.request.url.path} failed: {body}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    return len(payloads) / (time.perf_counter() - started), latencies
+
+
+async def run_api(requests, concurrency):
+    import httpx
+    import trader_agent
+
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    account = SimpleNamespace(cash="1000000", portfolio_value="1000000", status="ACTIVE", trading_blocked=False)
+    rest = MagicMock()
+    rest.return_value.get_account.return_value = account
+    trader_agent.ticker_index.symbols = frozenset(["AAPL", "MSFT", "GOOG", "BRK.B"])
+    trader_agent.ticker_index.loaded_at = time.time()
+    chat_ids = [str(i) for i in range(requests)]
+    end_time = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    # Called in this order: sessions are started on stored credentials, then stopped. The optional
+    # fifth item overrides the concurrency or sets headers.
+    endpoints = [
+        ("warmup", "POST", "/warmup", [None] * (requests // 10)),
+        ("ready", "GET", "/ready", [None] * requests),
+        ("verify_and_store_credentials", "POST", "/verifyandstorecredentials/",
+         [{"chat_id": chat_id, "api_key": "key", "api_secret": "secret"} for chat_id in chat_ids]),
+        ("check_credentials", "GET", lambda payload: f"/checkcredentials/{payload}", chat_ids),
+        ("check_credentials_batch", "POST", "/checkcredentials/",
+         [{"chat_ids": chat_ids[i:i + 50]} for i in range(0, requests, 50)] * 10),
+        ("check_ticker", "POST", "/check_ticker/", [{"ticker": "AAPL, MSFT"}] * requests),
+        ("store_and_start_new_session", "POST", "/store_and_start_new_session/",
+         [{"chat_id": chat_id, "session_alive": True, "ticker": "AAPL", "end_time": end_time, "amount_to_spend": "1000"}
+          for chat_id in chat_ids]),
+        ("session_trace", "GET", lambda payload: f"/sessions/{payload}/trace", chat_ids),
+        ("session_trace_chrome", "GET", lambda payload: f"/sessions/{payload}/trace?format=chrome", chat_ids),
+        ("stop_session", "POST", "/stop_session/", [{"chat_id": chat_id} for chat_id in chat_ids]),
+        ("sentiment_stats", "GET", "/sentiment/stats", [None] * requests),
+        ("alpaca_stats", "GET", "/alpaca/stats", [None] * requests),
+        ("news_stats", "GET", "/news/stats", [None] * requests),
+        ("news_trigger_stats", "GET", "/news/trigger/stats", [None] * requests),
+        ("tickers_stats", "GET", "/tickers/stats", [None] * requests),
+        ("expiry_stats", "GET", "/sessions/expiry/stats", [None] * requests),
+        ("metrics", "GET", "/metrics", [None] * (requests // 10)),
+        # One profile runs at a time: the others would be refused.
+        ("admin_profile", "POST", "/admin/profile/", [{"seconds": .05, "interval_ms": 5}] * 5,
+         {"concurrency": 1, "headers": {"X-Admin-Token": "bench"}}),
+    ]
+
+    results = {}
+    with patch.object(trader_agent.store, "redis", redis), patch.object(trader_agent.expiry, "redis", redis), \
+            patch.object(trader_agent, "engine", stub_session_engine()), patch.object(trader_agent, "ADMIN_TOKEN", "bench"), \
+            patch("alpaca_trade_api.REST", rest), patch.object(trader_agent.yf, "Ticker", MagicMock()):
+        trader_agent.alpaca_clients.clear()
+        transport = httpx.ASGITransport(app=trader_agent.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+            for name, method, path, payloads, *options in endpoints:
+                options = options[0] if options else {}
+                throughput, latencies = await call_endpoint(client, method, path, payloads,
+                                                            options.get("concurrency", concurrency), options.get("headers"))
+                results[f"api.{name}.requests_per_second"] = result(throughput, "requests/s", "higher")
+                results[f"api.{name}.p50_ms"] = result(percentile(latencies, .5) * 1000, "ms", "lower")
+                results[f"api.{name}.p99_ms"] = result(percentile(latencies, .99) * 1000, "ms", "lower")
+    return results
+
+
+def bench_api(requests, concurrency):
+    return asyncio.run(run_api(requests, concurrency))
+
+
+async def run_notifier(events, chats, rtt):
+    from dispatcher import NotificationDispatcher
+    from trade_events import TradeEvent, publish
+    from trade_stream import TradeStreamConsumer
+
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    for i in range(events):
+        await publish(redis, TradeEvent(chat_id=str(i % chats), session_id="bench", side="buy", qty=1,
+                                        symbol="AAPL", price=100.0))
+
+    def telegram(chat_id, text):
+        time.sleep(rtt)
+
+    dispatcher = NotificationDispatcher(telegram, global_rate=1e9, chat_rate=1e9, chat_burst=10 ** 6)
+    consumer = TradeStreamConsumer(redis, dispatcher.deliver, consumer="bench", block_ms=None)
+    await consumer.ensure_group()
+    dispatcher.start()
+    started = time.perf_counter()
+    while consumer.sent < events:
+        if not await consumer.poll():
+            await consumer.drain()
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    stats = dispatcher.stats()
+    return {
+        "notifier.events_per_second": result(events / elapsed, "events/s", "higher"),
+        "notifier.telegram_sends_per_event": result(stats["sends"] / events, "sends/event", "lower"),
+        "notifier.delivery_p99_ms": result(stats["latency_p99_seconds"] * 1000, "ms", "lower"),
+    }
+
+
+def bench_notifier(events, chats, rtt):
+    return asyncio.run(run_notifier(events, chats, rtt))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns:
+        list[str]: A line per result that got worse than the baseline by more than `threshold`.
+    """
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = current["results"].get(name)
+        if new is None or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        worse = -change if old["better"] == "higher" else change
+        if worse > threshold:
+            regressions.append(f"{name}: {old['value']:g} -> {new['value']:g} {new['unit']} ({worse:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--output", help="file the results are written to")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files and exit")
+    parser.add_argument("--threshold", type=float, default=.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            regressions = compare(json.load(f), json.load(g), args.threshold)
+        print("\n".join(regressions) or "No regression")
+        sys.exit(1 if regressions else 0)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sentiment_backend": os.environ["SENTIMENT_BACKEND"],
+        "results": {},
+        "skipped": {},
+        "stubbed": [],
+    }
+    if "api" in args.only and stub_lumibot():
+        report["stubbed"].append("lumibot")
+        print("api: lumibot is not installed, stubbed")
+    runners = {
+        "sentiment": lambda: bench_sentiment(args.repeat),
+        "api": lambda: bench_api(args.requests, args.concurrency),
+        "notifier": lambda: bench_notifier(args.events, args.chats, args.rtt_ms / 1000),
+    }
+    for group in args.only:
+        try:
+            report["results"].update(runners[group]())
+        except ImportError as e:
+            report["skipped"][group] = str(e)
+            print(f"{group}: skipped ({e})")
+
+    for name, value in report["results"].items():
+        print(f"{name:<60} {value['value']:>14.2f} {value['unit']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        print("\n".join(regressions) or "No regression")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
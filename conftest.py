@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The services are deployed as flat directories (see the Dockerfiles), so their sibling modules
+# are imported by bare name. Mirror that layout when running the tests from the repo root.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "TraderAgent"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "BotSub"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "Bot"))
+
+# Never load the real model in tests.
+os.environ.setdefault("SENTIMENT_BACKEND", "stub")
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import requests
+import urllib3
+
+import agent_client
+from agent_client import AgentClient, AsyncAgentClient
+
+
+class FlakyAgent(BaseHTTPRequestHandler):
+    calls = {}
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.answer()
+
+    def answer(self):
+        count = FlakyAgent.calls[self.path] = FlakyAgent.calls.get(self.path, 0) + 1
+        if self.path == "/stop_session/":
+            time.sleep(0.5)
+        status = 503 if self.path.startswith("/checkcredentials/") and count == 1 else 200
+        body = json.dumps({"status": 200}).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def agent_url(monkeypatch):
+    monkeypatch.setitem(agent_client.READ_TIMEOUTS, "/stop_session/", 0.1)
+    FlakyAgent.calls = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyAgent)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_retries_only_idempotent_calls(agent_url):
+    agent = AgentClient(agent_url, backoff=0.01)
+
+    # Scenario 1: A gateway error on a lookup is retried
+    assert agent.get("/checkcredentials/1").json() == {"status": 200}
+    assert FlakyAgent.calls["/checkcredentials/1"] == 2
+
+    # Scenario 2: A hung stop times out instead of blocking, and is not sent twice
+    with pytest.raises(requests.Timeout):
+        agent.post("/stop_session/", {"chat_id": "1"})
+    assert FlakyAgent.calls["/stop_session/"] == 1
+
+
+def test_connect_timeouts_are_retried_by_one_layer_only(monkeypatch):
+    connects = []
+
+    def new_conn(self):
+        connects.append(self.port)
+        raise urllib3.exceptions.ConnectTimeoutError(self, "Connection timed out")
+
+    monkeypatch.setattr(urllib3.connection.HTTPConnection, "_new_conn", new_conn)
+    agent = AgentClient("http://agent:8000", retries=2, backoff=0.01)
+
+    # Scenario 1: An idempotent call is retried by the client, not again by urllib3
+    with pytest.raises(requests.ConnectTimeout):
+        agent.get("/checkcredentials/1")
+    assert len(connects) == 3
+
+    # Scenario 2: Any other call is retried by urllib3, since the request was never sent
+    connects.clear()
+    with pytest.raises(requests.ConnectTimeout):
+        agent.post("/stop_session/", {"chat_id": "1"})
+    assert len(connects) == 3
+
+
+def test_async_client_runs_calls_concurrently(agent_url):
+    async def scenario():
+        agent = AsyncAgentClient(agent_url, backoff=0.01)
+        started = time.monotonic()
+        responses = await asyncio.gather(*(agent.post("/check_ticker/", {"ticker": "AAPL"}) for _ in range(5)),
+                                         agent.get("/checkcredentials/1"))
+        elapsed = time.monotonic() - started
+        with pytest.raises(httpx.TimeoutException):
+            await agent.post("/stop_session/", {"chat_id": "1"})
+        await agent.aclose()
+        return responses, elapsed
+
+    responses, elapsed = asyncio.run(scenario())
+    assert [response.json() for response in responses] == [{"status": 200}] * 6
+    assert FlakyAgent.calls["/check_ticker/"] == 5 and FlakyAgent.calls["/checkcredentials/1"] == 2
+    assert FlakyAgent.calls["/stop_session/"] == 1
+    assert elapsed < 1
+
+
+def test_async_connect_timeouts_are_retried_by_one_layer_only():
+    connects = []
+
+    def refuse(request):
+        connects.append(request.url.path)
+        raise httpx.ConnectTimeout("Connection timed out", request=request)
+
+    async def call(path):
+        agent = AsyncAgentClient("http://agent:8000", retries=2, backoff=0.01)
+        agent.client = httpx.AsyncClient(base_url=agent.base_url, transport=httpx.MockTransport(refuse))
+        try:
+            with pytest.raises(httpx.ConnectTimeout):
+                await agent.post(path, {"chat_id": "1"})
+        finally:
+            await agent.aclose()
+
+    # Idempotent or not, a call that never reached the agent is tried three times
+    asyncio.run(call("/checkcredentials/"))
+    asyncio.run(call("/stop_session/"))
+    assert connects == ["/checkcredentials/"] * 3 + ["/stop_session/"] * 3
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from alpaca_trade_api.rest import APIError
+
+from alpaca_clients import AlpacaClientRegistry
+
+
+def test_clients_are_shared_per_credentials():
+    with patch('alpaca_clients.tradeapi.REST') as mock_rest:
+        registry = AlpacaClientRegistry("https://paper-api.alpaca.markets", max_clients=2)
+        assert registry.client("key", "secret") is registry.client("key", "secret")
+        registry.client("key", "other secret")
+        registry.client("other key", "secret")
+        assert mock_rest.call_count == 3
+        assert registry.stats()["clients"] == 2
+
+
+def test_account_snapshots_are_single_flight_and_cached():
+    def get_account():
+        time.sleep(0.05)
+        return MagicMock(cash="1500", portfolio_value="2000")
+
+    async def scenario():
+        with patch('alpaca_clients.tradeapi.REST') as mock_rest:
+            mock_rest.return_value.get_account.side_effect = get_account
+            registry = AlpacaClientRegistry("https://paper-api.alpaca.markets", snapshot_ttl=60)
+
+            # Scenario 1: A burst of requests makes one upstream call
+            snapshots = await asyncio.gather(*(registry.account("key", "secret") for _ in range(10)))
+            assert {snapshot.cash for snapshot in snapshots} == {"1500"}
+            assert registry.upstream_calls == 1
+
+            # Scenario 2: Served from the cache within the TTL, refetched when asked to
+            await registry.account("key", "secret")
+            assert registry.upstream_calls == 1
+            await registry.account("key", "secret", fresh=True)
+            assert registry.upstream_calls == 2
+
+            # Scenario 3: Failures are not cached, and only rejected credentials drop their client
+            mock_rest.return_value.get_account.side_effect = requests.Timeout("Read timed out")
+            with pytest.raises(requests.Timeout):
+                await registry.account("slow key", "secret")
+            assert registry.stats()["clients"] == 2
+            forbidden = requests.HTTPError(response=MagicMock(status_code=403))
+            mock_rest.return_value.get_account.side_effect = APIError({"message": "forbidden"}, forbidden)
+            with pytest.raises(APIError):
+                await registry.account("bad key", "secret")
+            assert registry.stats()["clients"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_snapshots_are_dropped_with_their_client():
+    async def scenario():
+        with patch('alpaca_clients.tradeapi.REST') as mock_rest:
+            mock_rest.return_value.get_account.return_value = MagicMock(cash="1500", portfolio_value="2000")
+            registry = AlpacaClientRegistry("https://paper-api.alpaca.markets", snapshot_ttl=60, max_clients=2)
+            for key in ["a", "b", "c"]:
+                await registry.account(key, "secret")
+            return registry.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["clients"] == 2 and stats["snapshots"] == 2
@@ -1,33 +1,69 @@
 import pytest
+import fakeredis
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import datetime, timedelta
 import json
 from pandas import DataFrame
-from TraderAgent.trader_agent import app, Credentials, Session  # Ensure this path is correct
+import TraderAgent.trader_agent
+from TraderAgent.trader_agent import app  # Ensure this path is correct
+from session_engine import SessionEngine
 
 client = TestClient(app)
 
+
+@pytest.fixture
+def fake_redis():
+    """
+    Points the session store and the expiry scheduler at an in-memory Redis and returns a synchronous client on it.
+    """
+    server = fakeredis.FakeServer()
+    fake = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    with patch('TraderAgent.trader_agent.store.redis', fake), patch('TraderAgent.trader_agent.expiry.redis', fake):
+        yield fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+
+
+@pytest.fixture(autouse=True)
+def fresh_alpaca_clients():
+    # Clients and account snapshots are cached across requests; start every test without them.
+    TraderAgent.trader_agent.alpaca_clients.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_engine():
+    # Sessions started by a test must not be found by the next one.
+    with patch.object(TraderAgent.trader_agent, "engine", SessionEngine(TraderAgent.trader_agent.launch_session)):
+        yield
+
+
+def stored_credentials(**session):
+    record = {"api_key": "valid", "api_secret": "valid", "session_alive": False, "ticker": None, "end_time": None, "amount_to_spend": None}
+    record.update(session)
+    return {key: json.dumps(value) for key, value in record.items()}
+
+
 @pytest.mark.asyncio
-async def test_check_credentials():
+async def test_check_credentials(fake_redis):
     chat_id = "123456"
 
-    # Scenario 1: Credentials found
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={"username": '"testuser"', "password": '"testpass"'}) as mock_redis:
-        response = client.get(f"/checkcredentials/{chat_id}")
-        assert response.status_code == 200  # HTTP status code is always 200
-        assert response.json() == {"username": "testuser", "password": "testpass", "status": 200}
-        mock_redis.assert_called_once_with(chat_id)
+    # Scenario 1: Credentials found, values come back typed
+    fake_redis.hset(chat_id, mapping=stored_credentials(api_key="testkey", api_secret="testsecret", session_alive=True, ticker="AAPL", amount_to_spend="1000"))
+    response = client.get(f"/checkcredentials/{chat_id}")
+    assert response.status_code == 200  # HTTP status code is always 200
+    assert response.json() == {"api_key": "testkey", "api_secret": "testsecret", "session_alive": True, "ticker": "AAPL", "end_time": None, "amount_to_spend": "1000", "status": 200}
 
-    # Scenario 2: No credentials found
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={}) as mock_redis:
-        response = client.get(f"/checkcredentials/{chat_id}")
-        assert response.status_code == 200  # HTTP status code is still 200
-        assert response.json() == {"message": "No credentials found", "status": 404}  # Checking the JSON payload for the custom status
-        mock_redis.assert_called_with(chat_id)
+    # Scenario 2: Record written before the session store, with raw strings
+    fake_redis.hset("654321", mapping={"api_key": "rawkey", "api_secret": "rawsecret", "session_alive": "false", "ticker": "AAPL", "end_time": "2024-03-21 15:30:00", "amount_to_spend": "1000"})
+    response = client.get("/checkcredentials/654321")
+    assert response.json() == {"api_key": "rawkey", "api_secret": "rawsecret", "session_alive": False, "ticker": "AAPL", "end_time": "2024-03-21 15:30:00", "amount_to_spend": "1000", "status": 200}
+
+    # Scenario 3: No credentials found
+    response = client.get("/checkcredentials/000000")
+    assert response.status_code == 200  # HTTP status code is still 200
+    assert response.json() == {"message": "No credentials found", "status": 404}  # Checking the JSON payload for the custom status
 
-    # Scenario 3: Exception raised
-    with patch('TraderAgent.trader_agent.r.hgetall', side_effect=Exception("Redis error")) as mock_redis:
+    # Scenario 4: Exception raised
+    with patch('TraderAgent.trader_agent.store.redis.hgetall', new_callable=AsyncMock, side_effect=Exception("Redis error")) as mock_redis:
         response = client.get(f"/checkcredentials/{chat_id}")
         assert response.status_code == 200  # HTTP status code remains 200
         assert response.json() == {"message": "Error retrieving credentials", "status": 500}  # JSON payload indicates an error
@@ -35,7 +71,21 @@ async def test_check_credentials():
 
 
 @pytest.mark.asyncio
-async def test_verify_and_store_credentials():
+async def test_check_credentials_batch(fake_redis):
+    fake_redis.hset("1", mapping=stored_credentials(session_alive=True, ticker="AAPL"))
+    fake_redis.hset("2", mapping=stored_credentials())
+
+    response = client.post("/checkcredentials/", json={"chat_ids": ["1", "2", "3"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == 200
+    assert body["sessions"]["1"]["session_alive"] is True and body["sessions"]["1"]["ticker"] == "AAPL"
+    assert body["sessions"]["2"]["session_alive"] is False and body["sessions"]["2"]["ticker"] is None
+    assert body["sessions"]["3"] is None
+
+
+@pytest.mark.asyncio
+async def test_verify_and_store_credentials(fake_redis):
     valid_credentials = {
         "api_key": "valid_api_key",
         "api_secret": "valid_api_secret",
@@ -49,16 +99,15 @@ async def test_verify_and_store_credentials():
     }
 
     # Scenario 1: Credentials Verified and Stored
-    with patch('TraderAgent.trader_agent.tradeapi.REST') as mock_tradeapi, \
-         patch('TraderAgent.trader_agent.r.hset', new_callable=AsyncMock) as mock_hset:
+    with patch('alpaca_clients.tradeapi.REST') as mock_tradeapi:
         mock_tradeapi.return_value.get_account.return_value = AsyncMock()  # Use AsyncMock for async operations
         response = client.post("/verifyandstorecredentials/", json=valid_credentials)
         assert response.status_code == 200
         assert response.json() == {"message": "Credentials verified, account is active and not restricted from trading.", "status": 200}
-        mock_hset.assert_called()
+        assert fake_redis.hgetall("123456") == {"api_key": '"valid_api_key"', "api_secret": '"valid_api_secret"', "session_alive": "false", "ticker": "null", "end_time": "null", "amount_to_spend": "null"}
 
     # Scenario 2: Invalid Credentials
-    with patch('TraderAgent.trader_agent.tradeapi.REST', side_effect=Exception("Invalid credentials or access forbidden.")) as mock_tradeapi:
+    with patch('alpaca_clients.tradeapi.REST', side_effect=Exception("Invalid credentials or access forbidden.")) as mock_tradeapi:
         response = client.post("/verifyandstorecredentials/", json=invalid_credentials)
         assert response.status_code == 200  # Assuming your endpoint structure always returns HTTP 200
         assert response.json() == {"message": "Invalid credentials or access forbidden.", "status": 404}
@@ -90,8 +139,15 @@ async def test_check_ticker():
         assert response.status_code == 200  # Assuming your endpoint structure always returns HTTP 200
         assert response.json() == {"status": 500, "message": "Internal server error"}
 
+    # Scenario 4: Answered by the ticker index without calling Yahoo Finance
+    with patch.object(TraderAgent.trader_agent.ticker_index, 'symbols', frozenset({"AAPL", "BRK.B"})), \
+        patch('TraderAgent.trader_agent.yf.Ticker') as mock_ticker:
+        assert client.post("/check_ticker/", json={"ticker": "brk-b"}).json() == {"status": 200, "message": "Ticker exists"}
+        assert client.post("/check_ticker/", json=invalid_ticker).json() == {"status": 404, "message": "Ticker not found"}
+        mock_ticker.assert_not_called()
+
 @pytest.mark.asyncio
-async def test_store_and_start_new_session():
+async def test_store_and_start_new_session(fake_redis):
     valid_session = {
         "chat_id": "123456",
         "ticker": "AAPL",
@@ -103,29 +159,26 @@ async def test_store_and_start_new_session():
     insufficient_funds_session["amount_to_spend"] = "1000000"  # Large amount to ensure insufficient funds
 
     # Scenario 1: No Credentials Found
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={}) as mock_redis:
-        response = client.post("/store_and_start_new_session/", json=valid_session)
-        assert response.status_code == 200  # Assuming HTTP 200 is always returned
-        assert response.json() == {"message": "No credentials found", "status": 404}
-        mock_redis.assert_called()
+    response = client.post("/store_and_start_new_session/", json=valid_session)
+    assert response.status_code == 200  # Assuming HTTP 200 is always returned
+    assert response.json() == {"message": "No credentials found", "status": 404}
+
+    fake_redis.hset("123456", mapping=stored_credentials())
 
     # Scenario 2: Insufficient Funds
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={"api_key": "valid", "api_secret": "valid"}), \
-         patch('TraderAgent.trader_agent.tradeapi.REST') as mock_tradeapi:
+    with patch('alpaca_clients.tradeapi.REST') as mock_tradeapi:
         mock_tradeapi.return_value.get_account.return_value = MagicMock(cash="500")  # Less cash than amount_to_spend
         response = client.post("/store_and_start_new_session/", json=insufficient_funds_session)
         assert response.status_code == 200
         assert response.json() == {"status": 403, "message": "Insufficient funds"}
 
     # Scenario 3: Session Saved and Started Successfully
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={"api_key": "valid", "api_secret": "valid"}), \
-        patch('TraderAgent.trader_agent.tradeapi.REST') as mock_tradeapi, \
-        patch('TraderAgent.trader_agent.r.hset', new_callable=AsyncMock) as mock_hset, \
+    TraderAgent.trader_agent.alpaca_clients.clear()
+    with patch('alpaca_clients.tradeapi.REST') as mock_tradeapi, \
         patch('TraderAgent.trader_agent.Alpaca') as mock_alpaca, \
         patch('TraderAgent.trader_agent.MLStrategy') as mock_ml_strategy, \
-        patch('TraderAgent.trader_agent.trader.add_strategy', new_callable=AsyncMock) as mock_add_strategy, \
-        patch('TraderAgent.trader_agent.trader.run_all_async', new_callable=AsyncMock) as mock_run_all_async, \
-        patch('TraderAgent.trader_agent.check_and_stop_session', new_callable=AsyncMock) as mock_check_and_stop:
+        patch('TraderAgent.trader_agent.Trader') as mock_trader, \
+        patch('TraderAgent.trader_agent.expiry.schedule', new_callable=AsyncMock) as mock_schedule:
 
         # Setup mock objects and return values
         mock_tradeapi.return_value.get_account.return_value = MagicMock(cash="1500")
@@ -139,48 +192,115 @@ async def test_store_and_start_new_session():
         assert response.json() == {"status": 200, "message": "Session saved and started succesfully"} 
 
         # Additional assertions to ensure the mocks were called as expected
-        mock_hset.assert_called()
-        mock_add_strategy.assert_called_with(mock_strategy)
-        mock_run_all_async.assert_called()
-        mock_check_and_stop.assert_called()
+        stored = client.get("/checkcredentials/123456").json()
+        assert stored["session_alive"] is True
+        assert stored["ticker"] == "AAPL"
+        assert stored["amount_to_spend"] == "1000"
+        mock_trader.return_value.add_strategy.assert_called_with(mock_strategy)
+        mock_trader.return_value.run_all_async.assert_called()
+        assert mock_schedule.call_args.args[0] == "123456"
+        assert mock_ml_strategy.call_args.kwargs["parameters"]["chat_id"] == valid_session["chat_id"]
+        assert "123456" in TraderAgent.trader_agent.engine
 
     # Scenario 4: Internal Server Error
-    with patch('TraderAgent.trader_agent.r.hgetall', side_effect=Exception("Internal server error")) as mock_redis:
+    with patch('TraderAgent.trader_agent.store.get', new_callable=AsyncMock, side_effect=Exception("Internal server error")) as mock_redis:
         response = client.post("/store_and_start_new_session/", json=valid_session)
         assert response.status_code == 200  # Assuming HTTP 200 is always returned
         assert response.json() == {"status": 500, "message": "Internal server error"}
         mock_redis.assert_called()
 
+    # Scenario 5: A session whose record could not be saved does not keep running
+    TraderAgent.trader_agent.engine.stop("123456")
+    with patch('alpaca_clients.tradeapi.REST') as mock_tradeapi, \
+        patch('TraderAgent.trader_agent.Alpaca'), \
+        patch('TraderAgent.trader_agent.MLStrategy'), \
+        patch('TraderAgent.trader_agent.Trader') as mock_trader, \
+        patch('TraderAgent.trader_agent.store.update', new_callable=AsyncMock, side_effect=Exception("Redis is down")):
+        mock_tradeapi.return_value.get_account.return_value = MagicMock(cash="1500")
+        response = client.post("/store_and_start_new_session/", json=valid_session)
+        assert response.json() == {"status": 500, "message": "Internal server error"}
+        assert "123456" not in TraderAgent.trader_agent.engine
+        mock_trader.return_value.stop_all.assert_called()
+
 @pytest.mark.asyncio
-async def test_stop_session():
+async def test_stop_session(fake_redis):
     session_data = {
         "chat_id": "123456",
-        "ticker": "AAPL",
-        "amount_to_spend": "1000",
-        "session_alive": True,
-        "end_time": "2023-01-01 12:00:00"
+        "ticker": None,
+        "amount_to_spend": None,
+        "session_alive": False,
+        "end_time": None
     }
 
     # Scenario 1: No Credentials Found
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value={}) as mock_redis:
+    response = client.post("/stop_session/", json=session_data)
+    assert response.status_code == 200
+    assert response.json() == {"message": "No credentials found", "status": 404}
+
+    # Scenario 2: Session Stopped Successfully
+    fake_redis.hset("123456", mapping=stored_credentials(session_alive=True, ticker="AAPL", end_time="2023-01-01 12:00:00", amount_to_spend="1000"))
+    fake_redis.zadd("session_expiry", {"123456": datetime(2023, 1, 1, 10).timestamp()})
+    with patch('alpaca_clients.tradeapi.REST') as mock_tradeapi:
+        mock_tradeapi.return_value.get_account.return_value = MagicMock(cash="900", portfolio_value="1100")
         response = client.post("/stop_session/", json=session_data)
         assert response.status_code == 200
-        assert response.json() == {"message": "No credentials found", "status": 404}
-        mock_redis.assert_called_once_with(session_data["chat_id"])
+        assert response.json() == {"status": 200, "message": "Session stopped succesfully", "counter": 0, "cash_value": "900", "portfolio_value": "1100"}
+        assert fake_redis.hgetall("123456") == stored_credentials()
+        assert fake_redis.zscore("session_expiry", "123456") is None
 
-     # Scenario 2: Session Stopped Successfully
-    with patch('TraderAgent.trader_agent.r.hgetall', return_value=session_data), \
-         patch('TraderAgent.trader_agent.r.hset', new_callable=AsyncMock) as mock_hset, \
-         patch('TraderAgent.trader_agent.stop_session_for_chat_id', return_value={"status": 200, "message": "Session stopped successfully"}) as mock_stop_session:
+        # The recap is read from Alpaca again, even with a recent snapshot cached
+        mock_tradeapi.return_value.get_account.return_value = MagicMock(cash="800", portfolio_value="1200")
         response = client.post("/stop_session/", json=session_data)
-        assert response.status_code == 200
-        assert response.json() == {"status": 200, "message": "Session stopped successfully"}
-        mock_stop_session.assert_called_once_with(session_data["chat_id"])
-        mock_redis.assert_called_once_with(session_data["chat_id"])
+        assert response.json()["cash_value"] == "800" and response.json()["portfolio_value"] == "1200"
 
     # Scenario 3: Internal Server Error
-    with patch('TraderAgent.trader_agent.r.hgetall', side_effect=Exception("Internal server error")) as mock_redis:
+    with patch('TraderAgent.trader_agent.store.get', new_callable=AsyncMock, side_effect=Exception("Internal server error")) as mock_redis:
         response = client.post("/stop_session/", json=session_data)
         assert response.status_code == 200
         assert response.json() == {"status": 500, "message": "Internal server error"}
-        mock_redis.assert_called_once_with(session_data["chat_id"])
\ No newline at end of file
+        mock_redis.assert_called_once_with(session_data["chat_id"])
+
+@pytest.mark.asyncio
+async def test_warmup_and_ready():
+    # Scenario 1: Warm-up loads the (stub) model
+    response = client.post("/warmup")
+    assert response.status_code == 200
+    assert response.json()["status"] == 200
+    assert response.json()["backend"] == "stub"
+
+    # Scenario 2: Readiness reports the startup timings
+    response = client.get("/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == 200 and body["ready"] is True
+    assert body["import_seconds"] is not None
+    assert body["first_request_seconds"] is not None
+
+    # Scenario 3: Warm-up failure
+    with patch('TraderAgent.trader_agent.sentiment.warmup', side_effect=Exception("Model error")):
+        response = client.post("/warmup")
+        assert response.json() == {"status": 500, "message": "Error warming up the model"}
+
+@pytest.mark.asyncio
+async def test_trace_and_profile_endpoints():
+    tracer = TraderAgent.trader_agent.tracer
+
+    # Scenario 1: Unknown sessions are not found, whatever the format
+    for format in ("json", "chrome"):
+        response = client.get(f"/sessions/unknown/trace?format={format}")
+        assert response.json() == {"status": 404, "message": "No trace for this session"}
+
+    # Scenario 2: Traced sessions are served in both formats
+    with tracer.span("iteration", key="traced"):
+        pass
+    assert client.get("/sessions/traced/trace").json()["spans"][0]["name"] == "iteration"
+    assert client.get("/sessions/traced/trace?format=chrome").json()["traceEvents"][0]["name"] == "iteration"
+    tracer.drop("traced")
+
+    # Scenario 3: Profiling requires the admin token, and is disabled without one
+    assert client.post("/admin/profile/", json={"seconds": 0.01}).json() == {"status": 403, "message": "Forbidden"}
+    with patch('TraderAgent.trader_agent.ADMIN_TOKEN', "secret"):
+        response = client.post("/admin/profile/", json={"seconds": 0.01}, headers={"X-Admin-Token": "wrong"})
+        assert response.json() == {"status": 403, "message": "Forbidden"}
+        response = client.post("/admin/profile/", json={"seconds": 0.05}, headers={"X-Admin-Token": "secret"})
+        assert response.json()["status"] == 200
@@ -0,0 +1,72 @@
+import pandas as pd
+
+from backtest import load_bars, load_news, news_windows, run_backtest
+from sentiment import Backend
+from sentiment_store import SentimentStore
+
+
+def keyword_logits(news):
+    # Strongly negative, neutral or positive depending on a keyword.
+    return [[8, 0, 0] if "miss" in headline else [0, 0, 8] if "beat" in headline else [0, 8, 0] for headline in news]
+
+
+def test_news_windows_hold_the_last_three_days():
+    days = pd.to_datetime(["2024-01-02", "2024-01-06"])
+    news = pd.DataFrame({"created_at": pd.to_datetime(["2023-12-29 10:00", "2024-01-01 09:00", "2024-01-02 15:00", "2024-01-05 12:00"]),
+                         "headline": ["old", "a", "b", "c"]})
+    assert news_windows(days, news) == [["b", "a"], ["c"]]
+    assert news_windows(days, news, limit=1) == [["b"], ["c"]]
+
+
+def test_backtest_scores_once_and_follows_the_rules(tmp_path):
+    (tmp_path / "bars.csv").write_text("Date,Open,High,Low,Close\n"
+                                       "2024-01-02,100,101,99,100\n"
+                                       "2024-01-03,100,110,99,105\n"
+                                       "2024-01-04,105,106,104,105\n"
+                                       "2024-01-10,105,106,104,105\n"
+                                       "2024-01-11,105,121,104,120\n")
+    (tmp_path / "news.jsonl").write_text('{"created_at": "2024-01-02T13:00:00Z", "headline": "Earnings beat"}\n'
+                                         '{"created_at": "2024-01-10T13:00:00Z", "headline": "Guidance miss"}\n')
+    calls = []
+
+    def score(news):
+        calls.append(list(news))
+        return keyword_logits(news)
+
+    report = run_backtest(load_bars(str(tmp_path / "bars.csv")), load_news(str(tmp_path / "news.jsonl")),
+                          amount_to_spend=1000, cash=10000, score=score, aggregate=Backend().aggregate)
+
+    # One batched pass over the distinct headlines
+    assert calls == [["Earnings beat", "Guidance miss"]]
+    # The "beat" is seen from the 2nd to the 4th: buy 10 at 100, then 9 at 105 twice. On the 10th
+    # the "miss" closes the 3 lots at 105 and opens a short of 9 at 105. On the 11th its stop loss
+    # (110.25) is hit and a new short of 8 is opened at the close, 120.
+    assert report["trades"] == 6
+    assert round(report["pnl"], 2) == round(10 * 5 - 9 * 5.25, 2)
+    assert report["days"] == 5 and report["days_per_second"] > 0
+
+
+def test_backtest_reuses_the_days_in_the_sentiment_store(tmp_path):
+    (tmp_path / "bars.csv").write_text("Date,Open,High,Low,Close\n"
+                                       "2024-01-02,100,101,99,100\n"
+                                       "2024-01-03,100,110,99,105\n")
+    (tmp_path / "news.jsonl").write_text('{"created_at": "2024-01-02T13:00:00Z", "headline": "Earnings beat"}\n'
+                                         '{"created_at": "2024-01-03T13:00:00Z", "headline": "Guidance miss"}\n')
+    bars, news = load_bars(str(tmp_path / "bars.csv")), load_news(str(tmp_path / "news.jsonl"))
+    store = SentimentStore(str(tmp_path / "store"))
+    calls = []
+
+    def score(news):
+        calls.append(list(news))
+        return keyword_logits(news)
+
+    # Scenario 1: The first run scores every day and fills the store
+    first = run_backtest(bars, news, 1000, 10000, score=score, aggregate=Backend().aggregate, store=store, symbol="AAPL")
+    assert calls == [["Earnings beat", "Guidance miss"]]
+    assert store.read("AAPL").labels() == ["positive", "negative"]
+
+    # Scenario 2: The next run reads them back without scoring and trades the same way
+    calls.clear()
+    second = run_backtest(bars, news, 1000, 10000, score=score, aggregate=Backend().aggregate, store=store, symbol="AAPL")
+    assert calls == [] and second["headlines_scored"] == 0
+    assert second["trades"] == first["trades"] and second["pnl"] == first["pnl"]
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+from dispatcher import NotificationDispatcher, TokenBucket
+
+
+def test_token_bucket_spaces_out_bursts():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert abs(bucket.reserve() - 0.1) < 0.01
+    assert abs(bucket.reserve() - 0.2) < 0.01
+
+
+def test_bursts_are_coalesced_per_chat_and_failures_retried():
+    sent = []
+    attempts = {"count": 0}
+    lock = threading.Lock()
+
+    def send(chat_id, text):
+        with lock:
+            if chat_id == "flaky" and attempts["count"] < 2:
+                attempts["count"] += 1
+                raise ConnectionError("Telegram is unreachable")
+            sent.append((chat_id, text))
+
+    async def scenario():
+        dispatcher = NotificationDispatcher(send, workers=4, global_rate=1000, chat_rate=5, chat_burst=1,
+                                            backoff=0.01, max_backoff=0.05)
+        dispatcher.start()
+        started = time.monotonic()
+        futures = [dispatcher.submit("busy", f"trade {i}") for i in range(10)]
+        futures += [dispatcher.submit("quiet", "trade 0"), dispatcher.submit("flaky", "trade 0")]
+        await asyncio.gather(*futures)
+        elapsed = time.monotonic() - started
+        await dispatcher.stop()
+        return dispatcher.stats(), elapsed
+
+    stats, elapsed = asyncio.run(scenario())
+
+    # Scenario 1: The burst of one chat is merged and keeps its order
+    busy = [text for chat_id, text in sent if chat_id == "busy"]
+    assert "\n\n".join(busy) == "\n\n".join(f"trade {i}" for i in range(10))
+    assert len(busy) < 10
+
+    # Scenario 2: Other chats are not held back, and failed sends are retried
+    assert ("quiet", "trade 0") in sent and ("flaky", "trade 0") in sent
+    assert stats["retries"] == 2 and stats["failures"] == 0
+    assert stats["messages_sent"] == 12 and stats["queue_depth"] == 0
+    assert stats["latency_p99_seconds"] is not None
+    assert elapsed < 1
+
+
+def test_buckets_of_quiet_chats_are_dropped():
+    async def scenario():
+        dispatcher = NotificationDispatcher(lambda chat_id, text: None, workers=4, global_rate=1000,
+                                            chat_rate=100, chat_burst=1)
+        dispatcher.start()
+        await asyncio.gather(*(dispatcher.submit(str(chat_id), "trade") for chat_id in range(50)))
+        buckets = len(dispatcher.chat_buckets)
+        await asyncio.sleep(1.1)
+        await dispatcher.submit("late", "trade")
+        await dispatcher.stop()
+        return buckets, dispatcher.stats()["chat_buckets"]
+
+    assert asyncio.run(scenario()) == (50, 1)
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+
+from expiry_scheduler import ExpiryScheduler
+
+
+def test_sessions_expire_in_deadline_order():
+    async def scenario():
+        expired = []
+
+        async def on_expire(chat_id):
+            expired.append(chat_id)
+
+        scheduler = ExpiryScheduler(fakeredis.FakeAsyncRedis(decode_responses=True), on_expire)
+        scheduler.start()
+        now = datetime.now()
+        await scheduler.schedule("late", now + timedelta(seconds=0.2))
+        await scheduler.schedule("early", now + timedelta(seconds=0.05))
+        await scheduler.schedule("cancelled", now + timedelta(seconds=0.1))
+        await scheduler.cancel("cancelled")
+        # Moved from before "early" to after "late".
+        await scheduler.schedule("moved", now + timedelta(seconds=0.01))
+        await scheduler.schedule("moved", now + timedelta(seconds=0.3))
+
+        await asyncio.sleep(0.5)
+        await scheduler.stop()
+        assert expired == ["early", "late", "moved"]
+        assert await scheduler.redis.zcard(scheduler.key) == 0
+        assert scheduler.stats()["max_lateness_seconds"] < 0.1
+
+    asyncio.run(scenario())
+
+
+def test_overdue_deadlines_fire_after_a_restart():
+    async def scenario():
+        expired = []
+
+        async def on_expire(chat_id):
+            expired.append(chat_id)
+
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await redis.zadd("session_expiry", {"overdue": time.time() - 3600, "pending": time.time() + 3600})
+
+        scheduler = ExpiryScheduler(redis, on_expire)
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        assert expired == ["overdue"]
+        assert await redis.zrange("session_expiry", 0, -1) == ["pending"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import fakeredis
+from prometheus_client.parser import text_string_to_metric_families
+
+import metrics
+from metrics import STAGE_SECONDS, StatsCollector, TimedAsyncRedis, exposition
+
+
+def sample_value(name, **labels):
+    body, _ = exposition()
+    for family in text_string_to_metric_families(body.decode()):
+        for sample in family.samples:
+            if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return None
+
+
+def test_stage_timings_and_component_stats():
+    # Scenario 1: Stages are recorded as histograms
+    before = sample_value("trader_stage_seconds_count", stage="get_news") or 0
+    with STAGE_SECONDS.labels("get_news").time():
+        pass
+    assert sample_value("trader_stage_seconds_count", stage="get_news") == before + 1
+
+    # Scenario 2: Component stats are read at scrape time, numbers only
+    collector = StatsCollector("test")
+    metrics.registry.register(collector)
+    try:
+        depth = {"queue_depth": 3, "mode": "replay", "latency": None}
+        collector.add("queue", lambda: depth)
+        assert sample_value("test_queue_queue_depth") == 3
+        depth["queue_depth"] = 5
+        assert sample_value("test_queue_queue_depth") == 5
+        assert sample_value("test_queue_mode") is None
+    finally:
+        metrics.registry.unregister(collector)
+
+
+def test_stats_of_session_workers_are_labelled_by_process():
+    collector = StatsCollector("test")
+    collector.add("expiry", lambda: {"scheduled": 2})
+    collector.add("news_feed", lambda: {"symbols": 7}, sessions=True)
+    metrics.registry.register(collector)
+    try:
+        # Scenario 1: Without workers, every component is read in this process
+        assert sample_value("test_news_feed_symbols") == 7
+
+        # Scenario 2: With workers, the session components are read from them instead
+        collector.workers = lambda: [{"news_feed": {"symbols": 3}}, {"news_feed": {"symbols": 4}}]
+        assert sample_value("test_expiry_scheduled", process="api") == 2
+        assert sample_value("test_news_feed_symbols", process="api") is None
+        assert sample_value("test_news_feed_symbols", process="session-worker-0") == 3
+        assert sample_value("test_news_feed_symbols", process="session-worker-1") == 4
+    finally:
+        metrics.registry.unregister(collector)
+
+
+def test_redis_commands_are_timed():
+    async def scenario():
+        client = TimedAsyncRedis(connection_pool=fakeredis.FakeAsyncRedis().connection_pool)
+        before = sample_value("trader_redis_command_seconds_count", command="set") or 0
+        await client.set("key", "value")
+        assert await client.get("key") == b"value"
+        assert sample_value("trader_redis_command_seconds_count", command="set") == before + 1
+        assert sample_value("trader_redis_command_seconds_count", command="get") >= 1
+
+    asyncio.run(scenario())
+
+
+WORKER_SCRIPT = """
+import multiprocessing
+
+import metrics
+
+
+def observe():
+    with metrics.stage("get_news"):
+        pass
+
+
+if __name__ == "__main__":
+    observe()
+    worker = multiprocessing.get_context("spawn").Process(target=observe)
+    worker.start()
+    worker.join()
+    print(metrics.exposition()[0].decode())
+"""
+
+
+def test_metrics_of_worker_processes_are_merged(tmp_path):
+    script = tmp_path / "scrape.py"
+    script.write_text(WORKER_SCRIPT)
+    (tmp_path / "metrics").mkdir()
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path / "metrics"),
+           "PYTHONPATH": os.path.dirname(metrics.__file__)}
+    body = subprocess.run([sys.executable, str(script)], env=env, capture_output=True, text=True, check=True).stdout
+
+    counts = [sample.value for family in text_string_to_metric_families(body) for sample in family.samples
+              if sample.name == "trader_stage_seconds_count" and sample.labels.get("stage") == "get_news"]
+    assert counts == [2]
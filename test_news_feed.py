@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from alpaca_trade_api.entity_v2 import NewsListV2
+
+from news_feed import NewsFeed, format_timestamp
+
+
+def news(*items):
+    return NewsListV2([{"id": item_id, "headline": headline, "created_at": format_timestamp(created_at)}
+                       for item_id, headline, created_at in items])
+
+
+def test_news_feed_incremental_window():
+    now = datetime(2024, 3, 10, 15, 0, tzinfo=timezone.utc)
+    api = MagicMock()
+    feed = NewsFeed(window=timedelta(days=3), limit=10, refresh_seconds=0)
+
+    # Scenario 1: First read fetches the whole window
+    api.get_news.return_value = news((1, "Old news", now - timedelta(days=2)), (2, "Fresh news", now - timedelta(hours=1)))
+    assert feed.headlines("AAPL", api, now) == ["Fresh news", "Old news"]
+    api.get_news.assert_called_with(symbol="AAPL", start="2024-03-07T15:00:00Z", limit=10)
+
+    # Scenario 2: Next read only asks for newer items and evicts expired ones
+    later = now + timedelta(days=1, hours=12)
+    api.get_news.return_value = news((2, "Fresh news", now - timedelta(hours=1)), (3, "Breaking news", later))
+    assert feed.headlines("AAPL", api, later) == ["Breaking news", "Fresh news"]
+    api.get_news.assert_called_with(symbol="AAPL", start="2024-03-10T14:00:00Z", limit=10)
+
+
+def test_news_feed_shared_between_sessions():
+    now = datetime(2024, 3, 10, 15, 0, tzinfo=timezone.utc)
+    api = MagicMock()
+    api.get_news.return_value = news((1, "Fresh news", now))
+    feed = NewsFeed(refresh_seconds=60)
+
+    for _ in range(5):
+        assert feed.headlines("AAPL", api, now) == ["Fresh news"]
+    assert api.get_news.call_count == 1
+    assert feed.stats() == {"symbols": 1, "reads": 5, "api_calls": 1, "evicted": 0}
+
+
+def test_news_feed_refreshes_a_basket_in_one_call():
+    now = datetime(2024, 3, 10, 15, 0, tzinfo=timezone.utc)
+    api = MagicMock()
+    api.get_news.return_value = NewsListV2([
+        {"id": 1, "headline": "Apple news", "created_at": format_timestamp(now), "symbols": ["AAPL"]},
+        {"id": 2, "headline": "Big tech news", "created_at": format_timestamp(now), "symbols": ["AAPL", "MSFT", "GOOG"]},
+    ])
+    feed = NewsFeed(limit=10, refresh_seconds=60)
+
+    assert feed.headlines_many(["MSFT", "AAPL", "TSLA"], api, now) == {
+        "AAPL": ["Apple news", "Big tech news"], "MSFT": ["Big tech news"], "TSLA": []}
+    api.get_news.assert_called_once_with(symbol="AAPL,MSFT,TSLA", start="2024-03-07T15:00:00Z", limit=30)
+    # The single-symbol reads that follow are served from the same windows
+    assert feed.headlines("MSFT", api, now) == ["Big tech news"]
+    assert api.get_news.call_count == 1
+
+
+def test_news_feed_drops_idle_windows():
+    now = datetime(2024, 3, 10, 15, 0, tzinfo=timezone.utc)
+    api = MagicMock()
+    api.get_news.return_value = news((1, "Fresh news", now))
+    feed = NewsFeed(refresh_seconds=60, idle_seconds=.05)
+
+    # Scenario 1: Streamed items of symbols nobody reads are not kept
+    feed.add("TSLA", 2, now, "Tesla news")
+    assert feed.stats()["symbols"] == 0
+
+    # Scenario 2: A window nobody read for idle_seconds is dropped on the next read
+    feed.headlines("AAPL", api, now)
+    time.sleep(.1)
+    feed.headlines("MSFT", api, now)
+    assert list(feed._windows) == ["MSFT"]
+    assert feed.stats()["evicted"] == 1
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+from news_feed import NewsFeed
+from news_trigger import NewsTrigger, ReplaySource
+
+
+class Recorder:
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.events = []
+        self.called = threading.Event()
+
+    def __call__(self, event):
+        self.events.append((time.monotonic(), event))
+        self.trigger.ordered(event)
+        self.called.set()
+
+
+def test_burst_of_headlines_triggers_once():
+    trigger = NewsTrigger(debounce=.05, max_wait=1, min_interval=0)
+    recorder = Recorder(trigger)
+    trigger.subscribe("session-1", ["AAPL", "MSFT"], recorder)
+
+    for symbol in ["AAPL", "MSFT", "AAPL"]:
+        trigger.publish(symbol, "headline")
+    trigger.publish("TSLA", "not subscribed")
+    assert recorder.called.wait(1)
+    time.sleep(.1)
+
+    assert len(recorder.events) == 1
+    event = recorder.events[0][1]
+    assert event.symbols == {"AAPL", "MSFT"} and event.headlines == 3
+    stats = trigger.stats()
+    assert stats["headlines"] == 4 and stats["triggers"] == 1 and stats["coalesced"] == 2
+    assert 0.05 <= stats["order_latency_p50"] < 0.5
+
+
+def test_minimum_interval_defers_the_next_evaluation():
+    trigger = NewsTrigger(debounce=0, max_wait=0, min_interval=.3)
+    recorder = Recorder(trigger)
+    trigger.subscribe("session-1", ["AAPL"], recorder)
+
+    # Scenario 1: The session just iterated on its timer, so the news waits for the interval
+    trigger.ran("session-1")
+    started = time.monotonic()
+    trigger.publish("AAPL", "headline")
+    assert recorder.called.wait(1)
+    assert recorder.events[0][0] - started >= .25
+    assert trigger.stats()["deferred"] == 1
+
+    # Scenario 2: Unsubscribed sessions are not triggered anymore
+    recorder.called.clear()
+    trigger.unsubscribe("session-1")
+    trigger.publish("AAPL", "headline")
+    assert not recorder.called.wait(.4)
+
+
+def test_replayed_news_reaches_the_feed_and_the_trigger(tmp_path):
+    path = tmp_path / "news.jsonl"
+    path.write_text("\n".join(json.dumps(item) for item in [
+        {"id": 1, "headline": "Apple beats", "created_at": "2024-01-02T13:00:00Z", "symbols": ["AAPL"]},
+        {"id": 2, "headline": "Apple slips", "created_at": "2024-01-02T13:00:01Z", "symbols": ["AAPL"]},
+    ]))
+    feed = NewsFeed()
+    # The session's first iteration has read the window, before any news came in.
+    feed.headlines("AAPL", MagicMock(**{"get_news.return_value": []}))
+    trigger = NewsTrigger(debounce=.05, max_wait=1, min_interval=0, feed=feed)
+    recorder = Recorder(trigger)
+    trigger.subscribe("session-1", ["AAPL"], recorder)
+
+    source = ReplaySource(str(path), speed=20)
+    trigger.start(source)
+    assert source.done.wait(1) and recorder.called.wait(1)
+    assert sorted(headline for _, headline in feed._windows["AAPL"].items.values()) == ["Apple beats", "Apple slips"]
+    assert trigger.stats()["mode"] == "replay"
+
+
+def test_held_evaluation_runs_later_with_the_news_since():
+    trigger = NewsTrigger(debounce=0, max_wait=0, min_interval=0)
+    events = []
+    called = threading.Event()
+
+    def on_news(event):
+        # The market is closed on the first call
+        if not events:
+            trigger.hold("session-1", event, .3)
+        else:
+            called.set()
+        events.append((time.monotonic(), event))
+
+    trigger.subscribe("session-1", ["AAPL"], on_news)
+    started = time.monotonic()
+    trigger.publish("AAPL", "headline")
+    time.sleep(.1)
+    trigger.publish("AAPL", "headline while closed")
+    assert called.wait(1)
+
+    assert len(events) == 2
+    ran_at, event = events[1]
+    assert ran_at - started >= .25 and event.headlines == 2
+    assert trigger.stats()["held"] == 1
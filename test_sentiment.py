@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+import fakeredis
+import pytest
+
+import sentiment
+from sentiment import StubBackend, TorchBackend, bucket_by_length, estimate_sentiment, estimate_sentiments
+
+
+def run_sentiment(code, **env):
+    """
+    Runs `code` in a fresh interpreter, where no other test has imported anything yet.
+
+    Returns:
+        str: The last line it printed.
+    """
+    env = {**os.environ, **env, "PYTHONPATH": os.path.dirname(sentiment.__file__)}
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout.splitlines()[-1]
+
+
+def test_stub_backend_skips_torch():
+    loaded = run_sentiment("import sys, sentiment\n"
+                           "assert type(sentiment.get_backend()).__name__ == 'StubBackend' and sentiment.is_ready()\n"
+                           "print(sorted(module for module in ('torch', 'transformers') if module in sys.modules))",
+                           SENTIMENT_BACKEND="stub")
+    assert loaded == "[]"
+
+
+def test_estimate_sentiment_matches_uncached_aggregate(monkeypatch):
+    monkeypatch.setattr(sentiment.cache, "redis_client", fakeredis.FakeStrictRedis(decode_responses=True))
+    news = ["Stocks rally", "Earnings miss", "Stocks rally"]
+    expected = StubBackend().aggregate(StubBackend().score(news))
+
+    assert estimate_sentiment(news) == expected
+    misses = sentiment.cache.stats()["misses"]
+    assert estimate_sentiment(news) == expected
+    assert sentiment.cache.stats()["misses"] == misses
+    assert estimate_sentiment([]) == (0, "positive")
+
+
+def test_estimate_sentiments_scores_a_basket_in_one_batch(monkeypatch):
+    monkeypatch.setattr(sentiment.cache, "redis_client", fakeredis.FakeStrictRedis(decode_responses=True))
+    news = {"AAPL": ["Apple beats", "Chips rally"], "NVDA": ["Chips rally", "Nvidia slips"], "TSLA": []}
+    calls = []
+    score = sentiment.batcher.score
+    with monkeypatch.context() as patched:
+        patched.setattr(sentiment.batcher, "score", lambda headlines: calls.append(headlines) or score(headlines))
+        result = estimate_sentiments(news)
+
+    assert calls == [["Apple beats", "Chips rally", "Nvidia slips"]]
+    assert result == {symbol: estimate_sentiment(headlines) for symbol, headlines in news.items()}
+
+
+def test_torch_aggregate_returns_a_float():
+    torch = pytest.importorskip("torch")
+    backend = TorchBackend.__new__(TorchBackend)
+    backend.torch = torch
+    rows = [[2.0, 0.5, -1.0], [0.3, 1.2, 0.1]]
+
+    probability, label = backend.aggregate(rows)
+    assert type(probability) is float
+    expected_probability, expected_label = StubBackend().aggregate(rows)
+    assert label == expected_label
+    assert probability == pytest.approx(expected_probability, rel=1e-6)
+
+
+def test_cached_logits_are_keyed_by_max_length():
+    namespace = "import sentiment; print(sentiment.cache.namespace)"
+    assert run_sentiment(namespace, SENTIMENT_MAX_LENGTH="64") != run_sentiment(namespace, SENTIMENT_MAX_LENGTH="128")
+
+
+def test_bucket_by_length():
+    lengths = [3, 40, 20, 5, 100, 17, 9]
+
+    buckets = bucket_by_length(lengths, edges=[16, 32, 64], bucket_size=2)
+    assert buckets == [[0, 3], [6], [5, 2], [1], [4]]
+    assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+    assert bucket_by_length([]) == []
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from sentiment import SentimentBatcher, StubBackend
+
+
+def test_batcher_merges_concurrent_requests():
+    calls = []
+    gate = threading.Event()
+
+    def score(news):
+        gate.wait()
+        calls.append(list(news))
+        return StubBackend().score(news)
+
+    batcher = SentimentBatcher(score_fn=score, max_batch=8, max_wait_ms=50)
+    first = batcher.submit(["a"])
+    others = [batcher.submit([f"b{i}", f"c{i}"]) for i in range(3)]
+    gate.set()
+
+    assert first.result(timeout=5) == StubBackend().score(["a"])
+    for i, future in enumerate(others):
+        assert future.result(timeout=5) == StubBackend().score([f"b{i}", f"c{i}"])
+    # The first request may be scored alone while the others queue up, but never one call each.
+    assert len(calls) <= 2
+    assert batcher.stats()["headlines"] == 7
+
+
+def test_batcher_flushes_a_partial_batch_after_max_wait():
+    batcher = SentimentBatcher(score_fn=StubBackend().score, max_batch=64, max_wait_ms=20)
+
+    # Scenario 1: A lone request is scored once the wait is over, without filling the batch
+    started = time.monotonic()
+    assert batcher.score(["a", "b"]) == StubBackend().score(["a", "b"])
+    assert time.monotonic() - started < 2
+    assert batcher.stats() == {"requests": 1, "batches": 1, "headlines": 2, "queue_depth": 0}
+
+    # Scenario 2: A later request gets a batch of its own
+    assert batcher.score(["c"]) == StubBackend().score(["c"])
+    assert batcher.stats()["batches"] == 2
+
+
+def test_batcher_never_exceeds_max_batch():
+    sizes = []
+    gate = threading.Event()
+
+    def score(news):
+        gate.wait()
+        sizes.append(len(news))
+        return StubBackend().score(news)
+
+    batcher = SentimentBatcher(score_fn=score, max_batch=4, max_wait_ms=50)
+    futures = [batcher.submit([f"{i}-{j}" for j in range(3)]) for i in range(4)]
+    gate.set()
+
+    for i, future in enumerate(futures):
+        assert future.result(timeout=5) == StubBackend().score([f"{i}-{j}" for j in range(3)])
+    assert max(sizes) <= 4 and sum(sizes) == 12
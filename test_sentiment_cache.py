@@ -0,0 +1,37 @@
+import fakeredis
+import redis
+from unittest.mock import MagicMock
+
+from sentiment_cache import SentimentCache
+
+
+def test_sentiment_cache_tiers():
+    shared = fakeredis.FakeStrictRedis(decode_responses=True)
+    cache = SentimentCache(shared, max_entries=2)
+
+    # Scenario 1: Nothing scored yet
+    assert cache.get_many(["up", "down"]) == [None, None]
+    assert cache.stats()["misses"] == 2
+
+    # Scenario 2: Local hits, LRU eviction falls back to Redis
+    cache.put_many(["up", "down", "flat"], [[0.1, 0.2, 0.7], [0.8, 0.1, 0.1], [0.2, 0.6, 0.2]])
+    assert cache.get_many(["flat", "up"]) == [[0.2, 0.6, 0.2], [0.1, 0.2, 0.7]]
+    stats = cache.stats()
+    assert stats["hits_local"] == 1
+    assert stats["hits_redis"] == 1
+    assert stats["size"] == 2
+
+    # Scenario 3: Another process sees the shared tier
+    other = SentimentCache(shared)
+    assert other.get_many(["down"]) == [[0.8, 0.1, 0.1]]
+
+
+def test_sentiment_cache_redis_down():
+    broken = MagicMock()
+    broken.mget.side_effect = redis.ConnectionError("Redis error")
+    broken.pipeline.side_effect = redis.ConnectionError("Redis error")
+    cache = SentimentCache(broken)
+
+    cache.put_many(["up"], [[0.1, 0.2, 0.7]])
+    assert cache.get_many(["up", "down"]) == [[0.1, 0.2, 0.7], None]
+    assert cache.stats()["redis_errors"] == 2
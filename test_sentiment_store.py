@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from datetime import date
+
+import numpy as np
+
+from sentiment_store import SentimentStore
+
+
+def test_append_and_range_reads(tmp_path):
+    store = SentimentStore(str(tmp_path))
+    store.append("AAPL", date(2024, 1, 2), [0, 1, 5], .9, "positive")
+    store.append("AAPL", date(2024, 1, 3), [4, 1, 0], .8, "negative")
+    store.append("AAPL", date(2024, 1, 5), [0, 3, 0], .7, "neutral")
+
+    series = store.read("AAPL", date(2024, 1, 3), date(2024, 1, 5))
+    assert list(series.days) == list(np.array(["2024-01-03", "2024-01-05"], dtype="datetime64[D]"))
+    assert series.labels() == ["negative", "neutral"]
+    assert series.logits.tolist() == [[4, 1, 0], [0, 3, 0]]
+    assert len(store.read("AAPL", date(2024, 1, 6))) == 0
+    assert len(store.read("MSFT")) == 0
+    assert store.symbols() == ["AAPL"]
+
+
+def test_rewriting_days(tmp_path):
+    store = SentimentStore(str(tmp_path))
+    store.append("AAPL", date(2024, 1, 2), [0, 1, 5], .9, "positive")
+    store.append("AAPL", date(2024, 1, 3), [0, 1, 5], .9, "positive")
+
+    # Scenario 1: The last day is overwritten in place as more news comes in
+    store.append("AAPL", date(2024, 1, 3), [6, 1, 0], .95, "negative")
+    assert store.read("AAPL").labels() == ["positive", "negative"]
+
+    # Scenario 2: Earlier days are merged in, replacing the ones already stored
+    store.put("AAPL", ["2024-01-01", "2024-01-02"], [[0, 5, 0], [5, 0, 0]], [.9, .9], [1, 0])
+    series = store.read("AAPL")
+    assert [str(day) for day in series.days] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert series.labels() == ["neutral", "negative", "negative"]
+
+    # Scenario 3: A rewrite interrupted before its files were swapped in is not listed as a symbol
+    os.makedirs(os.path.join(str(tmp_path), ".staging", "MSFT"))
+    assert store.symbols() == ["AAPL"]
+
+
+def test_an_interrupted_append_is_ignored(tmp_path):
+    store = SentimentStore(str(tmp_path))
+    store.append("AAPL", date(2024, 1, 2), [0, 1, 5], .9, "positive")
+    # Only the days column of the next row made it to disk
+    with open(os.path.join(str(tmp_path), "AAPL", "days.bin"), "ab") as f:
+        f.write(np.int32(19725).tobytes())
+
+    reopened = SentimentStore(str(tmp_path))
+    assert len(reopened.read("AAPL")) == 1
+    reopened.append("AAPL", date(2024, 1, 4), [0, 1, 5], .9, "positive")
+    assert [str(day) for day in reopened.read("AAPL").days] == ["2024-01-02", "2024-01-04"]
+
+
+def append_days(root, days):
+    store = SentimentStore(root)
+    for day in days:
+        store.append("AAPL", day, [0, 1, 5], .9, "positive")
+
+
+def test_concurrent_writers_and_readers_across_processes(tmp_path):
+    # Scenario 1: Workers appending to the same symbol keep its days sorted and unique
+    days = [np.datetime64("2024-01-01") + i for i in range(40)]
+    context = multiprocessing.get_context("spawn")
+    writers = [context.Process(target=append_days, args=(str(tmp_path), days[i::4])) for i in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(60)
+    assert all(writer.exitcode == 0 for writer in writers)
+    reader = SentimentStore(str(tmp_path))
+    assert list(reader.read("AAPL").days) == days
+
+    # Scenario 2: A reader sees the days written by another process after its first read
+    append_days(str(tmp_path), [days[-1] + 1])
+    assert len(reader.read("AAPL")) == 41
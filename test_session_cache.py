@@ -0,0 +1,42 @@
+from session_cache import SessionCache
+
+
+def test_views_are_cached_until_invalidated():
+    calls = []
+
+    def fetch(chat_id):
+        calls.append(chat_id)
+        return {"status": 200, "session_alive": len(calls) > 1} if chat_id != 2 else None
+
+    cache = SessionCache(fetch, ttl=60)
+
+    # Scenario 1: Repeated lookups, including users without credentials, hit the cache
+    assert cache.get(1)["session_alive"] is False
+    assert cache.get(1)["session_alive"] is False
+    assert cache.get(2) is None and cache.get(2) is None
+    assert calls == [1, 2]
+
+    # Scenario 2: An announced change, keyed by the string chat ID, forces a refetch
+    cache.invalidate("1")
+    assert cache.get(1)["session_alive"] is True
+    assert calls == [1, 2, 1]
+
+    # Scenario 3: A change announced while a fetch is in flight is not overwritten by it
+    def racing_fetch(chat_id):
+        cache.invalidate(chat_id)
+        return {"status": 200, "session_alive": False}
+
+    cache.fetch = racing_fetch
+    cache.invalidate(1)
+    cache.get(1)
+    cache.fetch = fetch
+    assert cache.get(1)["session_alive"] is True
+    assert cache.stats()["hits"] == 2
+
+
+def test_views_expire_after_the_ttl():
+    calls = []
+    cache = SessionCache(lambda chat_id: calls.append(chat_id), ttl=0)
+    cache.get(1)
+    cache.get(1)
+    assert calls == [1, 1]
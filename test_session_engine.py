@@ -0,0 +1,32 @@
+from unittest.mock import MagicMock
+
+from session_engine import SessionEngine
+
+
+def launch(chat_id, credentials, parameters):
+    strategy = MagicMock(trade_counter=0)
+    return MagicMock(), strategy, MagicMock()
+
+
+def test_sessions_are_isolated():
+    engine = SessionEngine(launch)
+    first = engine.start("1", {"API_KEY": "key1", "API_SECRET": "secret1", "PAPER": True}, {"symbol": "AAPL"})
+    second = engine.start("2", {"API_KEY": "key2", "API_SECRET": "secret2", "PAPER": True}, {"symbol": "TSLA"})
+    assert len(engine) == 2
+    assert engine.get("1").credentials["API_KEY"] == "key1"
+
+    # Scenario 1: Stopping one session leaves the other one running
+    second.strategy.trade_counter = 3
+    stopped = engine.stop("2")
+    assert stopped is second and stopped.trade_counter == 3
+    second.trader.stop_all.assert_called_once()
+    first.trader.stop_all.assert_not_called()
+    assert "1" in engine and "2" not in engine
+
+    # Scenario 2: Restarting a chat ID replaces only its own session
+    replacement = engine.start("1", first.credentials, {"symbol": "MSFT"})
+    first.trader.stop_all.assert_called_once()
+    assert engine.get("1") is replacement
+
+    # Scenario 3: Stopping an unknown chat ID
+    assert engine.stop("3") is None
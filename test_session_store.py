@@ -0,0 +1,43 @@
+import asyncio
+
+import fakeredis
+
+from session_store import SessionRecord, SessionStore
+
+
+def test_session_store_round_trip():
+    async def scenario():
+        store = SessionStore(fakeredis.FakeAsyncRedis(decode_responses=True))
+        await store.save(SessionRecord(chat_id="1", api_key="key", api_secret="secret"))
+        await store.update("1", session_alive=True, ticker="AAPL", amount_to_spend="1000")
+
+        record = await store.get("1")
+        assert record.session_alive is True and record.ticker == "AAPL" and record.end_time is None
+
+        await store.clear_session("1")
+        records = await store.get_many(["1", "2"])
+        assert records["1"] == SessionRecord(chat_id="1", api_key="key", api_secret="secret")
+        assert records["2"] is None
+
+        # Legacy records mix raw strings, bare numbers and JSON
+        await store.redis.hset("3", mapping={"api_key": "raw", "api_secret": "raw", "session_alive": "true",
+                                             "ticker": "TSLA", "end_time": "2024-03-21 15:30:00", "amount_to_spend": "250"})
+        legacy = await store.get("3")
+        assert legacy.session_alive is True and legacy.ticker == "TSLA" and legacy.amount_to_spend == "250"
+
+    asyncio.run(scenario())
+
+
+def test_writes_announce_the_changed_chat_id():
+    async def scenario():
+        store = SessionStore(fakeredis.FakeAsyncRedis(decode_responses=True))
+        pubsub = store.redis.pubsub()
+        await pubsub.subscribe("session_events")
+        await pubsub.get_message(timeout=1)
+
+        await store.save(SessionRecord(chat_id="1", api_key="key", api_secret="secret"))
+        await store.clear_session("1")
+        messages = [await pubsub.get_message(timeout=1) for _ in range(2)]
+        assert [message["data"] for message in messages] == ["1", "1"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import TimeoutError
+from unittest.mock import MagicMock
+
+import pytest
+
+from metrics import stats as metric_stats
+from session_supervisor import HashRing, SessionSupervisor
+from tracing import tracer
+
+# Registered in the workers too, as they import this module to run `launch`.
+launched = []
+metric_stats.add("test_launches", lambda: {"sessions": len(launched)}, sessions=True)
+
+
+def launch(chat_id, credentials, parameters):
+    if parameters["symbol"] == "CRASH":
+        os._exit(1)
+    if parameters["symbol"] == "SLOW":
+        time.sleep(2)
+    with tracer.span("launch", key=chat_id, symbol=parameters["symbol"]):
+        launched.append(chat_id)
+    return MagicMock(), MagicMock(trade_counter=len(parameters["symbol"])), MagicMock()
+
+
+def test_hash_ring_is_balanced_and_stable():
+    keys = [str(chat_id) for chat_id in range(5000)]
+    ring = HashRing(range(4))
+    load = Counter(ring.node(key) for key in keys)
+    assert min(load.values()) > 5000 / 4 * 0.7
+
+    grown = HashRing(range(5))
+    moved = [key for key in keys if ring.node(key) != grown.node(key)]
+    assert all(grown.node(key) == 4 for key in moved)
+    assert len(moved) < 5000 / 5 * 1.5
+
+
+def test_supervisor_routes_sessions_to_workers():
+    supervisor = SessionSupervisor(2, launch, timeout=30)
+    try:
+        supervisor.start("1", {"API_KEY": "key"}, {"symbol": "AAPL"})
+        supervisor.start("2", {"API_KEY": "key"}, {"symbol": "TSLA"})
+        assert "1" in supervisor and len(supervisor) == 2
+
+        stopped = supervisor.stop("1")
+        assert stopped.trade_counter == 4
+        assert stopped.worker == supervisor.ring.node("1")
+        assert supervisor.stop("1") is None
+        assert supervisor.chat_ids() == ["2"]
+    finally:
+        supervisor.shutdown()
+
+
+def test_supervisor_does_not_wait_on_a_dead_or_slow_worker():
+    supervisor = SessionSupervisor(1, launch, timeout=30)
+    try:
+        # Scenario 1: The worker dies mid-command: the call fails without waiting for the timeout
+        supervisor.start("1", {"API_KEY": "key"}, {"symbol": "AAPL"})
+        started = time.monotonic()
+        with pytest.raises(RuntimeError):
+            supervisor.start("2", {"API_KEY": "key"}, {"symbol": "CRASH"})
+        assert time.monotonic() - started < 10
+        assert supervisor._pending == {} and len(supervisor) == 0
+
+        # Scenario 2: The next command restarts the worker
+        supervisor.start("3", {"API_KEY": "key"}, {"symbol": "MSFT"})
+        assert supervisor.chat_ids() == ["3"]
+
+        # Scenario 3: A command that times out is not left pending
+        supervisor.timeout = .5
+        with pytest.raises(TimeoutError):
+            supervisor.start("4", {"API_KEY": "key"}, {"symbol": "SLOW"})
+        assert supervisor._pending == {}
+        supervisor.timeout = 30
+    finally:
+        supervisor.shutdown()
+
+
+def test_supervisor_serves_the_traces_profiles_and_stats_of_its_workers():
+    supervisor = SessionSupervisor(2, launch, timeout=30)
+    try:
+        supervisor.start("1", {"API_KEY": "key"}, {"symbol": "AAPL"})
+
+        # Scenario 1: The spans recorded in the worker are read from the API process
+        assert [span["name"] for span in supervisor.trace("1")] == ["launch"]
+        assert supervisor.trace("1", chrome=True)["traceEvents"][0]["args"] == {"symbol": "AAPL"}
+
+        # Scenario 2: Every worker is profiled, under a root frame of its own
+        profile = supervisor.profile(.2, .01)
+        assert {child["name"] for child in profile["flame_graph"]["children"]} == {"session-worker-0", "session-worker-1"}
+        assert profile["samples"] > 0
+
+        # Scenario 3: The stats of the components running along the sessions are read per worker
+        stats = supervisor.stats()
+        assert len(stats) == 2
+        assert sum(worker["test_launches"]["sessions"] for worker in stats) == 1
+
+        # Scenario 4: The trace is dropped with the session
+        supervisor.stop("1")
+        assert supervisor.trace("1") == []
+    finally:
+        supervisor.shutdown()
@@ -0,0 +1,25 @@
+from signals import basket_signals, parse_basket, trading_signal
+
+
+def test_parse_basket():
+    assert parse_basket("AAPL") == ["AAPL"]
+    assert parse_basket(" aapl, MSFT,,aapl ") == ["AAPL", "MSFT"]
+
+
+def test_basket_of_one_trades_like_a_single_symbol():
+    for sentiment, last_trade in [("positive", None), ("negative", "buy"), ("neutral", "sell")]:
+        close_first, side = trading_signal(sentiment, .95, last_trade, 1000, 100, 5000)
+        expected = [("AAPL", close_first, side, 10)] if side else []
+        assert basket_signals({"AAPL": (.95, sentiment)}, {"AAPL": 100}, {"AAPL": last_trade}, 1000, 5000) == expected
+
+
+def test_basket_shares_its_budget():
+    sentiments = {"AAPL": (.92, "positive"), "MSFT": (.99, "negative"), "GOOG": (.97, "positive"), "TSLA": (.5, "positive")}
+    prices = {"AAPL": 100, "MSFT": 300, "GOOG": 150, "TSLA": 200}
+
+    # Scenario 1: Each symbol may spend a quarter of the budget, the most confident first
+    orders = basket_signals(sentiments, prices, {"MSFT": "buy"}, 2400, 10000)
+    assert orders == [("MSFT", True, "sell", 2), ("GOOG", False, "buy", 4), ("AAPL", False, "buy", 6)]
+
+    # Scenario 2: Orders stop once the cash runs out
+    assert basket_signals(sentiments, prices, {}, 2400, 1000) == [("MSFT", False, "sell", 2)]
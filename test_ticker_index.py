@@ -0,0 +1,29 @@
+from ticker_index import TickerIndex
+
+
+def test_lookup_uses_the_loaded_symbols():
+    index = TickerIndex(lambda: ["AAPL", "BRK.B"], path=None)
+
+    # Scenario 1: Nothing loaded yet, the index cannot decide
+    assert index.lookup("AAPL") is None
+
+    # Scenario 2: Known and unknown symbols, in either notation
+    assert index.refresh()
+    assert index.lookup("aapl") is True
+    assert index.lookup("BRK-B") is True
+    assert index.lookup("INVALID") is False
+    assert index.stats()["undecided"] == 1
+
+
+def test_snapshot_survives_restarts_and_failed_refreshes(tmp_path):
+    path = str(tmp_path / "tickers.json")
+    TickerIndex(lambda: ["AAPL", "MSFT"], path=path).refresh()
+
+    def unreachable():
+        raise ConnectionError("Alpaca is unreachable")
+
+    index = TickerIndex(unreachable, path=path)
+    assert index.load_snapshot()
+    assert not index.refresh()
+    assert index.lookup("MSFT") is True
+    assert index.stats()["refresh_errors"] == 1
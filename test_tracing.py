@@ -0,0 +1,61 @@
+import threading
+
+from tracing import SamplingProfiler, Tracer, flame_graph
+
+
+def test_nested_spans_per_session():
+    tracer = Tracer(capacity=4)
+
+    # Scenario 1: Spans nest under the trace opened on the thread
+    with tracer.span("iteration", key="chat-1", trigger="timer"):
+        with tracer.span("sentiment"):
+            with tracer.span("get_news"):
+                pass
+        with tracer.span("decide"):
+            pass
+    spans = tracer.spans("chat-1")
+    assert [(span["name"], span["depth"]) for span in spans] == [("iteration", 0), ("sentiment", 1), ("get_news", 2), ("decide", 1)]
+    assert spans[0]["args"] == {"trigger": "timer"}
+    assert spans[0]["duration_ns"] >= spans[1]["duration_ns"] >= spans[2]["duration_ns"]
+
+    # Scenario 2: Spans outside of a trace are not recorded
+    with tracer.span("get_news"):
+        pass
+    assert tracer.stats() == {"sessions": 1, "spans": 4}
+
+    # Scenario 3: Only the latest spans of a session are kept
+    with tracer.span("iteration", key="chat-1"):
+        pass
+    assert len(tracer.spans("chat-1")) == 4 and tracer.spans("chat-1")[-1]["name"] == "iteration"
+
+    # Scenario 4: Chrome trace events are complete events in microseconds
+    event = tracer.chrome_trace("chat-1")["traceEvents"][0]
+    assert event["ph"] == "X" and event["ts"] == tracer.spans("chat-1")[0]["start_ns"] / 1000
+
+
+def test_profiler_samples_other_threads():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_loop)
+    thread.start()
+    profiler = SamplingProfiler()
+    try:
+        result = profiler.profile(.2, interval=.005)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert result["samples"] > 10
+    assert any("busy_loop" in stack for stack in result["folded"])
+    assert result["flame_graph"]["value"] == sum(result["folded"].values())
+
+
+def test_flame_graph_merges_common_frames():
+    tree = flame_graph({"main;iterate;get_news": 3, "main;iterate;submit_order": 1})
+    assert tree["value"] == 4
+    iterate = tree["children"][0]["children"][0]
+    assert iterate["name"] == "iterate" and [(c["name"], c["value"]) for c in iterate["children"]] == [("get_news", 3), ("submit_order", 1)]
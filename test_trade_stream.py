@@ -0,0 +1,81 @@
+import asyncio
+
+import fakeredis
+
+from trade_events import RecapEvent, TradeEvent, publish
+from trade_stream import TradeStreamConsumer
+
+
+async def make_consumer(redis, name, outbox, **kwargs):
+    async def send(chat_id, text):
+        outbox.append((name, chat_id, text))
+
+    consumer = TradeStreamConsumer(redis, send, consumer=name, block_ms=None, **kwargs)
+    await consumer.ensure_group()
+    return consumer
+
+
+async def poll(consumer):
+    count = await consumer.poll()
+    await consumer.drain()
+    return count
+
+
+def test_replicas_share_the_stream_and_render_events():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        outbox = []
+        first = await make_consumer(redis, "first", outbox, batch_size=2)
+        second = await make_consumer(redis, "second", outbox, batch_size=2)
+
+        await publish(redis, TradeEvent(chat_id="1", session_id="s1", side="buy", qty=3, symbol="AAPL", price=187.5))
+        await publish(redis, TradeEvent(chat_id="1", session_id="s1", side="sell", symbol="AAPL", price=190.0))
+        await publish(redis, TradeEvent(chat_id="2", session_id="s2", side="sell", qty=4, symbol="SPY", price=500.0))
+        await publish(redis, RecapEvent(chat_id="2", trades=1, cash_value="900", portfolio_value="1100"))
+
+        assert await poll(first) == 2
+        assert await poll(second) == 2
+        assert await poll(first) == 0 and await poll(second) == 0
+        assert [(name, chat_id) for name, chat_id, _ in outbox] == [("first", "1"), ("first", "1"), ("second", "2"), ("second", "2")]
+        assert [text for _, _, text in outbox] == [
+            "BUY 3 shares of AAPL at 187.5$ 💸",
+            "SELL all shares of AAPL at 190.0$ 💰",
+            "SELL 4 shares of SPY at 500.0$ 💰",
+            "📊📊 RECAP 📊📊\nTotal trades made: 1\nCash Value: 900$\nPortfolio Value: 1100$",
+        ]
+        assert (await redis.xpending("trade_events", "notifiers"))["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_pending_entries_survive_restarts_without_duplicates():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        outbox = []
+        for qty in (1, 2, 3):
+            await publish(redis, TradeEvent(chat_id="1", session_id="s1", side="buy", qty=qty, symbol="AAPL", price=1.0))
+
+        # Scenario 1: A replica reads a batch and dies before acknowledging it, after sending the first entry
+        crashed = await make_consumer(redis, "crashed", outbox)
+        entries = await crashed._read(">")
+        await redis.set(f"trade_events:notifiers:sent:{entries[0][0]}", 1)
+
+        # Scenario 2: It restarts and resumes its own pending entries, skipping the one already sent
+        restarted = await make_consumer(redis, "crashed", outbox)
+        assert await poll(restarted) == 3
+        assert [text for _, _, text in outbox] == ["BUY 2 shares of AAPL at 1.0$ 💸", "BUY 3 shares of AAPL at 1.0$ 💸"]
+        assert restarted.stats()["duplicates"] == 1
+
+        # Scenario 3: A failed send stays pending and is claimed by another replica
+        async def fail(chat_id, text):
+            raise ConnectionError("Telegram is unreachable")
+
+        await publish(redis, TradeEvent(chat_id="1", session_id="s1", side="buy", qty=4, symbol="AAPL", price=1.0))
+        failing = TradeStreamConsumer(redis, fail, consumer="failing", block_ms=None)
+        assert await poll(failing) == 1 and failing.stats()["failures"] == 1
+        healthy = await make_consumer(redis, "healthy", outbox, claim_idle_ms=0)
+        assert await poll(healthy) == 1
+        assert outbox[-1] == ("healthy", "1", "BUY 4 shares of AAPL at 1.0$ 💸")
+        assert (await redis.xpending("trade_events", "notifiers"))["pending"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import requests
+
+from webhook import ChatOrderedPool, WebhookServer, chat_key
+
+
+def message(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": str(update_id),
+                                                "chat": {"id": chat_id, "type": "private"}}}
+
+
+def test_pool_keeps_chat_order_and_runs_chats_in_parallel():
+    handled = []
+    lock = threading.Lock()
+
+    def handle(chat_id, index):
+        time.sleep(0.02)
+        with lock:
+            handled.append((chat_id, index))
+
+    pool = ChatOrderedPool(workers=4)
+    started = time.monotonic()
+    for index in range(5):
+        for chat_id in range(4):
+            assert pool.submit(chat_id, handle, chat_id, index)
+    assert pool.join(timeout=5)
+    elapsed = time.monotonic() - started
+
+    for chat_id in range(4):
+        assert [index for chat, index in handled if chat == chat_id] == list(range(5))
+    # 20 updates of 20 ms each, four chats at a time.
+    assert elapsed < 0.3
+    assert pool.stats() == {"pending": 0, "chats": 0, "completed": 20, "errors": 0}
+
+
+def test_webhook_endpoint_queues_updates():
+    received = []
+    release = threading.Event()
+
+    def on_update(update):
+        release.wait(5)
+        received.append(update["update_id"])
+
+    pool = ChatOrderedPool(workers=1, max_pending=2)
+    server = WebhookServer(on_update, pool, host="127.0.0.1", port=0, secret="s3cret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+
+    # Scenario 1: Wrong secret or path
+    assert requests.post(url, json=message(1, 7)).status_code == 403
+    assert requests.post(url + "/other", json=message(1, 7), headers=headers).status_code == 404
+
+    # Scenario 2: Updates are acknowledged once queued, and refused when the pool is full
+    assert [requests.post(url, json=message(i, 7), headers=headers).status_code for i in range(1, 4)] == [200, 200, 503]
+    release.set()
+    assert pool.join(timeout=5)
+    assert received == [1, 2]
+    server.shutdown()
+
+    assert chat_key({"callback_query": {"from": {"id": 3}, "message": {"chat": {"id": 9}}}}) == 9
+    assert chat_key({"inline_query": {"from": {"id": 3}}}) == 3